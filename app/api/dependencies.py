@@ -0,0 +1,17 @@
+from typing import Optional
+import hmac
+
+from fastapi import Header, HTTPException
+
+from app.config import settings
+
+def require_admin_key(x_admin_key: Optional[str] = Header(default=None)):
+    """
+    Chỉ cho phép request có header X-Admin-Key đúng với settings.admin_api_key
+
+    Chưa cấu hình admin_api_key thì mọi endpoint admin đều bị khóa.
+    """
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=503, detail="Admin API chưa được cấu hình (ADMIN_API_KEY)")
+    if not x_admin_key or not hmac.compare_digest(x_admin_key.encode(), settings.admin_api_key.encode()):
+        raise HTTPException(status_code=401, detail="Thiếu hoặc sai admin key")
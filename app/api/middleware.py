@@ -0,0 +1,111 @@
+import math
+import logging
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.services.admission import AdmissionController
+from app.services.profiling import SamplingProfiler, profile_session_var
+from app.utils.logging import request_id_var
+
+logger = logging.getLogger(__name__)
+
+_REJECT_DETAILS = {
+    "rate_limited": "Quá nhiều yêu cầu, vui lòng thử lại sau",
+    "queue_full": "Hệ thống đang quá tải, vui lòng thử lại sau",
+    "queue_timeout": "Hệ thống đang quá tải, vui lòng thử lại sau"
+}
+
+class AdmissionMiddleware:
+    """
+    Admission control trước khi request tới route
+
+    ASGI middleware thuần (không qua BaseHTTPMiddleware) để slot được giữ tới khi
+    response gửi xong, kể cả StreamingResponse và BackgroundTasks chạy sau response
+    (crawl của /scraping/scrape-website). Request bị từ chối nhận 429 với
+    Retry-After mà không chạm tới threadpool của route.
+    """
+
+    def __init__(self, app: ASGIApp, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.controller.classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        client = self.controller.client_key(headers, scope["client"][0] if scope.get("client") else None)
+
+        wait = await self.controller.check_rate(route_class, client)
+        if wait > 0:
+            await self._reject(scope, receive, send, route_class.name, "rate_limited", wait)
+            return
+
+        rejected = await self.controller.acquire(route_class)
+        if rejected:
+            await self._reject(scope, receive, send, route_class.name, rejected, 1.0)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class)
+
+    async def _reject(self, scope: Scope, receive: Receive, send: Send, route_class: str, reason: str, wait: float):
+        logger.debug("Rejected %s %s (%s): %s", scope["method"], scope["path"], route_class, reason)
+        response = JSONResponse(
+            {"detail": _REJECT_DETAILS[reason]},
+            status_code=429,
+            headers={"Retry-After": str(max(1, math.ceil(wait)))}
+        )
+        await response(scope, receive, send)
+
+class ProfilingMiddleware:
+    """
+    Mở profile session cho request khi profiling đang bật
+
+    Thời gian request tính tới khi gửi xong body của response, không gồm
+    BackgroundTasks chạy sau đó (crawl của /scraping/scrape-website). Được thêm vào
+    app đầu tiên để nằm trong cùng: thời gian chờ slot của admission không bị tính.
+    """
+
+    def __init__(self, app: ASGIApp, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not self.profiler.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        session = self.profiler.start(scope["method"], scope["path"], request_id_var.get())
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+        finished = False
+
+        async def send_wrapper(message):
+            nonlocal status, finished
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False) and not finished:
+                finished = True
+                self.profiler.finish(session, status)
+
+        token = profile_session_var.set(session)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile_session_var.reset(token)
+            if not finished:
+                self.profiler.finish(session, status or 500)
@@ -0,0 +1,379 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+from sqlalchemy.orm import Session
+from sqlalchemy import text
+from datetime import datetime, timedelta
+from typing import Optional
+from uuid import UUID
+import logging
+
+from app.api.dependencies import require_admin_key
+from app.models.database import get_db
+from app.models.schemas import (
+    BulkDeleteRequest, MaintenanceJobResponse, EmbeddingVersionCreate, FaqBuildRequest, CollectionCreate,
+    ProfilingUpdate
+)
+from app.services.admission import admission_controller
+from app.services.collection_registry import DEFAULT_COLLECTION, collection_registry, collection_service
+from app.services.embedding_versions import embedding_registry, reembedding_service, shadow_stats
+from app.services.faq import faq_index
+from app.services.maintenance import maintenance_runner
+from app.services.partitions import partition_manager
+from app.services.profiling import ProfiledRoute, profiler
+from app.utils.helpers import ingest_epoch
+
+# Mọi endpoint admin yêu cầu header X-Admin-Key
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin_key)], route_class=ProfiledRoute)
+logger = logging.getLogger(__name__)
+
+@router.post("/documents/bulk-delete", response_model=MaintenanceJobResponse)
+def bulk_delete_documents(request: BulkDeleteRequest):
+    """
+    Xóa hàng loạt documents theo domain, URL prefix hoặc tuổi (chạy nền theo batch)
+    
+    Args:
+        request: Điều kiện xóa và tùy chọn bảo trì sau khi xóa
+        
+    Returns:
+        MaintenanceJobResponse: Job để theo dõi tiến độ
+    """
+    if not (request.domain or request.url_prefix or request.older_than_days or request.collection):
+        raise HTTPException(
+            status_code=400,
+            detail="Cần ít nhất một điều kiện: domain, url_prefix, older_than_days hoặc collection"
+        )
+    if request.batch_size <= 0 or (request.older_than_days is not None and request.older_than_days < 0):
+        raise HTTPException(status_code=400, detail="batch_size và older_than_days không hợp lệ")
+    
+    try:
+        created_before = None
+        if request.older_than_days is not None:
+            created_before = datetime.utcnow() - timedelta(days=request.older_than_days)
+        
+        job = maintenance_runner.submit_bulk_delete(
+            domain=request.domain,
+            url_prefix=request.url_prefix,
+            created_before=created_before,
+            batch_size=request.batch_size,
+            vacuum=request.vacuum,
+            reindex=request.reindex,
+            collection=request.collection
+        )
+        return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+        
+    except Exception as e:
+        logger.error(f"Error submitting bulk delete: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi tạo job xóa hàng loạt")
+
+@router.post("/maintenance/vacuum", response_model=MaintenanceJobResponse)
+def vacuum_tables():
+    """VACUUM (ANALYZE) bảng chunks và documents"""
+    job = maintenance_runner.submit_vacuum()
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.post("/maintenance/reindex", response_model=MaintenanceJobResponse)
+def reindex_vector_indexes():
+    """REINDEX CONCURRENTLY các index ANN (ivfflat/HNSW) của bảng chunks"""
+    job = maintenance_runner.submit_reindex()
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.post("/maintenance/compact-text", response_model=MaintenanceJobResponse)
+def compact_chunk_text(batch_size: int = 1000, vacuum: bool = True):
+    """Chuyển text inline của chunks cũ sang offset trong documents.content, sau đó VACUUM chunks"""
+    if batch_size <= 0:
+        raise HTTPException(status_code=400, detail="batch_size không hợp lệ")
+    
+    job = maintenance_runner.submit_compact_text(batch_size=batch_size, vacuum=vacuum)
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.get("/partitions")
+def list_partitions():
+    """Các partition theo tháng ingest của chunks, kèm số row ước lượng và kích thước"""
+    try:
+        return partition_manager.list_partitions()
+    except Exception as e:
+        logger.error(f"Error listing partitions: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi lấy danh sách partition")
+
+@router.delete("/partitions/{epoch}", response_model=MaintenanceJobResponse)
+def drop_partition(epoch: int):
+    """
+    Xóa toàn bộ dữ liệu ingest trong một tháng (epoch YYYYMM, 0 cho dữ liệu trước khi chia partition)
+    
+    Partition chunks được DETACH + DROP thay vì xóa từng row.
+    """
+    if epoch == ingest_epoch():
+        raise HTTPException(status_code=400, detail="Không thể xóa partition của tháng đang ingest")
+    
+    job = maintenance_runner.submit_drop_epoch(epoch)
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.get("/admission")
+async def admission_stats():
+    """Slot đang dùng, hàng đợi và số request bị từ chối của từng nhóm route (worker hiện tại)"""
+    return admission_controller.get_stats()
+
+@router.get("/profiling")
+async def profiling_stats():
+    """Cấu hình và thống kê sampling profiler (worker hiện tại)"""
+    return profiler.get_stats()
+
+@router.post("/profiling")
+async def configure_profiling(request: ProfilingUpdate):
+    """
+    Bật/tắt profiling, đổi tỉ lệ lấy mẫu hoặc ngưỡng request chậm mà không cần deploy lại
+    
+    Chỉ áp dụng cho worker nhận request; khởi động lại process thì quay về cấu hình trong settings.
+    """
+    if request.sample_rate is not None and not 0 <= request.sample_rate <= 1:
+        raise HTTPException(status_code=400, detail="sample_rate phải nằm trong khoảng 0..1")
+    if request.slow_ms is not None and request.slow_ms <= 0:
+        raise HTTPException(status_code=400, detail="slow_ms phải lớn hơn 0")
+    
+    profiler.configure(enabled=request.enabled, sample_rate=request.sample_rate, slow_ms=request.slow_ms)
+    return profiler.get_stats()
+
+@router.get("/profiles")
+def list_profiles(limit: int = 50, kind: Optional[str] = None):
+    """Các capture mới nhất (kind: "sampled" hoặc "slow")"""
+    try:
+        return {"captures": profiler.list_captures(limit=limit, kind=kind)}
+        
+    except Exception as e:
+        logger.error(f"Error listing profile captures: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi lấy danh sách profile")
+
+@router.get("/profiles/{capture_id}")
+def get_profile(capture_id: str):
+    """Chi tiết một capture: bảng hàm self/total, SQL lâu nhất và EXPLAIN"""
+    capture = profiler.get_capture(capture_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    
+    return capture
+
+@router.get("/profiles/{capture_id}/folded")
+def download_profile_stacks(capture_id: str):
+    """Tải stack gộp (folded) của capture, đầu vào cho flamegraph.pl hoặc speedscope"""
+    path = profiler.capture_path(capture_id, ".folded")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy profile")
+    
+    return FileResponse(path, media_type="text/plain", filename=f"{capture_id}.folded")
+
+@router.get("/jobs")
+def list_jobs():
+    """Danh sách các job bảo trì của process"""
+    return maintenance_runner.list_jobs()
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Trạng thái và tiến độ của một job bảo trì"""
+    job = maintenance_runner.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy job")
+    
+    return job
+
+@router.get("/embedding-versions")
+def list_embedding_versions(db: Session = Depends(get_db)):
+    """Các phiên bản embedding, tiến độ backfill và thống kê shadow query"""
+    try:
+        rows = db.execute(text(
+            "SELECT name, model, dimension, status, backfilled, created_at, activated_at "
+            "FROM embedding_versions ORDER BY created_at"
+        )).mappings().all()
+        
+        return {
+            "active": embedding_registry.active().name,
+            "versions": [dict(row) for row in rows],
+            "shadow": shadow_stats.to_dict()
+        }
+        
+    except Exception as e:
+        logger.error(f"Error listing embedding versions: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi lấy danh sách phiên bản embedding")
+
+@router.post("/embedding-versions", response_model=MaintenanceJobResponse)
+def create_embedding_version(request: EmbeddingVersionCreate, db: Session = Depends(get_db)):
+    """
+    Tạo phiên bản embedding mới và chạy nền job re-embed từ text đã lưu
+    
+    Search vẫn dùng phiên bản active cho đến khi gọi activate.
+    """
+    try:
+        reembedding_service.create_version(db, request.name, request.model, request.dimension)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating embedding version: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi tạo phiên bản embedding")
+    
+    job = maintenance_runner.submit_reembed(request.name)
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.post("/embedding-versions/{name}/evaluate")
+def evaluate_embedding_version(name: str, samples: int = 100, k: int = 10, db: Session = Depends(get_db)):
+    """So recall@k của phiên bản active và phiên bản name"""
+    try:
+        return reembedding_service.evaluate(db, name, samples=samples, k=k)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error evaluating embedding version: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi đánh giá phiên bản embedding")
+
+@router.post("/embedding-versions/{name}/activate")
+def activate_embedding_version(name: str, db: Session = Depends(get_db)):
+    """Cutover search sang phiên bản name (phiên bản cũ chuyển sang ready để rollback)"""
+    try:
+        reembedding_service.activate(db, name)
+        return {"message": f"Đã chuyển sang phiên bản {name}"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error activating embedding version: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi chuyển phiên bản embedding")
+
+@router.post("/embedding-versions/{name}/retire")
+def retire_embedding_version(name: str, db: Session = Depends(get_db)):
+    """Ngừng ghi phiên bản name khi ingest"""
+    try:
+        reembedding_service.retire(db, name)
+        return {"message": f"Đã ngừng phiên bản {name}"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error retiring embedding version: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi ngừng phiên bản embedding")
+
+@router.get("/collections")
+def list_collections(db: Session = Depends(get_db)):
+    """Các collection, cấu hình, phiên bản embedding dùng để search và số documents"""
+    try:
+        counts = {
+            row.collection: row.documents
+            for row in db.execute(text("SELECT collection, COUNT(*) AS documents FROM documents GROUP BY collection"))
+        }
+        collections = []
+        for collection in collection_registry.list():
+            collections.append({
+                **collection.to_dict(),
+                "documents": counts.get(collection.name, 0),
+                "search_version": collection.embedding_version or embedding_registry.active().name
+            })
+        return collections
+        
+    except Exception as e:
+        logger.error(f"Error listing collections: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi lấy danh sách collection")
+
+@router.post("/collections", response_model=MaintenanceJobResponse)
+def create_collection(request: CollectionCreate, db: Session = Depends(get_db)):
+    """
+    Tạo collection mới và chạy nền job build index ANN riêng (partial index) của nó
+    
+    Sau đó crawl nguồn của collection bằng POST /scraping/collections/{name}/crawl.
+    """
+    try:
+        collection = collection_service.create(
+            db,
+            request.name,
+            description=request.description,
+            prompt_tenant=request.prompt_tenant,
+            embedding_version=request.embedding_version,
+            chunk_size=request.chunk_size,
+            chunk_overlap=request.chunk_overlap,
+            chunking_mode=request.chunking_mode,
+            sources=[source.model_dump(mode="json") for source in request.sources]
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error creating collection: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi tạo collection")
+    
+    job = maintenance_runner.submit_collection_index(collection.name)
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.post("/collections/{name}/reindex", response_model=MaintenanceJobResponse)
+def reindex_collection(name: str, rebuild: bool = True):
+    """
+    Build (hoặc REINDEX CONCURRENTLY khi rebuild) index ANN của một collection
+    
+    Chỉ chạm tới partial index của collection này; collection khác không bị ảnh hưởng.
+    Với collection default, lần đầu gọi sẽ build index riêng thay cho index ANN toàn bảng.
+    """
+    if collection_registry.get(name) is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {name}")
+    
+    job = maintenance_runner.submit_collection_index(name, rebuild=rebuild)
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.delete("/collections/{name}", response_model=MaintenanceJobResponse)
+def delete_collection(name: str):
+    """Xóa documents, index ANN và cấu hình của một collection (chạy nền theo batch)"""
+    if name == DEFAULT_COLLECTION:
+        raise HTTPException(status_code=400, detail="Không thể xóa collection default")
+    if collection_registry.get(name) is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {name}")
+    
+    job = maintenance_runner.submit_collection_delete(name)
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.get("/faq")
+def list_faq_entries(status: Optional[str] = None, db: Session = Depends(get_db)):
+    """Các câu trả lời FAQ dựng sẵn (lọc theo status) và thống kê fast path"""
+    try:
+        query = "SELECT id, question, status, cluster_size, threshold, answer, embedding_version, " \
+                "jsonb_array_length(sources) AS source_count, checked_at, updated_at FROM faq_entries"
+        params = {}
+        if status:
+            query += " WHERE status = :status"
+            params["status"] = status
+        rows = db.execute(text(query + " ORDER BY cluster_size DESC"), params).mappings().all()
+        
+        return {"entries": [dict(row) for row in rows], "stats": faq_index.get_stats()}
+        
+    except Exception as e:
+        logger.error(f"Error listing FAQ entries: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi lấy danh sách FAQ")
+
+@router.post("/faq/build", response_model=MaintenanceJobResponse)
+def build_faq(request: FaqBuildRequest):
+    """Phân cụm câu hỏi lịch sử và sinh lại toàn bộ câu trả lời FAQ (chạy nền)"""
+    if not request.question_files:
+        raise HTTPException(status_code=400, detail="Cần ít nhất một file câu hỏi")
+    
+    job = maintenance_runner.submit_faq_build(request.question_files, request.n_clusters, request.min_cluster_size)
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.post("/faq/refresh", response_model=MaintenanceJobResponse)
+def refresh_faq():
+    """Đối chiếu câu trả lời FAQ với corpus hiện tại và sinh lại những câu đã cũ"""
+    job = maintenance_runner.submit_faq_refresh()
+    return MaintenanceJobResponse(job_id=job.id, kind=job.kind, status=job.status)
+
+@router.post("/faq/{entry_id}/{action}")
+def review_faq_entry(entry_id: UUID, action: str, db: Session = Depends(get_db)):
+    """Duyệt (approve) hoặc loại (reject) một câu trả lời FAQ"""
+    statuses = {"approve": "approved", "reject": "rejected"}
+    if action not in statuses:
+        raise HTTPException(status_code=404, detail="Không tìm thấy thao tác")
+    
+    try:
+        updated = db.execute(text(
+            "UPDATE faq_entries SET status = :status, updated_at = now() WHERE id = :id"
+        ), {"status": statuses[action], "id": entry_id}).rowcount
+        db.commit()
+        if not updated:
+            raise HTTPException(status_code=404, detail="Không tìm thấy FAQ")
+        
+        faq_index.load(db)
+        return {"message": f"Đã cập nhật FAQ {entry_id}: {statuses[action]}"}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error reviewing FAQ entry: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi cập nhật FAQ")
@@ -7,8 +7,13 @@ from app.models.database import get_db
 from app.models.schemas import ChatRequest, ChatResponse, SearchResult
 from app.services.vector_store import PgVectorStore
 from app.services.chatbot import RAGChatbot
+from app.services.collection_registry import collection_registry
+from app.services.conversation import chat_metrics
+from app.services.faq import faq_index
+from app.services.llm_gateway import get_llm_gateway
+from app.services.profiling import ProfiledRoute
 
-router = APIRouter(prefix="/chat", tags=["chat"])
+router = APIRouter(prefix="/chat", tags=["chat"], route_class=ProfiledRoute)
 logger = logging.getLogger(__name__)
 
 # Cache chatbot instances
@@ -25,7 +30,7 @@ def get_chatbot(db: Session = Depends(get_db)) -> RAGChatbot:
     return chatbot_instances[session_id]
 
 @router.post("/message", response_model=ChatResponse)
-async def chat_message(
+def chat_message(
     request: ChatRequest,
     chatbot: RAGChatbot = Depends(get_chatbot)
 ):
@@ -43,9 +48,14 @@ async def chat_message(
         if not request.message.strip():
             raise HTTPException(status_code=400, detail="Tin nhắn không được để trống")
         
+        collection = collection_registry.get(request.collection)
+        if collection is None:
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {request.collection}")
+        
         response, sources, conversation_id = chatbot.chat(
             message=request.message,
-            conversation_id=request.conversation_id
+            conversation_id=request.conversation_id,
+            collection=collection
         )
         
         return ChatResponse(
@@ -86,4 +96,16 @@ async def get_conversation_history(
         
     except Exception as e:
         logger.error(f"Error getting conversation history: {str(e)}")
-        raise HTTPException(status_code=500, detail="Lỗi khi lấy lịch sử")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Lỗi khi lấy lịch sử")
+
+@router.get("/metrics")
+async def get_chat_metrics():
+    """Thống kê kích thước prompt, viết lại câu hỏi, tỉ lệ retrieval có kết quả và FAQ fast path"""
+    metrics = chat_metrics.to_dict()
+    metrics["faq"] = faq_index.get_stats()
+    return metrics
+
+@router.get("/gateway")
+async def get_gateway_stats():
+    """Queue depth, số request bị shed và trạng thái circuit breaker của LLM gateway"""
+    return get_llm_gateway().get_stats()
@@ -1,17 +1,40 @@
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from datetime import datetime
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+from uuid import uuid4
+import json
 import logging
 
-from app.models.database import get_db
+from app.models.database import CrawlJob, SessionLocal, get_db
 from app.models.schemas import WebsiteRequest, DocumentResponse
+from app.services.collection_registry import CollectionInfo, collection_registry
 from app.services.web_scraper import WebScraper
+from app.services.crawl_frontier import CrawlFrontier
 from app.services.text_processor import SemanticTextProcessor
 from app.services.vector_store import PgVectorStore
+from app.services.deduplication import NearDuplicateDetector, canonicalize_url
+from app.services.profiling import ProfiledRoute
+from app.utils.helpers import encode_cursor, decode_cursor
+from app.config import settings
 
-router = APIRouter(prefix="/scraping", tags=["scraping"])
+router = APIRouter(prefix="/scraping", tags=["scraping"], route_class=ProfiledRoute)
 logger = logging.getLogger(__name__)
 
+# Báo cáo của các lần crawl đang chạy (hoặc chưa ghi được vào crawl_jobs), theo crawl_id
+crawl_reports: Dict[str, dict] = {}
+MAX_CRAWL_REPORTS = 1000
+
+def _track_crawl(crawl_id: str, report: dict):
+    """Thêm báo cáo crawl, bỏ các báo cáo cũ nhất đã kết thúc khi vượt MAX_CRAWL_REPORTS"""
+    crawl_reports[crawl_id] = report
+    if len(crawl_reports) > MAX_CRAWL_REPORTS:
+        finished = [key for key, value in crawl_reports.items() if value.get("status") != "processing"]
+        for key in finished[:len(crawl_reports) - MAX_CRAWL_REPORTS]:
+            crawl_reports.pop(key, None)
+
 @router.post("/scrape-website", response_model=dict)
 async def scrape_website(
     request: WebsiteRequest,
@@ -30,9 +53,13 @@ async def scrape_website(
         dict: Thông tin về task
     """
     try:
-        # Kiểm tra xem website đã được scrape chưa
+        collection = collection_registry.get(request.collection)
+        if collection is None:
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {request.collection}")
+        
+        # Kiểm tra xem website đã được scrape vào collection chưa
         vector_store = PgVectorStore(db)
-        existing_doc = vector_store.get_document_by_url(str(request.url))
+        existing_doc = vector_store.get_document_by_url(canonicalize_url(str(request.url)), collection.name)
         
         if existing_doc:
             raise HTTPException(
@@ -40,18 +67,14 @@ async def scrape_website(
                 detail=f"Website {request.url} đã được scrape trước đó"
             )
         
-        # Thêm task vào background
-        background_tasks.add_task(
-            scrape_website_task,
-            str(request.url),
-            request.max_depth,
-            request.max_pages,
-            db
-        )
+        crawl_id = _start_crawl(str(request.url), request.max_depth, request.max_pages, collection,
+                                background_tasks, db)
         
         return {
             "message": f"Đã bắt đầu scrape website {request.url}",
-            "status": "processing"
+            "status": "processing",
+            "crawl_id": crawl_id,
+            "collection": collection.name
         }
         
     except HTTPException:
@@ -60,58 +83,353 @@ async def scrape_website(
         logger.error(f"Error starting scrape task: {str(e)}")
         raise HTTPException(status_code=500, detail="Lỗi khi bắt đầu scrape website")
 
-async def scrape_website_task(url: str, max_depth: int, max_pages: int, db: Session):
-    """Background task để scrape website"""
+@router.post("/collections/{name}/crawl", response_model=dict)
+async def crawl_collection(
+    name: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Crawl lại mọi nguồn đã cấu hình của một collection
+    
+    Args:
+        name: Tên collection
+        background_tasks: Background tasks
+        db: Database session
+        
+    Returns:
+        dict: Các crawl đã bắt đầu
+    """
+    collection = collection_registry.get(name)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {name}")
+    if not collection.sources:
+        raise HTTPException(status_code=400, detail=f"Collection {name} chưa có nguồn crawl")
+    
     try:
-        logger.info(f"Starting scrape task for {url}")
+        crawls = [
+            {
+                "url": source["url"],
+                "crawl_id": _start_crawl(source["url"], source.get("max_depth", 2), source.get("max_pages", 10),
+                                         collection, background_tasks, db)
+            }
+            for source in collection.sources
+        ]
+        
+        return {
+            "message": f"Đã bắt đầu crawl {len(crawls)} nguồn của collection {name}",
+            "status": "processing",
+            "collection": name,
+            "crawls": crawls
+        }
+        
+    except Exception as e:
+        logger.error(f"Error starting collection crawl: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi bắt đầu crawl collection")
+
+def _start_crawl(url: str, max_depth: int, max_pages: int, collection: CollectionInfo,
+                 background_tasks: BackgroundTasks, db: Session) -> str:
+    """Ghi crawl_jobs và đưa crawl vào background, trả về crawl_id"""
+    crawl_id = str(uuid4())
+    _track_crawl(crawl_id, {"url": url, "collection": collection.name, "status": "processing"})
+    db.add(CrawlJob(
+        id=crawl_id,
+        start_url=url,
+        max_depth=max_depth,
+        max_pages=max_pages,
+        collection=collection.name
+    ))
+    db.commit()
+    
+    # Thêm task vào background
+    background_tasks.add_task(
+        scrape_website_task,
+        url,
+        max_depth,
+        max_pages,
+        db,
+        crawl_id,
+        False,
+        collection
+    )
+    return crawl_id
+
+async def scrape_website_task(url: str, max_depth: int, max_pages: int, db: Session,
+                              crawl_id: str = None, resume: bool = False,
+                              collection: Optional[CollectionInfo] = None):
+    """
+    Background task để scrape website vào collection; resume=True tiếp tục từ frontier đã checkpoint
+    
+    Chunking (chunk_size, chunk_overlap, chunking_mode) theo cấu hình của collection.
+    """
+    collection = collection or collection_registry.default()
+    report = crawl_reports.setdefault(crawl_id, {"url": url}) if crawl_id else {"url": url}
+    report["status"] = "processing"
+    
+    try:
+        logger.info(f"{'Resuming' if resume else 'Starting'} scrape task for {url} into {collection.name}")
         
         # Khởi tạo services
         scraper = WebScraper()
-        processor = SemanticTextProcessor()
+        processor = SemanticTextProcessor(collection.chunk_size, collection.chunk_overlap)
         vector_store = PgVectorStore(db)
         
-        # Scrape website
-        scraped_content = scraper.scrape_website(url, max_depth, max_pages)
+        # Frontier lưu trong crawl_frontier để crawl tiếp được sau khi process dừng
+        frontier = None
+        if crawl_id:
+            frontier = CrawlFrontier.restore(crawl_id, SessionLocal) if resume else \
+                CrawlFrontier(crawl_id, SessionLocal)
+        
+        # Fingerprints đã có của domain để bỏ qua nội dung trùng trước khi embed
+        detector = None
+        if settings.dedup_enabled:
+            domain = urlparse(canonicalize_url(url)).netloc
+            page_fingerprints, chunk_fingerprints = vector_store.get_fingerprints(domain, collection.name)
+            detector = NearDuplicateDetector(
+                page_fingerprints,
+                chunk_fingerprints,
+                max_distance=settings.dedup_max_distance
+            )
         
-        # Xử lý từng trang
-        for content in scraped_content:
+        # Xử lý từng trang ngay khi scrape xong
+        pages_scraped = 0
+        stored_pages = 0
+        stored_chunks = 0
+        for content in scraper.iter_website(url, max_depth, max_pages, frontier):
+            pages_scraped += 1
             try:
-                # Semantic chunking
-                chunks = processor.semantic_chunking(content.content, content.metadata)
+                fingerprint = None
+                if detector:
+                    is_duplicate, fingerprint = detector.check_page(content.content)
+                    if is_duplicate:
+                        # Chỉ tách ký tự (rẻ) để ước tính số embedding tiết kiệm được
+                        detector.record_skipped_page_chunks(
+                            len(processor.text_splitter.split_text(content.content))
+                        )
+                        logger.debug("Skipped near-duplicate page %s", content.url)
+                        continue
+                
+                # Chunking theo cấu trúc trang nếu có, ngược lại semantic chunking
+                chunk_metadata = None
+                if collection.chunking_mode == "structured" and content.blocks:
+                    chunks = processor.structured_chunking(content.blocks, content.metadata)
+                    chunk_metadata = [chunk.metadata for chunk in chunks]
+                else:
+                    chunks = processor.semantic_chunking(content.content, content.metadata)
                 chunk_texts = [chunk.page_content for chunk in chunks]
                 
+                chunk_fingerprints = None
+                if detector:
+                    kept, chunk_fingerprints = detector.filter_chunks(chunk_texts)
+                    chunk_texts = [chunk_texts[i] for i in kept]
+                    if chunk_metadata:
+                        chunk_metadata = [chunk_metadata[i] for i in kept]
+                
                 # Lưu vào vector store
                 vector_store.add_document(
                     url=content.url,
                     title=content.title,
                     content=content.content,
                     chunks=chunk_texts,
-                    metadata=content.metadata
+                    metadata=content.metadata,
+                    fingerprint=fingerprint,
+                    chunk_fingerprints=chunk_fingerprints,
+                    chunk_metadata=chunk_metadata,
+                    collection=collection
                 )
+                # Chỉ ghi nhận fingerprints khi đã lưu thành công, để trang lỗi vẫn được lưu lại sau
+                if detector:
+                    detector.register(fingerprint, chunk_fingerprints)
+                stored_pages += 1
+                stored_chunks += len(chunk_texts)
                 
-                logger.info(f"Processed {content.url} with {len(chunk_texts)} chunks")
+                logger.info("Processed %s with %d chunks", content.url, len(chunk_texts))
                 
             except Exception as e:
                 logger.error(f"Error processing {content.url}: {str(e)}")
                 continue
         
-        logger.info(f"Completed scrape task for {url}")
+        report.update({
+            "status": "completed",
+            "pages_scraped": frontier.done if frontier else pages_scraped,
+            "pages_stored": stored_pages,
+            "chunks_stored": stored_chunks,
+            "duplicate_urls": scraper.duplicate_urls,
+            "deduplication": detector.report.to_dict() if detector else None
+        })
+        logger.info(f"Completed scrape task for {url}: {report}")
         
     except Exception as e:
+        report["status"] = "failed"
         logger.error(f"Error in scrape task: {str(e)}")
+    
+    # Báo cáo đã ghi vào crawl_jobs thì GET /crawls/{crawl_id} đọc từ database
+    if crawl_id and _save_crawl_job(crawl_id, report):
+        crawl_reports.pop(crawl_id, None)
+
+def _save_crawl_job(crawl_id: str, report: dict) -> bool:
+    """Ghi trạng thái cuối và báo cáo của crawl vào crawl_jobs"""
+    db = SessionLocal()
+    try:
+        job = db.get(CrawlJob, crawl_id)
+        if job is None:
+            return False
+        job.status = report.get("status", job.status)
+        job.report = {key: value for key, value in report.items() if key not in ("url", "collection", "status")}
+        job.updated_at = datetime.utcnow()
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Error saving crawl job {crawl_id}: {str(e)}")
+        return False
+    finally:
+        db.close()
+
+@router.get("/crawls/{crawl_id}")
+def get_crawl_report(crawl_id: str, db: Session = Depends(get_db)):
+    """Lấy trạng thái và báo cáo deduplication của một lần crawl"""
+    report = crawl_reports.get(crawl_id)
+    if report is not None:
+        return {"crawl_id": crawl_id, **report}
+    
+    # Crawl của process trước: đọc từ crawl_jobs
+    job = db.get(CrawlJob, crawl_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy crawl")
+    
+    return {
+        "crawl_id": crawl_id,
+        "url": job.start_url,
+        "collection": job.collection,
+        "status": job.status,
+        "pages_scraped": job.pages_scraped,
+        **(job.report or {})
+    }
+
+@router.post("/crawls/{crawl_id}/resume", response_model=dict)
+async def resume_crawl(
+    crawl_id: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db)
+):
+    """
+    Tiếp tục một crawl bị dừng giữa chừng từ frontier đã checkpoint
+    
+    Args:
+        crawl_id: ID của crawl
+        background_tasks: Background tasks
+        db: Database session
+        
+    Returns:
+        dict: Thông tin về task
+    """
+    job = db.get(CrawlJob, crawl_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Không tìm thấy crawl")
+    if crawl_reports.get(crawl_id, {}).get("status") == "processing":
+        raise HTTPException(status_code=409, detail="Crawl đang chạy")
+    if job.status == "completed":
+        raise HTTPException(status_code=400, detail="Crawl đã hoàn thành")
+    
+    collection = collection_registry.get(job.collection)
+    if collection is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {job.collection}")
+    
+    _track_crawl(crawl_id, {"url": job.start_url, "collection": collection.name, "status": "processing"})
+    background_tasks.add_task(
+        scrape_website_task,
+        job.start_url,
+        job.max_depth,
+        job.max_pages,
+        db,
+        crawl_id,
+        True,
+        collection
+    )
+    
+    return {
+        "message": f"Đã tiếp tục crawl {job.start_url}",
+        "status": "processing",
+        "crawl_id": crawl_id,
+        "pages_scraped": job.pages_scraped
+    }
 
 @router.get("/documents", response_model=List[DocumentResponse])
-async def get_documents(skip: int = 0, limit: int = 20, db: Session = Depends(get_db)):
-    """Lấy danh sách documents đã scrape"""
+def get_documents(
+    response: Response,
+    limit: int = Query(20, ge=1, le=200),
+    cursor: Optional[str] = None,
+    domain: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Lấy danh sách documents đã scrape, mới nhất trước
+    
+    Phân trang bằng cursor: nếu còn trang sau, header X-Next-Cursor chứa cursor
+    để truyền vào request tiếp theo.
+    
+    Args:
+        limit: Số documents mỗi trang
+        cursor: Cursor từ header X-Next-Cursor của trang trước
+        domain: Chỉ lấy documents của domain này
+        db: Database session
+        
+    Returns:
+        List[DocumentResponse]: Documents của trang
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor không hợp lệ")
+    
     try:
-        from app.models.database import Document
-        documents = db.query(Document).offset(skip).limit(limit).all()
+        vector_store = PgVectorStore(db)
+        documents = vector_store.list_documents(limit=limit, after=after, domain=domain)
+        
+        if len(documents) == limit:
+            last = documents[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+        
         return documents
         
     except Exception as e:
         logger.error(f"Error getting documents: {str(e)}")
         raise HTTPException(status_code=500, detail="Lỗi khi lấy danh sách documents")
 
+@router.get("/documents/export")
+def export_documents(domain: Optional[str] = None, include_content: bool = False):
+    """
+    Xuất toàn bộ documents dạng NDJSON (mỗi dòng một document), stream theo từng batch
+    
+    Args:
+        domain: Chỉ xuất documents của domain này
+        include_content: Có kèm nội dung trang không
+    """
+    def generate():
+        # Session riêng, sống đúng bằng thời gian stream
+        db = SessionLocal()
+        try:
+            vector_store = PgVectorStore(db)
+            for row in vector_store.iter_documents(domain=domain, include_content=include_content):
+                item = {
+                    "id": str(row.id),
+                    "url": row.url,
+                    "title": row.title,
+                    "domain": row.domain,
+                    "created_at": row.created_at.isoformat() if row.created_at else None
+                }
+                if include_content:
+                    item["content"] = row.content
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"Error exporting documents: {str(e)}")
+            raise
+        finally:
+            db.close()
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
 @router.delete("/documents/{document_id}")
 async def delete_document(document_id: str, db: Session = Depends(get_db)):
     """Xóa một document"""
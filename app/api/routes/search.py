@@ -4,14 +4,17 @@ from typing import List
 import logging
 
 from app.models.database import get_db
-from app.models.schemas import SearchRequest, SearchResult
+from app.models.schemas import SearchRequest, SearchResult, BatchSearchRequest, BatchSearchResponse
+from app.services.collection_registry import collection_registry
 from app.services.vector_store import PgVectorStore
+from app.services.profiling import ProfiledRoute
+from app.config import settings
 
-router = APIRouter(prefix="/search", tags=["search"])
+router = APIRouter(prefix="/search", tags=["search"], route_class=ProfiledRoute)
 logger = logging.getLogger(__name__)
 
 @router.post("/semantic", response_model=List[SearchResult])
-async def semantic_search(request: SearchRequest, db: Session = Depends(get_db)):
+def semantic_search(request: SearchRequest, db: Session = Depends(get_db)):
     """
     Tìm kiếm semantic trong vector store
     
@@ -26,11 +29,17 @@ async def semantic_search(request: SearchRequest, db: Session = Depends(get_db))
         if not request.query.strip():
             raise HTTPException(status_code=400, detail="Query không được để trống")
         
+        collection = collection_registry.get(request.collection)
+        if collection is None:
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {request.collection}")
+        
         vector_store = PgVectorStore(db)
         results = vector_store.semantic_search(
             query=request.query,
             max_results=request.max_results,
-            similarity_threshold=request.similarity_threshold
+            similarity_threshold=request.similarity_threshold,
+            filters=request.filters,
+            collection=collection
         )
         
         return results
@@ -41,8 +50,54 @@ async def semantic_search(request: SearchRequest, db: Session = Depends(get_db))
         logger.error(f"Error in semantic search: {str(e)}")
         raise HTTPException(status_code=500, detail="Lỗi khi tìm kiếm")
 
+@router.post("/batch", response_model=BatchSearchResponse)
+def batch_search(request: BatchSearchRequest, db: Session = Depends(get_db)):
+    """
+    Tìm kiếm semantic cho nhiều query trong một request
+    
+    Args:
+        request: Danh sách query và tham số tìm kiếm chung
+        db: Database session
+        
+    Returns:
+        BatchSearchResponse: Kết quả cho từng query, theo đúng thứ tự gửi lên
+    """
+    try:
+        if not request.queries:
+            raise HTTPException(status_code=400, detail="Danh sách query không được để trống")
+        
+        if len(request.queries) > settings.batch_search_max_queries:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Tối đa {settings.batch_search_max_queries} query mỗi request"
+            )
+        
+        if any(not query.strip() for query in request.queries):
+            raise HTTPException(status_code=400, detail="Query không được để trống")
+        
+        collection = collection_registry.get(request.collection)
+        if collection is None:
+            raise HTTPException(status_code=404, detail=f"Không tìm thấy collection {request.collection}")
+        
+        vector_store = PgVectorStore(db)
+        results = vector_store.semantic_search_many(
+            queries=request.queries,
+            max_results=request.max_results,
+            similarity_threshold=request.similarity_threshold,
+            filters=request.filters,
+            collection=collection
+        )
+        
+        return BatchSearchResponse(results=results)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error in batch search: {str(e)}")
+        raise HTTPException(status_code=500, detail="Lỗi khi tìm kiếm")
+
 @router.get("/stats")
-async def get_search_stats(db: Session = Depends(get_db)):
+def get_search_stats(db: Session = Depends(get_db)):
     """Lấy thống kê về vector store"""
     try:
         vector_store = PgVectorStore(db)
@@ -13,18 +13,161 @@ class Settings(BaseSettings):
     app_host: str = "0.0.0.0"
     app_port: int = 8000
     debug: bool = False
+    prewarm_on_startup: bool = True
+    admin_api_key: Optional[str] = None  # Header X-Admin-Key cho /api/v1/admin/*; không đặt thì admin API bị khóa
+    import_time_budget_ms: float = 1500.0  # Ngưỡng cho tests/test_import_time.py và benchmarks/import_time.py
     
     # Embedding
     embedding_model: str = "models/embedding-001"
+    embedding_dimension: int = 768
     chunk_size: int = 1000
     chunk_overlap: int = 200
+    # "semantic" (text phẳng + merge TF-IDF) hoặc "structured" (theo heading/bảng/danh sách)
+    chunking_mode: str = "semantic"
+    # offsets: chunk là khoảng trong documents.content, inline: lưu text trong chunks.content
+    chunk_text_storage: str = "offsets"
+    
+    # Trích xuất nội dung chính
+    boilerplate_min_pages: int = 3
+    max_link_density: float = 0.5
+    
+    # Near-duplicate detection khi ingest
+    dedup_enabled: bool = True
+    dedup_max_distance: int = 3
+    
+    # Crawl frontier
+    crawl_sitemap_enabled: bool = True
+    crawl_sitemap_max_urls: int = 50000
+    crawl_bloom_capacity: int = 1000000
+    crawl_bloom_error_rate: float = 0.001
+    crawl_checkpoint_every: int = 20  # Ghi frontier xuống database sau mỗi N trang
+    crawl_depth_penalty: float = 0.2
+    crawl_freshness_half_life_days: float = 30.0
     
     # Vector search
     similarity_threshold: float = 0.7
     max_results: int = 10
     
+    # Prompt và model sinh câu trả lời
+    chat_model: str = "gemini-2.0-flash"
+    prompt_tenant: str = "vpbank"
+    prompt_template_dir: Optional[str] = None  # Mặc định app/prompts
+    prompt_context_cache: bool = False
+    prompt_cache_ttl_seconds: int = 3600
+    
+    # LLM gateway: giới hạn đồng thời, deadline, retry, circuit breaker và model dự phòng
+    fallback_chat_model: str = "gemini-2.0-flash-lite"
+    llm_max_concurrency: int = 8
+    llm_fallback_max_concurrency: int = 8
+    llm_queue_timeout_seconds: float = 2.0  # Chờ slot tối đa trước khi chuyển sang tầng dự phòng
+    llm_timeout_seconds: float = 20.0
+    llm_max_retries: int = 1
+    llm_retry_base_delay: float = 0.5
+    llm_breaker_failure_threshold: int = 5
+    llm_breaker_reset_seconds: float = 30.0
+    # Tầng helper (viết lại câu hỏi, tóm tắt lịch sử) dùng query_rewrite_model, không retry
+    llm_helper_max_concurrency: int = 8
+    llm_helper_timeout_seconds: float = 3.0
+    
+    # Hội thoại: viết lại câu hỏi nối tiếp và tóm tắt lịch sử
+    query_rewrite_model: str = "gemini-2.0-flash-lite"
+    query_rewrite_llm_enabled: bool = True
+    history_token_threshold: int = 1500
+    history_recent_turns: int = 3
+    conversation_max_count: int = 10000  # Hội thoại giữ trong bộ nhớ mỗi worker, quá thì xóa hội thoại lâu không dùng
+    conversation_ttl_seconds: float = 3600.0  # Hội thoại không dùng quá lâu bị xóa
+    
+    # Small-to-big retrieval khi dựng context: "none", "window" (chunk lân cận) hoặc "section"
+    retrieval_expansion: str = "none"
+    expansion_window: int = 1
+    expansion_max_section_chunks: int = 8
+    # Index ANN: "vector" (float32), "halfvec" (float16) hoặc "binary" (binary quantization)
+    # Với halfvec/binary, top max_results * rescore_factor ứng viên được tính lại bằng vector đầy đủ
+    embedding_index_mode: str = "vector"
+    rescore_factor: int = 4
+    # pgvector >= 0.8: tiếp tục quét index khi filter/collection loại bớt kết quả
+    # ("auto": relaxed_order nếu pgvector hỗ trợ, "off", "relaxed_order", "strict_order")
+    vector_iterative_scan: str = "auto"
+    
+    # Re-embedding blue/green theo phiên bản embedding
+    embedding_version_refresh_seconds: float = 30.0
+    reembed_batch_size: int = 100
+    reembed_requests_per_minute: int = 300
+    embedding_shadow_version: Optional[str] = None  # Chạy lại một phần truy vấn trên phiên bản này
+    embedding_shadow_sample_rate: float = 0.1
+    
+    # Collections: knowledge base riêng (nguồn crawl, chunking, embedding, index ANN, prompt)
+    collection_refresh_seconds: float = 30.0
+    
+    # Query embedding batching
+    query_batching_enabled: bool = True
+    query_batch_window_ms: float = 5.0
+    query_batch_max_size: int = 32
+    query_batch_max_concurrency: int = 4
+    query_batch_timeout_seconds: float = 30.0  # Thời gian chờ tối đa của một query trong batch
+    
+    # Batch search
+    batch_search_max_queries: int = 1000
+    batch_search_embed_size: int = 100
+    
+    # Health check và thống kê
+    stats_refresh_seconds: float = 60.0
+    readiness_timeout_ms: int = 1000
+    
+    # FAQ: câu trả lời dựng sẵn cho các cụm câu hỏi thường gặp, tra theo tâm cụm gần nhất
+    faq_enabled: bool = True
+    faq_max_clusters: int = 300
+    faq_min_cluster_size: int = 5  # Cụm ít câu hỏi hơn không được dựng câu trả lời
+    faq_min_similarity: float = 0.9  # Ngưỡng tối thiểu để phục vụ câu trả lời dựng sẵn
+    faq_require_review: bool = False  # True: câu trả lời mới ở trạng thái pending tới khi được duyệt
+    faq_check_seconds: float = 300.0  # Chu kỳ đối chiếu corpus/tải lại index
+    faq_corpus_quiet_seconds: float = 600.0  # documents phải ngừng thay đổi chừng này trước khi làm mới
+    faq_max_age_hours: float = 24.0  # Kiểm tra lại câu trả lời dù corpus không đổi
+    
+    # Admission control: token bucket theo API key/IP và giới hạn đồng thời theo nhóm route
+    # Nhóm: interactive (chat, search), batch (batch search, export), ingest (scrape), admin
+    admission_enabled: bool = True
+    admission_max_concurrency: int = 32  # Tổng số request được xử lý cùng lúc trên mỗi worker
+    admission_interactive_reserved: int = 8  # Số slot chỉ nhóm interactive được dùng
+    admission_max_queue: int = 64  # Request chờ slot tối đa mỗi nhóm, vượt quá trả 429 ngay
+    admission_queue_timeout_seconds: float = 2.0
+    admission_bucket_backend: str = "memory"  # "memory" (mỗi worker) hoặc "postgres" (dùng chung)
+    admission_trust_forwarded_for: bool = False  # Lấy IP client từ X-Forwarded-For (sau proxy)
+    admission_api_keys: str = ""  # Các API key hợp lệ (phân cách bằng dấu phẩy), mỗi key một bucket riêng
+    admission_interactive_concurrency: int = 24
+    admission_interactive_rate_per_minute: float = 60.0
+    admission_interactive_burst: int = 20
+    admission_batch_concurrency: int = 4
+    admission_batch_rate_per_minute: float = 10.0
+    admission_batch_burst: int = 3
+    admission_ingest_concurrency: int = 2  # Slot được giữ tới khi crawl chạy nền kết thúc
+    admission_ingest_rate_per_minute: float = 2.0
+    admission_ingest_burst: int = 2
+    admission_admin_concurrency: int = 2
+    admission_admin_rate_per_minute: float = 30.0
+    admission_admin_burst: int = 10
+    
     pgvector_extension: str = "vector"
+    
+    # Logging: ghi qua queue ở thread riêng, file xoay vòng theo kích thước
     log_level: str = "INFO"
+    log_format: str = "json"  # "json" hoặc "text"
+    log_dir: str = "logs"
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_debug_sample_rate: float = 0.01  # Tỉ lệ record DEBUG được giữ lại
+
+    # Profiling: sampling profiler theo request, bật/tắt lúc chạy qua /admin/profiling
+    # Request được lấy mẫu (sample_rate) hoặc chậm hơn slow_ms được lưu lại (stack gộp + SQL);
+    # request chậm còn kèm EXPLAIN của các câu SQL lâu nhất
+    profiling_enabled: bool = False
+    profiling_sample_rate: float = 0.01
+    profiling_slow_ms: float = 2000.0
+    profiling_watch_ms: float = 500.0  # Request chưa được lấy mẫu bắt đầu được profile sau mốc này
+    profiling_interval_ms: float = 10.0  # Chu kỳ lấy stack
+    profiling_dir: str = "profiles"
+    profiling_max_captures: int = 200  # Giữ lại số capture mới nhất
+    profiling_explain_top: int = 3
 
     class Config:
         env_file = ".env"
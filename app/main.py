@@ -1,17 +1,29 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from sqlalchemy import text
+import threading
 import logging
+import uuid
 
 from app.config import settings
-from app.models.database import create_tables
-from app.api.routes import scraping, search, chat
-from app.utils.logging import setup_logging
+from app.models.database import SessionLocal, create_tables, engine
+from app.services.corpus_stats import corpus_stats
+from app.services.faq import faq_index
+from app.services.partitions import partition_manager
+from app.services.admission import admission_controller
+from app.services.profiling import ProfiledRoute, profiler
+from app.api.middleware import AdmissionMiddleware, ProfilingMiddleware
+from app.api.routes import scraping, search, chat, admin
+from app.utils.logging import request_id_var, setup_logging, stop_logging
 
 # Setup logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+_readiness_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="readiness")
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan events"""
@@ -24,9 +36,43 @@ async def lifespan(app: FastAPI):
     except Exception as e:
         logger.error(f"Error creating tables: {str(e)}")
     
+    # Partition chunks cho tháng hiện tại và tháng sau
+    try:
+        partition_manager.ensure_upcoming()
+    except Exception as e:
+        logger.error(f"Error creating chunk partitions: {str(e)}")
+    
+    # Đọc và compile prompt templates một lần khi khởi động
+    try:
+        from app.services.prompts import get_prompt_templates
+        get_prompt_templates()
+    except Exception as e:
+        logger.error(f"Error loading prompt templates: {str(e)}")
+    
+    # Import thư viện nặng (Gemini SDK, langchain, sklearn) ở background để
+    # app nhận request ngay mà request chat/ingest đầu tiên không phải chờ
+    if settings.prewarm_on_startup:
+        from app.utils.lazy import prewarm
+        threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+    
+    # Thống kê corpus làm mới ở background thay vì COUNT(*) mỗi request
+    corpus_stats.start_refresher(SessionLocal)
+    
+    # Index FAQ trong bộ nhớ, tải lại/làm mới khi faq_entries hoặc documents thay đổi
+    if settings.faq_enabled:
+        faq_index.start_refresher(SessionLocal)
+    
+    # Sampling profiler (có thể bật sau qua POST /api/v1/admin/profiling)
+    if profiler.enabled:
+        profiler.start_sampler()
+    
     yield
     
+    corpus_stats.stop_refresher()
+    faq_index.stop_refresher()
+    profiler.stop_sampler()
     logger.info("Shutting down RAG Chatbot API")
+    stop_logging()
 
 # Tạo FastAPI app
 app = FastAPI(
@@ -35,6 +81,15 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan
 )
+# Route khai báo trực tiếp trên app (health check) cũng được gắn vào profile session
+app.router.route_class = ProfiledRoute
+
+# Profiling (thêm đầu tiên để nằm trong cùng, sau khi request id đã được gắn)
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+# Admission control (thêm trước CORS để response 429 vẫn có header CORS)
+if settings.admission_enabled:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller)
 
 # CORS middleware
 app.add_middleware(
@@ -43,12 +98,26 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID", "Retry-After"],  # X-Next-Cursor: phân trang GET /scraping/documents
 )
 
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Gắn request id (từ header X-Request-ID hoặc sinh mới) vào mọi log của request"""
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+    finally:
+        request_id_var.reset(token)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
 # Include routers
 app.include_router(scraping.router, prefix="/api/v1")
 app.include_router(search.router, prefix="/api/v1")
 app.include_router(chat.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
 
 @app.get("/")
 async def root():
@@ -59,32 +128,54 @@ async def root():
         "status": "healthy"
     }
 
-@app.get("/health")
-async def health_check():
-    """Detailed health check"""
+@app.get("/health/live")
+async def liveness():
+    """Liveness probe: process còn phục vụ request, không chạm database"""
+    return {"status": "alive"}
+
+def _check_database():
+    db = SessionLocal()
     try:
-        from app.models.database import SessionLocal
-        from app.services.vector_store import PgVectorStore
-        
-        # Kiểm tra database connection
-        db = SessionLocal()
-        try:
-            vector_store = PgVectorStore(db)
-            stats = vector_store.get_stats()
-            db_status = "connected"
-        except Exception as e:
-            db_status = f"error: {str(e)}"
-        finally:
-            db.close()
-        
-        return {
-            "status": "healthy",
-            "database": db_status,
-            "vector_store_stats": stats if db_status == "connected" else None
-        }
-        
+        db.execute(
+            text("SELECT set_config('statement_timeout', :timeout, true)"),
+            {"timeout": str(settings.readiness_timeout_ms)}
+        )
+        db.execute(text("SELECT 1"))
+    finally:
+        db.close()
+
+@app.get("/health/ready")
+def readiness():
+    """Readiness probe: database trả lời SELECT 1 trong readiness_timeout_ms"""
+    # Chờ qua executor để cả việc lấy connection từ pool cũng bị giới hạn thời gian
+    future = _readiness_executor.submit(_check_database)
+    try:
+        future.result(timeout=settings.readiness_timeout_ms / 1000)
+    except FutureTimeoutError:
+        raise HTTPException(status_code=503, detail="Database không phản hồi kịp")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
+        logger.error(f"Readiness check failed: {str(e)}")
+        raise HTTPException(status_code=503, detail="Database chưa sẵn sàng")
+    
+    return {"status": "ready", "database": "connected"}
+
+@app.get("/health")
+def health_check():
+    """Detailed health check (thống kê lấy từ bộ đếm, không COUNT(*))"""
+    try:
+        readiness()
+        db_status = "connected"
+    except HTTPException as e:
+        db_status = f"error: {e.detail}"
+    
+    return {
+        "status": "healthy",
+        "database": db_status,
+        "vector_store_stats": corpus_stats.snapshot() if corpus_stats.refreshed_at else None
+    }
+
+# Gắn thời gian SQL vào profile session của request
+profiler.install_sql_hooks(engine)
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,12 +1,16 @@
-from sqlalchemy import Integer, create_engine, Column, String, Text, DateTime, Float
+from sqlalchemy import (
+    Integer, BigInteger, create_engine, Column, String, Text, DateTime, Float, Index, ForeignKey,
+    ForeignKeyConstraint
+)
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import UUID, JSONB
 from pgvector.sqlalchemy import Vector
 import uuid
 from datetime import datetime
 
 from app.config import settings
+from app.utils.helpers import ingest_epoch
 
 engine = create_engine(settings.database_url)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -16,22 +20,201 @@ class Document(Base):
     __tablename__ = "documents"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    url = Column(String, unique=True, index=True)
+    url = Column(String, index=True)
     title = Column(String)
     content = Column(Text)
-    meta_data = Column(Text)  # JSON string
+    domain = Column(String, index=True)
+    simhash = Column(BigInteger)  # Fingerprint nội dung để phát hiện trang gần trùng
+    meta_data = Column(JSONB, default=dict)
     created_at = Column(DateTime, default=datetime.utcnow)
+    # Cùng epoch với các chunk của document, để xóa cả lần crawl cùng partition
+    ingest_epoch = Column(Integer, default=ingest_epoch, index=True)
+    collection = Column(String, nullable=False, default="default")
+    
+    __table_args__ = (
+        # Phân trang keyset khi liệt kê documents (toàn bộ hoặc theo domain)
+        Index("ix_documents_created_id", created_at, id),
+        Index("ix_documents_domain_created_id", domain, created_at, id),
+        # Cùng một URL được phép nằm trong nhiều collection
+        Index("ix_documents_collection_url", collection, url, unique=True),
+        Index("ix_documents_collection_domain", collection, domain),
+    )
     
 class Chunk(Base):
+    """
+    Chunk và embedding, partition theo ingest_epoch (YYYYMM)
+    
+    Partition được tạo trước bởi ChunkPartitionManager; xóa một lần crawl cũ là
+    DROP partition thay vì DELETE từng row. Text của chunk thường không lưu ở
+    đây mà là khoảng [start_offset, end_offset) trong documents.content.
+    """
     __tablename__ = "chunks"
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    document_id = Column(UUID(as_uuid=True), index=True)
+    ingest_epoch = Column(Integer, primary_key=True, default=ingest_epoch)
+    # Xóa document thì database tự xóa chunks
+    document_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("documents.id", ondelete="CASCADE", name="fk_chunks_document"),
+        index=True
+    )
+    # NULL khi chunk là đoạn liên tục của documents.content (xem start_offset/end_offset)
     content = Column(Text)
-    embedding = Column(Vector(768))  # Gemini embedding dimension
+    start_offset = Column(Integer)
+    end_offset = Column(Integer)
+    embedding = Column(Vector(settings.embedding_dimension))  # Gemini embedding dimension
     chunk_index = Column(Integer)
-    meta_data = Column(Text)
+    # Section (parent) chứa chunk khi dùng structured chunking
+    section_index = Column(Integer)
+    heading_path = Column(String)
+    simhash = Column(BigInteger)
+    meta_data = Column(JSONB, default=dict)
+    # Denormalize từ documents để search không cần join
+    domain = Column(String, index=True)
+    url = Column(String)
+    title = Column(String)
+    scraped_at = Column(DateTime, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    # Index ANN của collection là partial index WHERE collection = '<name>'
+    collection = Column(String, nullable=False, default="default")
+    
+    __table_args__ = (
+        # Range query lấy chunk lân cận khi mở rộng ngữ cảnh
+        Index("ix_chunks_document_chunk", document_id, chunk_index),
+        Index("ix_chunks_collection_domain", collection, domain),
+        Index("ix_chunks_meta_data", meta_data, postgresql_using="gin",
+              postgresql_ops={"meta_data": "jsonb_path_ops"}),
+        {"postgresql_partition_by": "RANGE (ingest_epoch)"},
+    )
+
+# Text của chunk: cột content nếu lưu inline, ngược lại cắt từ documents.content (alias d)
+CHUNK_TEXT_SQL = "COALESCE({chunk}.content, substr(d.content, {chunk}.start_offset + 1, {chunk}.end_offset - {chunk}.start_offset))"
+
+class EmbeddingVersion(Base):
+    """
+    Một phiên bản embedding (model + số chiều)
+    
+    "legacy" là cột chunks.embedding; các phiên bản khác lưu trong chunk_embeddings.
+    status: building (đang backfill), ready (đủ vector, chờ cutover hoặc dự phòng
+    rollback), active (search đang dùng), retired (ngừng ghi).
+    """
+    __tablename__ = "embedding_versions"
+    
+    name = Column(String, primary_key=True)
+    model = Column(String, nullable=False)
+    dimension = Column(Integer, nullable=False)
+    status = Column(String, nullable=False, default="building")
+    backfilled = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    activated_at = Column(DateTime)
+
+class ChunkEmbedding(Base):
+    __tablename__ = "chunk_embeddings"
+    
+    chunk_id = Column(UUID(as_uuid=True), primary_key=True)
+    version = Column(String, ForeignKey("embedding_versions.name", ondelete="CASCADE"), primary_key=True)
+    # Khóa partition của chunk, cần cho foreign key tới chunks
+    ingest_epoch = Column(Integer, nullable=False, index=True)
+    # Không cố định số chiều để nhiều model cùng tồn tại; index ANN là partial index theo version
+    embedding = Column(Vector())
+    # Denormalize từ chunks cho partial index theo (version, collection)
+    collection = Column(String, nullable=False, default="default")
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        ForeignKeyConstraint(
+            [chunk_id, ingest_epoch], ["chunks.id", "chunks.ingest_epoch"],
+            ondelete="CASCADE", name="fk_chunk_embeddings_chunk"
+        ),
+    )
+
+class Collection(Base):
+    """
+    Một knowledge base có tên, với nguồn crawl, chunking, embedding, index ANN và prompt riêng
+    
+    embedding_version NULL là dùng phiên bản active; chunk_size/chunk_overlap/chunking_mode
+    áp dụng khi crawl vào collection. sources là danh sách {"url", "max_depth", "max_pages"}.
+    """
+    __tablename__ = "collections"
+    
+    name = Column(String, primary_key=True)
+    description = Column(Text)
+    prompt_tenant = Column(String)  # NULL là settings.prompt_tenant
+    embedding_version = Column(String)
+    chunk_size = Column(Integer, nullable=False)
+    chunk_overlap = Column(Integer, nullable=False)
+    chunking_mode = Column(String, nullable=False)
+    sources = Column(JSONB, default=list)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class CrawlJob(Base):
+    """Một lần crawl website; frontier được checkpoint để tiếp tục sau khi process dừng"""
+    __tablename__ = "crawl_jobs"
+    
+    id = Column(String, primary_key=True)
+    start_url = Column(String, nullable=False)
+    max_depth = Column(Integer)
+    max_pages = Column(Integer)
+    collection = Column(String, nullable=False, default="default")
+    status = Column(String, nullable=False, default="processing")  # processing, completed, failed
+    pages_scraped = Column(Integer, default=0)
+    report = Column(JSONB, default=dict)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class CrawlFrontierEntry(Base):
+    """URL đã phát hiện trong một lần crawl; url_hash là hash 64-bit của URL chuẩn"""
+    __tablename__ = "crawl_frontier"
+    
+    crawl_id = Column(String, ForeignKey("crawl_jobs.id", ondelete="CASCADE"), primary_key=True)
+    url_hash = Column(BigInteger, primary_key=True)
+    url = Column(String, nullable=False)
+    depth = Column(Integer, nullable=False)
+    priority = Column(Float, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, done, failed, skipped
+    lastmod = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # Nạp lại các URL còn pending khi resume
+        Index("ix_crawl_frontier_pending", crawl_id, status),
+    )
+
+class FaqEntry(Base):
+    """
+    Câu trả lời dựng sẵn cho một cụm câu hỏi thường gặp
+
+    centroid là tâm cụm (để tra nhanh trong bộ nhớ), question_embedding là embedding
+    của câu hỏi đại diện (dùng để retrieval lại khi kiểm tra câu trả lời còn đúng không).
+    """
+    __tablename__ = "faq_entries"
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    question = Column(Text, nullable=False)  # Câu hỏi đại diện (gần tâm cụm nhất)
+    embedding_version = Column(String, nullable=False)
+    centroid = Column(Vector(), nullable=False)
+    question_embedding = Column(Vector(), nullable=False)
+    threshold = Column(Float, nullable=False)  # Similarity tối thiểu để câu hỏi mới thuộc cụm
+    cluster_size = Column(Integer, nullable=False)
+    answer = Column(Text, nullable=False)
+    sources = Column(JSONB, default=list)  # SearchResult đã dùng để sinh câu trả lời
+    status = Column(String, nullable=False, default="approved")  # approved, pending, rejected, stale
+    checked_at = Column(DateTime, default=datetime.utcnow)  # Lần cuối đối chiếu với corpus
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class RateLimitBucket(Base):
+    """
+    Token bucket của một client cho một nhóm route, dùng chung giữa các worker
+
+    UNLOGGED: không ghi WAL, mất khi database crash thì các bucket chỉ đơn giản đầy lại.
+    """
+    __tablename__ = "rate_limit_buckets"
+    
+    key = Column(String, primary_key=True)  # "<route class>:<client>"
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+    
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
 
 def get_db():
     db = SessionLocal()
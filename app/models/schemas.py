@@ -7,6 +7,7 @@ class WebsiteRequest(BaseModel):
     url: HttpUrl
     max_depth: int = 2
     max_pages: int = 10
+    collection: str = "default"
 
 class DocumentCreate(BaseModel):
     url: str
@@ -23,22 +24,88 @@ class DocumentResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SearchFilters(BaseModel):
+    domain: Optional[str] = None
+    url_prefix: Optional[str] = None
+    scraped_after: Optional[datetime] = None
+    scraped_before: Optional[datetime] = None
+    metadata: Optional[Dict[str, Any]] = None
+
 class SearchRequest(BaseModel):
     query: str
     max_results: int = 5
     similarity_threshold: float = 0.7
+    filters: Optional[SearchFilters] = None
+    collection: str = "default"
 
 class SearchResult(BaseModel):
     content: str
     similarity: float
     document_url: str
     document_title: str
+    document_id: Optional[UUID] = None
+    chunk_index: Optional[int] = None
+    section_index: Optional[int] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    max_results: int = 5
+    similarity_threshold: float = 0.7
+    filters: Optional[SearchFilters] = None
+    collection: str = "default"
+
+class BatchSearchResponse(BaseModel):
+    results: List[List[SearchResult]]
 
 class ChatRequest(BaseModel):
     message: str
     conversation_id: Optional[str] = None
+    collection: str = "default"
 
 class ChatResponse(BaseModel):
     response: str
     sources: List[SearchResult]
-    conversation_id: str
\ No newline at end of file
+    conversation_id: str
+class BulkDeleteRequest(BaseModel):
+    domain: Optional[str] = None
+    url_prefix: Optional[str] = None
+    older_than_days: Optional[int] = None
+    collection: Optional[str] = None
+    batch_size: int = 500
+    vacuum: bool = False  # VACUUM (ANALYZE) sau khi xóa
+    reindex: bool = False  # REINDEX CONCURRENTLY các index ANN sau khi xóa
+
+class MaintenanceJobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+
+class FaqBuildRequest(BaseModel):
+    question_files: List[str]  # File trên server: JSONL (question/message/query/title) hoặc text
+    n_clusters: Optional[int] = None
+    min_cluster_size: Optional[int] = None
+
+class EmbeddingVersionCreate(BaseModel):
+    name: str  # Chữ thường, số và "_"
+    model: str
+    dimension: int
+
+class CollectionSource(BaseModel):
+    url: HttpUrl
+    max_depth: int = 2
+    max_pages: int = 10
+
+class CollectionCreate(BaseModel):
+    name: str  # Chữ thường, số và "_", tối đa 20 ký tự
+    description: Optional[str] = None
+    prompt_tenant: Optional[str] = None  # Thư mục trong prompt_template_dir, mặc định settings.prompt_tenant
+    embedding_version: Optional[str] = None  # Mặc định phiên bản active
+    chunk_size: Optional[int] = None
+    chunk_overlap: Optional[int] = None
+    chunking_mode: Optional[str] = None  # semantic hoặc structured
+    sources: List[CollectionSource] = []
+
+class ProfilingUpdate(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = None  # 0..1
+    slow_ms: Optional[float] = None
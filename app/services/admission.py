@@ -0,0 +1,322 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import asyncio
+import hashlib
+import heapq
+import itertools
+import re
+import threading
+import time
+import logging
+
+from sqlalchemy import text
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class RouteClass:
+    """Nhóm route có chung độ ưu tiên (0 cao nhất), giới hạn đồng thời và token bucket cho mỗi client"""
+    name: str
+    priority: int
+    max_concurrency: int
+    rate_per_minute: float
+    burst: int
+
+# (method, path, nhóm); method None là mọi method. Route không khớp không bị giới hạn.
+ROUTE_RULES = [
+    ("POST", re.compile(r"^/api/v1/chat/message$"), "interactive"),
+    ("POST", re.compile(r"^/api/v1/search/semantic$"), "interactive"),
+    ("POST", re.compile(r"^/api/v1/search/batch$"), "batch"),
+    ("GET", re.compile(r"^/api/v1/scraping/documents/export$"), "batch"),
+    ("POST", re.compile(r"^/api/v1/scraping/scrape-website$"), "ingest"),
+    ("POST", re.compile(r"^/api/v1/scraping/crawls/[^/]+/resume$"), "ingest"),
+    ("POST", re.compile(r"^/api/v1/scraping/collections/[^/]+/crawl$"), "ingest"),
+    (None, re.compile(r"^/api/v1/admin/"), "admin"),
+]
+
+def default_route_classes() -> Dict[str, RouteClass]:
+    return {
+        "interactive": RouteClass("interactive", 0, settings.admission_interactive_concurrency,
+                                  settings.admission_interactive_rate_per_minute, settings.admission_interactive_burst),
+        "admin": RouteClass("admin", 1, settings.admission_admin_concurrency,
+                            settings.admission_admin_rate_per_minute, settings.admission_admin_burst),
+        "batch": RouteClass("batch", 2, settings.admission_batch_concurrency,
+                            settings.admission_batch_rate_per_minute, settings.admission_batch_burst),
+        "ingest": RouteClass("ingest", 3, settings.admission_ingest_concurrency,
+                             settings.admission_ingest_rate_per_minute, settings.admission_ingest_burst),
+    }
+
+class MemoryBucketStore:
+    """
+    Token bucket trong bộ nhớ của worker
+
+    Giữ tối đa max_keys bucket (LRU); bucket bị loại chỉ đơn giản đầy lại ở lần sau.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        """
+        Lấy một token
+
+        Args:
+            key: Bucket ("<nhóm>:<client>")
+            rate: Token được nạp lại mỗi giây
+            burst: Dung lượng bucket
+
+        Returns:
+            float: 0 nếu được phép, ngược lại số giây cần chờ tới token tiếp theo
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (float(burst), now))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                wait = 0.0
+            else:
+                self._buckets[key] = (tokens, now)
+                wait = (1 - tokens) / rate if rate > 0 else 60.0
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+class PostgresBucketStore:
+    """
+    Token bucket trong bảng UNLOGGED rate_limit_buckets, dùng chung giữa các worker/instance
+
+    Mỗi lần lấy token là một câu INSERT ... ON CONFLICT DO UPDATE nguyên tử; lượng
+    token được nạp lại tính từ updated_at nên không cần job nạp định kỳ.
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._calls = itertools.count(1)
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        refilled = "LEAST(:burst, b.tokens + EXTRACT(EPOCH FROM clock_timestamp() - b.updated_at) * :rate)"
+        params = {"key": key, "rate": rate, "burst": burst}
+
+        with self.engine.begin() as conn:
+            allowed = conn.execute(text(f"""
+                INSERT INTO rate_limit_buckets AS b (key, tokens, updated_at)
+                VALUES (:key, :burst - 1, clock_timestamp())
+                ON CONFLICT (key) DO UPDATE
+                SET tokens = {refilled} - 1, updated_at = clock_timestamp()
+                WHERE {refilled} >= 1
+                RETURNING b.tokens
+            """), params).first()
+            if allowed is not None:
+                wait = 0.0
+            else:
+                tokens = conn.execute(text(f"SELECT {refilled} FROM rate_limit_buckets b WHERE b.key = :key"),
+                                      params).scalar() or 0.0
+                wait = (1 - tokens) / rate if rate > 0 else 60.0
+
+            # Bucket không dùng lâu hơn một giờ đã đầy từ lâu, xóa để bảng không phình ra
+            if next(self._calls) % self.PRUNE_EVERY == 0:
+                conn.execute(text(
+                    "DELETE FROM rate_limit_buckets WHERE updated_at < clock_timestamp() - interval '1 hour'"
+                ))
+        return wait
+
+def _hash_key(api_key: str) -> str:
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+class AdmissionController:
+    """
+    Giới hạn tốc độ theo client và điều phối slot xử lý theo độ ưu tiên
+
+    Mỗi worker có admission_max_concurrency slot. Nhóm interactive được giữ riêng
+    admission_interactive_reserved slot, các nhóm khác chỉ dùng phần còn lại và
+    không vượt quá max_concurrency của nhóm. Request không có slot ngay thì vào hàng
+    đợi chung theo độ ưu tiên: khi một slot được trả, request ưu tiên cao nhất có
+    thể chạy được nhận slot trước, nên chat không bị ingest hay batch search chiếm chỗ.
+    Hàng đợi đầy hoặc chờ quá admission_queue_timeout_seconds thì từ chối ngay.
+
+    Trạng thái slot chỉ được đọc/ghi trên event loop nên không cần lock.
+    """
+
+    def __init__(self, classes: Dict[str, RouteClass], capacity: int, interactive_reserved: int,
+                 max_queue: int, queue_timeout: float, store, api_keys: Optional[List[str]] = None):
+        self.classes = classes
+        # Chỉ API key đã cấu hình mới có bucket riêng; key lạ dùng bucket của IP
+        self._api_key_hashes = {_hash_key(key) for key in api_keys or []}
+        self.capacity = capacity
+        self.interactive_reserved = interactive_reserved
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.store = store
+        # Store dùng database chạy ngoài event loop, trên executor riêng thay vì threadpool của route
+        self._store_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="admission") \
+            if isinstance(store, PostgresBucketStore) else None
+
+        self._total = 0
+        self._in_flight = {name: 0 for name in classes}
+        self._waiting = {name: 0 for name in classes}
+        self._queue: List[tuple] = []  # (priority, seq, class name, future)
+        self._seq = itertools.count()
+
+        self.stats = {
+            name: {"admitted": 0, "queued": 0, "rate_limited": 0, "queue_full": 0, "queue_timeouts": 0}
+            for name in classes
+        }
+
+    def classify(self, method: str, path: str) -> Optional[RouteClass]:
+        for rule_method, pattern, name in ROUTE_RULES:
+            if (rule_method is None or rule_method == method) and pattern.match(path):
+                return self.classes.get(name)
+        return None
+
+    def client_key(self, headers: Dict[str, str], client_host: Optional[str]) -> str:
+        """
+        API key (chỉ lưu hash) nếu key nằm trong admission_api_keys, ngược lại IP của client
+
+        Key không được kiểm tra thì không dùng làm bucket: client gửi key ngẫu nhiên
+        mỗi request sẽ nhận bucket đầy mỗi lần.
+        """
+        api_key = headers.get("x-api-key")
+        if api_key:
+            key_hash = _hash_key(api_key)
+            if key_hash in self._api_key_hashes:
+                return "key:" + key_hash
+        forwarded = headers.get("x-forwarded-for")
+        if settings.admission_trust_forwarded_for and forwarded:
+            return "ip:" + forwarded.split(",")[0].strip()
+        return "ip:" + (client_host or "unknown")
+
+    async def check_rate(self, route_class: RouteClass, client: str) -> float:
+        """Số giây client phải chờ (0 nếu được phép); lỗi của store thì cho qua"""
+        key = f"{route_class.name}:{client}"
+        rate = route_class.rate_per_minute / 60.0
+        try:
+            if self._store_executor is None:
+                wait = self.store.take(key, rate, route_class.burst)
+            else:
+                wait = await asyncio.get_running_loop().run_in_executor(
+                    self._store_executor, self.store.take, key, rate, route_class.burst
+                )
+        except Exception as e:
+            logger.warning(f"Rate limit store failed, allowing request: {str(e)}")
+            return 0.0
+
+        if wait > 0:
+            self.stats[route_class.name]["rate_limited"] += 1
+        return wait
+
+    def _can_admit(self, route_class: RouteClass) -> bool:
+        limit = self.capacity if route_class.name == "interactive" else self.capacity - self.interactive_reserved
+        return self._total < limit and self._in_flight[route_class.name] < route_class.max_concurrency
+
+    def _admit(self, route_class: RouteClass):
+        self._total += 1
+        self._in_flight[route_class.name] += 1
+        self.stats[route_class.name]["admitted"] += 1
+
+    async def acquire(self, route_class: RouteClass) -> Optional[str]:
+        """
+        Chờ slot cho request
+
+        Returns:
+            Optional[str]: None nếu đã nhận slot (phải gọi release), ngược lại lý do từ chối
+        """
+        # Request đang chờ đều không chạy được với trạng thái hiện tại (slot trống được cấp
+        # ngay trong release), nên request mới chạy được thì không vượt lên ai
+        if self._can_admit(route_class):
+            self._admit(route_class)
+            return None
+
+        if self._waiting[route_class.name] >= self.max_queue:
+            self.stats[route_class.name]["queue_full"] += 1
+            return "queue_full"
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (route_class.priority, next(self._seq), route_class.name, future))
+        self._waiting[route_class.name] += 1
+        self.stats[route_class.name]["queued"] += 1
+
+        try:
+            # wait_for trả về kết quả nếu slot được cấp đúng lúc hết thời gian
+            await asyncio.wait_for(future, self.queue_timeout)
+            return None
+        except asyncio.TimeoutError:
+            self._waiting[route_class.name] -= 1
+            self.stats[route_class.name]["queue_timeouts"] += 1
+            return "queue_timeout"
+        except asyncio.CancelledError:
+            # Client ngắt kết nối khi đang chờ
+            if future.done() and not future.cancelled():
+                self.release(route_class)
+            else:
+                self._waiting[route_class.name] -= 1
+            raise
+
+    def release(self, route_class: RouteClass):
+        self._total -= 1
+        self._in_flight[route_class.name] -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Cấp slot trống cho các request đang chờ, theo thứ tự ưu tiên"""
+        skipped = []
+        while self._queue and self._total < self.capacity:
+            entry = heapq.heappop(self._queue)
+            _, _, name, future = entry
+            if future.done():  # Đã hết thời gian chờ
+                continue
+            route_class = self.classes[name]
+            if self._can_admit(route_class):
+                self._waiting[name] -= 1
+                self._admit(route_class)
+                future.set_result(True)
+            else:
+                skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._queue, entry)
+
+    def get_stats(self) -> dict:
+        return {
+            "capacity": self.capacity,
+            "interactive_reserved": self.interactive_reserved,
+            "in_flight": self._total,
+            "backend": type(self.store).__name__,
+            "classes": {
+                name: {
+                    **self.stats[name],
+                    "in_flight": self._in_flight[name],
+                    "waiting": self._waiting[name],
+                    "max_concurrency": route_class.max_concurrency,
+                    "rate_per_minute": route_class.rate_per_minute,
+                    "burst": route_class.burst
+                }
+                for name, route_class in self.classes.items()
+            }
+        }
+
+def _create_controller() -> AdmissionController:
+    if settings.admission_bucket_backend == "postgres":
+        from app.models.database import engine
+        store = PostgresBucketStore(engine)
+    else:
+        store = MemoryBucketStore()
+
+    return AdmissionController(
+        default_route_classes(),
+        capacity=settings.admission_max_concurrency,
+        interactive_reserved=settings.admission_interactive_reserved,
+        max_queue=settings.admission_max_queue,
+        queue_timeout=settings.admission_queue_timeout_seconds,
+        store=store,
+        api_keys=[key.strip() for key in settings.admission_api_keys.split(",") if key.strip()]
+    )
+
+admission_controller = _create_controller()
@@ -1,68 +1,142 @@
-import google.generativeai as genai
 from typing import List, Dict, Optional
 import logging
+import time
 from uuid import uuid4
 
 from app.config import settings
 from app.services.vector_store import PgVectorStore
 from app.models.schemas import SearchResult
+from app.services.conversation import (
+    QueryCondenser, HistorySummarizer, conversation_store, chat_metrics
+)
+from app.services.collection_registry import CollectionInfo, collection_registry
+from app.services.faq import faq_index
+from app.services.llm_gateway import get_llm_gateway
+from app.services.prompts import PromptTemplates, get_prompt_templates
+from app.utils.helpers import estimate_tokens
+from app.utils.lazy import LazyModule
+
+genai = LazyModule("google.generativeai")
 
 logger = logging.getLogger(__name__)
 
 class RAGChatbot:
     def __init__(self, vector_store: PgVectorStore):
         genai.configure(api_key=settings.google_api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash')
+        self.templates = get_prompt_templates()
+        # Giới hạn đồng thời, deadline và các tầng dự phòng dùng chung cho cả process
+        self.gateway = get_llm_gateway()
         self.vector_store = vector_store
-        self.conversations: Dict[str, List[Dict]] = {}
+        # Hội thoại dùng chung giữa các instance (mỗi request có một instance riêng)
+        self.conversations = conversation_store
+        self.metrics = chat_metrics
+        
+        # Viết lại câu hỏi và tóm tắt lịch sử qua tầng helper của gateway
+        self.condenser = QueryCondenser(self.gateway, self.metrics)
+        self.summarizer = HistorySummarizer(self.gateway, self.metrics)
     
-    def chat(self, message: str, conversation_id: Optional[str] = None) -> tuple[str, List[SearchResult], str]:
+    def chat(self, message: str, conversation_id: Optional[str] = None,
+             collection: Optional[CollectionInfo] = None) -> tuple[str, List[SearchResult], str]:
         """
         Xử lý chat với RAG
         
         Args:
             message: Tin nhắn từ user
             conversation_id: ID cuộc hội thoại
+            collection: Collection để retrieval và lấy prompt, mặc định collection default
             
         Returns:
             tuple: (response, sources, conversation_id)
         """
         try:
+            turn_started = time.perf_counter()
+            collection = collection or collection_registry.default()
+            templates = get_prompt_templates(collection.prompt_tenant)
+            
             # Tạo conversation_id mới nếu chưa có
             if not conversation_id:
                 conversation_id = str(uuid4())
             
+            state = self.conversations.get(conversation_id)
+            
+            # Viết lại câu hỏi nối tiếp thành câu truy vấn độc lập
+            query = self.condenser.condense(message, state)
+            
+            # Embed một lần, dùng cho cả tra FAQ và vector search
+            version = collection_registry.search_version(collection)
+            query_embedding = self.vector_store.embed_query(query, version)
+            
+            # Câu hỏi thường gặp: trả lời dựng sẵn, bỏ qua retrieval và generate
+            # (FAQ được dựng từ collection default)
+            use_faq = settings.faq_enabled and collection.is_default
+            faq = faq_index.lookup(query_embedding, version.name) if use_faq else None
+            if faq is not None:
+                state.last_query = query
+                self._update_conversation(conversation_id, message, faq.answer)
+                self.metrics.increment("faq_answers")
+                faq_index.record_turn(hit=True, latency_ms=(time.perf_counter() - turn_started) * 1000)
+                logger.info("Answered conversation %s from FAQ %s (%.3f)", conversation_id, faq.id, faq.similarity)
+                return faq.answer, faq.sources, conversation_id
+            
             # Tìm kiếm context từ vector store
             search_results = self.vector_store.semantic_search(
-                query=message,
+                query=query,
                 max_results=settings.max_results,
-                similarity_threshold=settings.similarity_threshold
+                similarity_threshold=settings.similarity_threshold,
+                version=version,
+                query_embedding=query_embedding,
+                collection=collection
             )
             
+            # Mở rộng hit thành chunk lân cận/section (không tốn thêm vector search)
+            search_results = self.vector_store.expand_results(search_results)
+            
             # Tạo context từ search results
             context = self._build_context(search_results)
             
-            # Lấy conversation history
-            history = self.conversations.get(conversation_id, [])
-            
-            # Tạo prompt
-            prompt = self._build_prompt(message, context, history)
+            # Tạo prompt từ tóm tắt + các lượt gần nhất
+            prompt = self._build_prompt(message, context, state.turns, state.summary, templates)
             
-            # Gọi Gemini
-            response = self.model.generate_content(prompt)
+            # Gọi Gemini qua gateway (model dự phòng hoặc câu trả lời trích xuất khi quá tải)
+            started = time.perf_counter()
+            result = self.gateway.generate(prompt, search_results, tenant=templates.tenant)
+            latency_ms = (time.perf_counter() - started) * 1000
+            response = result.response
             
             # Lưu vào conversation history
-            self._update_conversation(conversation_id, message, response.text)
+            state.last_query = query
+            self._update_conversation(conversation_id, message, result.text)
             
-            logger.info(f"Generated response for conversation {conversation_id}")
+            self.metrics.record_turn(
+                prompt_tokens=self._prompt_tokens(response, prompt, templates),
+                history_tokens=estimate_tokens(state.summary) + sum(
+                    estimate_tokens(turn["user"] + turn["assistant"]) for turn in state.turns
+                ),
+                hit=bool(search_results),
+                latency_ms=latency_ms,
+                cached_tokens=getattr(getattr(response, "usage_metadata", None), "cached_content_token_count", 0) or 0
+            )
+            self.metrics.increment(f"{result.tier}_answers")
+            if use_faq:
+                faq_index.record_turn(hit=False, latency_ms=(time.perf_counter() - turn_started) * 1000)
+            logger.info("Generated response for conversation %s in %s (%s)",
+                        conversation_id, collection.name, result.tier)
             
-            return response.text, search_results, conversation_id
+            return result.text, search_results, conversation_id
             
         except Exception as e:
             logger.error(f"Error in chat: {str(e)}")
             error_response = "Dạ, em gặp sự cố khi xử lý câu hỏi của anh/chị. Anh/chị vui lòng thử lại ạ."
             return error_response, [], conversation_id or str(uuid4())
     
+    def _prompt_tokens(self, response, prompt: str, templates: Optional[PromptTemplates] = None) -> int:
+        """Số token input thực tế nếu provider trả về, ngược lại ước lượng"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None and getattr(usage, "prompt_token_count", None):
+            return usage.prompt_token_count
+        
+        return estimate_tokens(prompt) + estimate_tokens((templates or self.templates).system_instruction)
+    
     def _build_context(self, search_results: List[SearchResult]) -> str:
         """Xây dựng context từ search results"""
         if not search_results:
@@ -74,75 +148,38 @@ class RAGChatbot:
         
         return "\n".join(context_parts)
     
-    def _build_prompt(self, question: str, context: str, history: List[Dict]) -> str:
-        """Xây dựng prompt cho TuanVu"""
+    def _build_prompt(self, question: str, context: str, history: List[Dict], summary: str = "",
+                      templates: Optional[PromptTemplates] = None) -> str:
+        """Xây dựng phần động của prompt (phần tĩnh nằm trong system instruction)"""
         
         # Xây dựng history string
-        history_str = ""
+        history_str = f"(Tóm tắt các lượt trước) {summary}\n\n" if summary else ""
         for exchange in history[-10:]:  # Chỉ lấy 10 lượt cuối
             history_str += f"Khách hàng: {exchange['user']}\nTuanVu: {exchange['assistant']}\n\n"
         
-        system_prompt = f"""Bạn là TuanVu, nhân viên hỗ trợ khách hàng của VPBank.
-
-# Mục tiêu
-Dựa trên lịch sử trò chuyện và hướng dẫn trả lời, cung cấp thông tin chính xác, ngắn gọn và dễ hiểu cho Câu hỏi của khách hàng. Giữ cuộc hội thoại tự nhiên, chuyên nghiệp nhưng vẫn thân thiện.
-
-# Lịch sử trò chuyện:
-{history_str}
-
-# Câu hỏi của khách hàng:
-{question}
-
-# Hướng dẫn trả lời:
-- Chỉ sử dụng **Cơ sở kiến thức** làm nguồn dữ liệu về sản phẩm và dịch vụ của VPBank. Không sử dụng các thông tin bên ngoài mà bạn có được ngoài **Cơ sở kiến thức**. Không sử dụng bình luận hay đánh giá của khách hàng để trả lời.
-- Nếu tên thẻ hoặc sản phẩm không xuất hiện chính xác trong Cơ sở kiến thức, bạn KHÔNG được phép suy đoán, mô tả, hay đưa ra bất kỳ thông tin nào về sản phẩm đó.
-- Tuyệt đối KHÔNG đưa ra mô tả, lợi ích, hay ưu đãi của bất kỳ sản phẩm nào nếu không có dữ liệu đó trong Cơ sở kiến thức.
-- Nếu không thấy thông tin về sản phẩm, hãy trả lời đúng mẫu: "Dạ, em kiểm tra thì hiện tại VPBank chưa có sản phẩm [...] trong danh mục, anh/chị có thể kiểm tra lại giúp em tên sản phẩm không ạ?"
-
-"Cơ sở kiến thức"
-{context}
-
-- Khách hàng hỏi bằng tiếng Việt, trả lời bằng tiếng Việt. Khách hàng hỏi bằng ngôn ngữ khác tiếng Việt, trả lời bằng tiếng Anh. Nếu không chắc chắn về ngôn ngữ, trả lời bằng tiếng Việt. Khi trả lời khách hàng bằng tiếng Việt, xưng hô với khách hàng là "Anh/Chị", gọi bản thân là "Em" và sử dụng các từ lịch sự như "Dạ," "Vâng," "ạ" một cách tự nhiên, không mở đầu bằng lời chào như "Hello" hay "Hi".
-- Đối với các vấn đề đăng nhập hoặc các trường hợp cần liên hệ tổng đài, chỉ cung cấp số hotline nếu thực sự cần thiết để giải quyết vấn đề. Khi đề cập đến hotline, cần nêu cả hai số:
-  - Khách hàng ưu tiên (KHƯT): 1800545415
-  - Khách hàng tiêu chuẩn (KHCN): 1900545415. Đảm bảo số hotline được lồng ghép tự nhiên trong cuộc hội thoại thay vì liệt kê một cách cứng nhắc.
-- Nếu khách hàng hỏi về KH pre-private và offical-private, thì cung cấp số hotline này: 1800888969
-- Nếu khách hàng ở nước ngoài cần hỗ trợ, hướng dẫn họ gọi **+84 24 3928 8880 đối với Khách hàng tiêu chuẩn hoặc +84 24 7300 6699 đối với Khách hàng ưu tiên** để được hỗ trợ.
-- Nếu có thông tin phù hợp trong "Cơ sở kiến thức", cung cấp câu trả lời kèm đường link liên quan.
-- Nếu thông tin có trên một hoặc nhiều kênh sau, đề cập đến kênh phù hợp theo thứ tự ưu tiên này: Ứng dụng VPBank NEO → Website VPBank → Dịch vụ tổng đài tự động → Đến chi nhánh. Nếu thông tin không có ở kênh nào, không nhắc đến kênh đó. Nếu thông tin không được tìm thấy ở tất cả các kênh, xử lý như trường hợp không tìm thấy thông tin trong "Cơ sở kiến thức".
-- Nếu không tìm thấy thông tin trong "Cơ sở kiến thức", hướng dẫn khách hàng các phương án sau:
-  1. Gửi yêu cầu tại https://cskh.vpbank.com.vn/
-  2. Gửi email đến chamsockhachhang@vpbank.com.vn
-- Nếu câu hỏi chưa rõ ràng, chủ động đặt câu hỏi để làm rõ.
-- Nếu khách hàng trò chuyện xã giao, trả lời thân thiện.
-- Nếu khách hàng chào tạm biệt hoặc không có yêu cầu nào khác, kết thúc bằng lời tạm biệt lịch sự.
-- Nếu khách hàng khen ngợi, bày tỏ sự cảm ơn.
-- Nếu khách hàng hỏi về thẻ, khoản vay, bảo hiểm, thì hãy giới thiệu chương trình ưu đãi kèm đường dẫn đăng ký: **https://tenant-caip.vpbank.com.vn/r/dang-ky-mo-the-mo-vay**. Không đề cập đến phí hoặc lãi suất trừ khi khách hàng hỏi trực tiếp.
-- Luôn đề nghị hỗ trợ thêm nếu câu trả lời chưa có phần này, đảm bảo cuộc trò chuyện tự nhiên và phù hợp với ngữ cảnh.
-
-TRẢ LỜI:"""
-
-        return system_prompt
+        return (templates or self.templates).render_turn(question=question, context=context, history=history_str)
     
     def _update_conversation(self, conversation_id: str, user_message: str, assistant_response: str):
         """Cập nhật lịch sử hội thoại"""
-        if conversation_id not in self.conversations:
-            self.conversations[conversation_id] = []
+        state = self.conversations.get(conversation_id)
         
-        self.conversations[conversation_id].append({
+        state.turns.append({
             "user": user_message,
             "assistant": assistant_response
         })
         
+        # Tóm tắt các lượt cũ khi lịch sử vượt ngưỡng token
+        self.summarizer.maybe_summarize(state)
+        
         # Giữ tối đa 10 lượt hội thoại
-        if len(self.conversations[conversation_id]) > 10:
-            self.conversations[conversation_id] = self.conversations[conversation_id][-10:]
+        if len(state.turns) > 10:
+            state.turns = state.turns[-10:]
     
     def clear_conversation(self, conversation_id: str):
         """Xóa lịch sử hội thoại"""
-        if conversation_id in self.conversations:
-            del self.conversations[conversation_id]
+        self.conversations.clear(conversation_id)
     
     def get_conversation_history(self, conversation_id: str) -> List[Dict]:
         """Lấy lịch sử hội thoại"""
-        return self.conversations.get(conversation_id, [])
+        state = self.conversations.peek(conversation_id)
+        return state.turns if state else []
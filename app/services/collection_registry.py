@@ -0,0 +1,335 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import json
+import re
+import threading
+import time
+import logging
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.models.database import SessionLocal, engine
+from app.services.embedding_versions import INDEX_EXPRESSIONS, LEGACY_VERSION, VersionInfo, embedding_registry
+from app.services.partitions import partition_manager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = "default"
+# Tên collection được chèn trực tiếp vào predicate của partial index và câu ANN
+COLLECTION_NAME_PATTERN = re.compile(r"^[a-z0-9_]{1,20}$")
+CHUNKING_MODES = ("semantic", "structured")
+MAX_INDEX_NAME_LENGTH = 63
+
+# Index ANN trên cột chunks.embedding (phiên bản legacy), cùng biểu thức với câu ANN của PgVectorStore
+LEGACY_INDEX_EXPRESSIONS = {
+    "vector": "embedding vector_cosine_ops",
+    "halfvec": "(embedding::halfvec({dimension})) halfvec_cosine_ops",
+    "binary": "(binary_quantize(embedding)::bit({dimension})) bit_hamming_ops",
+}
+
+@dataclass(frozen=True)
+class CollectionInfo:
+    name: str
+    description: Optional[str]
+    prompt_tenant: Optional[str]  # None là settings.prompt_tenant
+    embedding_version: Optional[str]  # None là phiên bản active
+    chunk_size: int
+    chunk_overlap: int
+    chunking_mode: str
+    sources: tuple = ()  # {"url", "max_depth", "max_pages"}
+
+    @property
+    def is_default(self) -> bool:
+        return self.name == DEFAULT_COLLECTION
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.description,
+            "prompt_tenant": self.prompt_tenant or settings.prompt_tenant,
+            "embedding_version": self.embedding_version,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "chunking_mode": self.chunking_mode,
+            "sources": list(self.sources)
+        }
+
+def default_collection() -> CollectionInfo:
+    return CollectionInfo(DEFAULT_COLLECTION, None, None, None, settings.chunk_size, settings.chunk_overlap,
+                          settings.chunking_mode)
+
+def collection_index_name(collection: str, version: str) -> str:
+    """Tên partial index ANN của collection cho một phiên bản embedding"""
+    return f"ix_coll_{collection}_{version}"
+
+class CollectionRegistry:
+    """
+    Danh sách collection, cache trong process
+
+    Được đọc lại từ bảng collections mỗi collection_refresh_seconds. Collection
+    "default" (dữ liệu có từ trước khi có collection) luôn tồn tại, với cấu hình từ
+    settings nếu bảng không có dòng riêng cho nó.
+    """
+
+    def __init__(self):
+        self._collections: Dict[str, CollectionInfo] = {DEFAULT_COLLECTION: default_collection()}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        db = SessionLocal()
+        try:
+            rows = db.execute(text("""
+                SELECT name, description, prompt_tenant, embedding_version, chunk_size, chunk_overlap,
+                       chunking_mode, sources
+                FROM collections
+            """)).fetchall()
+            collections = {
+                row.name: CollectionInfo(
+                    row.name, row.description, row.prompt_tenant, row.embedding_version,
+                    row.chunk_size, row.chunk_overlap, row.chunking_mode, tuple(row.sources or [])
+                )
+                for row in rows
+            }
+        except Exception as e:
+            logger.warning(f"Error loading collections: {str(e)}")
+            collections = None
+        finally:
+            db.close()
+
+        with self._lock:
+            if collections is not None:
+                collections.setdefault(DEFAULT_COLLECTION, default_collection())
+                self._collections = collections
+            self._loaded_at = time.monotonic()
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._loaded_at >= settings.collection_refresh_seconds:
+            self.refresh()
+
+    def get(self, name: str) -> Optional[CollectionInfo]:
+        self._maybe_refresh()
+        with self._lock:
+            return self._collections.get(name)
+
+    def default(self) -> CollectionInfo:
+        return self.get(DEFAULT_COLLECTION) or default_collection()
+
+    def list(self) -> List[CollectionInfo]:
+        self._maybe_refresh()
+        with self._lock:
+            return sorted(self._collections.values(), key=lambda collection: collection.name)
+
+    def search_version(self, collection: CollectionInfo) -> VersionInfo:
+        """
+        Phiên bản embedding search trong collection: phiên bản đã chọn, mặc định phiên bản active
+
+        Raises:
+            ValueError: Phiên bản đã chọn không còn tồn tại
+        """
+        if not collection.embedding_version:
+            return embedding_registry.active()
+
+        version = embedding_registry.get(collection.embedding_version)
+        if version is None:
+            raise ValueError(f"Unknown embedding version {collection.embedding_version} "
+                             f"for collection {collection.name}")
+        return version
+
+    def write_targets(self, collection: CollectionInfo) -> List[VersionInfo]:
+        """Các phiên bản cần ghi khi ingest vào collection"""
+        if collection.embedding_version:
+            return [self.search_version(collection)]
+        return embedding_registry.write_targets()
+
+class CollectionService:
+    """Tạo, build index ANN riêng và xóa collection"""
+
+    def __init__(self, registry: CollectionRegistry):
+        self.registry = registry
+
+    def create(self, db, name: str, description: Optional[str] = None, prompt_tenant: Optional[str] = None,
+               embedding_version: Optional[str] = None, chunk_size: Optional[int] = None,
+               chunk_overlap: Optional[int] = None, chunking_mode: Optional[str] = None,
+               sources: Optional[List[dict]] = None) -> CollectionInfo:
+        """
+        Đăng ký collection mới (chưa có dữ liệu và index)
+
+        Raises:
+            ValueError: Tên, cấu hình chunking, phiên bản embedding hoặc prompt tenant không hợp lệ
+        """
+        from app.services.prompts import get_prompt_templates
+
+        if not COLLECTION_NAME_PATTERN.match(name):
+            raise ValueError(f"Invalid collection name: {name}")
+
+        chunk_size = chunk_size or settings.chunk_size
+        chunk_overlap = settings.chunk_overlap if chunk_overlap is None else chunk_overlap
+        chunking_mode = chunking_mode or settings.chunking_mode
+        if chunk_size <= 0 or not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be smaller than chunk_size")
+        if chunking_mode not in CHUNKING_MODES:
+            raise ValueError(f"Unknown chunking mode: {chunking_mode}")
+
+        version_name = embedding_version or embedding_registry.active().name
+        if embedding_version and embedding_registry.get(embedding_version) is None:
+            raise ValueError(f"Unknown embedding version: {embedding_version}")
+        if len(collection_index_name(name, version_name)) > MAX_INDEX_NAME_LENGTH:
+            raise ValueError(f"Collection name {name} is too long for embedding version {version_name}")
+
+        if prompt_tenant:
+            try:
+                get_prompt_templates(prompt_tenant)
+            except OSError:
+                raise ValueError(f"Prompt templates not found for tenant: {prompt_tenant}")
+
+        sources = [
+            {"url": source["url"], "max_depth": source.get("max_depth", 2), "max_pages": source.get("max_pages", 10)}
+            for source in sources or []
+        ]
+
+        inserted = db.execute(text("""
+            INSERT INTO collections (name, description, prompt_tenant, embedding_version, chunk_size,
+                                     chunk_overlap, chunking_mode, sources, created_at)
+            VALUES (:name, :description, :prompt_tenant, :embedding_version, :chunk_size,
+                    :chunk_overlap, :chunking_mode, CAST(:sources AS jsonb), now())
+            ON CONFLICT (name) DO NOTHING
+            RETURNING name
+        """), {
+            "name": name, "description": description, "prompt_tenant": prompt_tenant,
+            "embedding_version": embedding_version, "chunk_size": chunk_size, "chunk_overlap": chunk_overlap,
+            "chunking_mode": chunking_mode, "sources": json.dumps(sources)
+        }).first()
+        db.commit()
+
+        if inserted is None:
+            raise ValueError(f"Collection already exists: {name}")
+
+        self.registry.refresh()
+        logger.info(f"Created collection {name} ({version_name}, {chunking_mode} {chunk_size}/{chunk_overlap})")
+        return self.registry.get(name)
+
+    def build_index(self, name: str, rebuild: bool = False, progress: Optional[dict] = None) -> dict:
+        """
+        Partial index ANN của collection cho phiên bản embedding nó search, theo embedding_index_mode
+
+        Phiên bản legacy: index trên chunks. chunks là bảng partition nên CREATE INDEX
+        CONCURRENTLY không chạy được trên bảng cha; index rỗng được tạo ON ONLY chunks,
+        mỗi partition được build CONCURRENTLY rồi ATTACH (partition tạo sau tự có index).
+        Phiên bản khác: index CONCURRENTLY trên chunk_embeddings WHERE version AND collection.
+
+        Args:
+            name: Tên collection
+            rebuild: REINDEX CONCURRENTLY nếu index đã có (sau khi crawl lại hoặc xóa nhiều)
+            progress: Dict được cập nhật tiến độ
+
+        Returns:
+            dict: Tên index và các partition đã build
+        """
+        collection = self.registry.get(name)
+        if collection is None:
+            raise ValueError(f"Unknown collection: {name}")
+
+        progress = progress if progress is not None else {}
+        version = self.registry.search_version(collection)
+        index = collection_index_name(collection.name, version.name)
+        if len(index) > MAX_INDEX_NAME_LENGTH:
+            raise ValueError(f"Index name too long: {index}")
+        progress["index"] = index
+        predicate = f"collection = '{collection.name}'"
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": index}).scalar()
+            if exists and rebuild:
+                conn.execute(text(f'REINDEX INDEX CONCURRENTLY "{index}"'))
+                progress["reindexed"] = True
+
+            if not version.is_legacy:
+                expression = INDEX_EXPRESSIONS[settings.embedding_index_mode].format(dimension=version.dimension)
+                conn.execute(text(f"""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}
+                    ON chunk_embeddings USING hnsw ({expression})
+                    WHERE version = '{version.name}' AND {predicate}
+                """))
+            elif not partition_manager.is_partitioned():
+                expression = LEGACY_INDEX_EXPRESSIONS[settings.embedding_index_mode].format(dimension=version.dimension)
+                conn.execute(text(f"""
+                    CREATE INDEX CONCURRENTLY IF NOT EXISTS {index}
+                    ON chunks USING hnsw ({expression}) WHERE {predicate}
+                """))
+            else:
+                expression = LEGACY_INDEX_EXPRESSIONS[settings.embedding_index_mode].format(dimension=version.dimension)
+                conn.execute(text(f"""
+                    CREATE INDEX IF NOT EXISTS {index}
+                    ON ONLY chunks USING hnsw ({expression}) WHERE {predicate}
+                """))
+                partitions = conn.execute(text("""
+                    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = to_regclass('chunks')
+                    ORDER BY c.relname
+                """)).scalars().all()
+                built = progress.setdefault("partitions", [])
+                for partition in partitions:
+                    child = f"{partition}_coll_{collection.name}"
+                    conn.execute(text(f"""
+                        CREATE INDEX CONCURRENTLY IF NOT EXISTS {child}
+                        ON {partition} USING hnsw ({expression}) WHERE {predicate}
+                    """))
+                    # Không làm gì nếu đã attach
+                    conn.execute(text(f"ALTER INDEX {index} ATTACH PARTITION {child}"))
+                    built.append(partition)
+                    logger.info(f"Built index {child} for collection {collection.name}")
+
+        logger.info(f"Built ANN index {index} for collection {collection.name}")
+        return progress
+
+    def drop_indexes(self, name: str) -> List[str]:
+        """Xóa mọi partial index ANN của collection (mọi phiên bản embedding)"""
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            versions = set(conn.execute(text("SELECT name FROM embedding_versions")).scalars().all())
+            versions.add(LEGACY_VERSION)
+            candidates = [collection_index_name(name, version) for version in sorted(versions)]
+            rows = conn.execute(text("""
+                SELECT indexname, tablename FROM pg_indexes
+                WHERE indexname = ANY(:names) AND tablename IN ('chunks', 'chunk_embeddings')
+            """), {"names": candidates}).fetchall()
+
+            for row in rows:
+                # Index của bảng partition không DROP CONCURRENTLY được; index partition bị xóa theo
+                concurrently = "CONCURRENTLY " if row.tablename == "chunk_embeddings" else ""
+                conn.execute(text(f'DROP INDEX {concurrently}IF EXISTS "{row.indexname}"'))
+                logger.info(f"Dropped index {row.indexname}")
+
+        return [row.indexname for row in rows]
+
+    def delete(self, name: str, progress: Optional[dict] = None) -> dict:
+        """
+        Xóa collection: documents (chunks, embeddings theo cascade), index ANN và cấu hình
+
+        Raises:
+            ValueError: Collection không tồn tại hoặc là collection default
+        """
+        from app.services.vector_store import PgVectorStore
+
+        if name == DEFAULT_COLLECTION:
+            raise ValueError("Cannot delete the default collection")
+        if self.registry.get(name) is None:
+            raise ValueError(f"Unknown collection: {name}")
+
+        progress = progress if progress is not None else {}
+        db = SessionLocal()
+        try:
+            PgVectorStore(db).bulk_delete(collection=name, progress=progress)
+            progress["indexes_dropped"] = self.drop_indexes(name)
+            db.execute(text("DELETE FROM collections WHERE name = :name"), {"name": name})
+            db.commit()
+        finally:
+            db.close()
+
+        self.registry.refresh()
+        logger.info(f"Deleted collection {name}: {progress}")
+        return progress
+
+collection_registry = CollectionRegistry()
+collection_service = CollectionService(collection_registry)
@@ -0,0 +1,184 @@
+from bs4 import BeautifulSoup, NavigableString, Tag
+from dataclasses import dataclass
+from typing import Dict, List
+import hashlib
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Các tag không bao giờ chứa nội dung chính
+REMOVED_TAGS = ["script", "style", "noscript", "template", "iframe", "svg",
+                "nav", "footer", "aside"]
+# <header> chỉ bị bỏ khi là header của trang; header trong các tag này chứa tiêu đề nội dung
+CONTENT_SECTION_TAGS = ("main", "article", "section")
+
+# Từ trong class/id/role thường dùng cho banner, menu, popup... (khớp nguyên từ:
+# "social-share" khớp, "shareholder" thì không)
+BOILERPLATE_PATTERN = re.compile(
+    r"(?<![a-z0-9])(cookies?|consent|banner|popup|modal|breadcrumbs?|menu|navbar|social|share|subscribe|newsletter)(?![a-z0-9])",
+    re.IGNORECASE
+)
+# Block khớp marker chỉ bị bỏ khi ngắn hoặc nhiều link: wrapper nội dung chính như
+# "hero-banner", "modal-content" vẫn được giữ
+BOILERPLATE_MAX_CHARS = 500
+
+HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+TEXT_TAGS = {"p", "dt", "dd", "blockquote", "pre", "caption", "figcaption"}
+BLOCK_TAGS = list(HEADING_TAGS | TEXT_TAGS | {
+    "li", "ul", "ol", "dl", "table", "tr", "div", "section", "article", "main", "form", "br"
+})
+
+@dataclass
+class ContentBlock:
+    kind: str  # heading, paragraph, list_item, table_row
+    text: str
+    level: int = 0  # Cấp heading (1-6)
+
+    def render(self) -> str:
+        """Chuyển block thành một dòng text giữ cấu trúc"""
+        if self.kind == "heading":
+            return f"{'#' * self.level} {self.text}"
+        if self.kind == "list_item":
+            return f"- {self.text}"
+        return self.text
+
+class ContentExtractor:
+    """
+    Trích xuất nội dung chính của trang theo từng block DOM
+
+    Mỗi block được chấm điểm theo mật độ link; block gần như toàn link (menu,
+    danh sách liên kết) bị loại. Block lặp lại trên nhiều trang của cùng một
+    site trong một lần crawl được học là boilerplate và bỏ qua ở các trang sau.
+    """
+
+    def __init__(self, boilerplate_min_pages: int = 3, max_link_density: float = 0.5):
+        self.boilerplate_min_pages = boilerplate_min_pages
+        self.max_link_density = max_link_density
+        self._block_pages: Dict[str, int] = {}  # hash block -> số trang đã thấy
+
+    def extract(self, soup: BeautifulSoup) -> List[ContentBlock]:
+        """
+        Trích xuất các block nội dung theo thứ tự trong trang
+
+        Args:
+            soup: HTML đã parse (sẽ bị chỉnh sửa)
+
+        Returns:
+            List[ContentBlock]: Các block nội dung chính
+        """
+        for tag in soup(REMOVED_TAGS):
+            tag.decompose()
+
+        for tag in soup("header"):
+            if not tag.decomposed and tag.find_parent(CONTENT_SECTION_TAGS) is None:
+                tag.decompose()
+
+        for tag in [tag for tag in soup.find_all(True) if self._looks_like_boilerplate(tag)]:
+            if not tag.decomposed:
+                tag.decompose()
+
+        root = soup.find("main") or soup.find("article") or soup.body or soup
+        blocks: List[ContentBlock] = []
+        self._collect(root, blocks)
+
+        return self._drop_repeated(blocks)
+
+    def to_text(self, blocks: List[ContentBlock]) -> str:
+        """Ghép các block thành text có heading, danh sách và bảng"""
+        return "\n".join(block.render() for block in blocks)
+
+    def _looks_like_boilerplate(self, tag: Tag) -> bool:
+        if tag.name in ("html", "body", "main", "article"):
+            return False
+        attrs = getattr(tag, "attrs", None) or {}
+        tokens = list(attrs.get("class", [])) + [attrs.get("id") or "", attrs.get("role") or ""]
+        if not any(BOILERPLATE_PATTERN.search(token) for token in tokens if token):
+            return False
+
+        text = self._normalize(tag.get_text())
+        if len(text) <= BOILERPLATE_MAX_CHARS:
+            return True
+        return self._link_chars(tag) / len(text) > self.max_link_density
+
+    def _collect(self, node: Tag, blocks: List[ContentBlock], inline_kind: str = "paragraph"):
+        """Duyệt DOM; text inline liền nhau được gom thành một block"""
+        inline_parts: List[str] = []
+        inline_link_chars = 0
+
+        def flush():
+            nonlocal inline_link_chars
+            self._add(blocks, "".join(inline_parts), inline_kind, link_chars=inline_link_chars)
+            inline_parts.clear()
+            inline_link_chars = 0
+
+        for child in node.children:
+            if type(child) is NavigableString:
+                inline_parts.append(str(child))
+                continue
+            if not isinstance(child, Tag):
+                continue
+
+            name = child.name
+            if name not in BLOCK_TAGS and not child.find(BLOCK_TAGS):
+                inline_parts.append(child.get_text())
+                inline_link_chars += self._link_chars(child)
+                continue
+
+            flush()
+
+            if name in HEADING_TAGS:
+                self._add(blocks, child.get_text(), "heading", level=int(name[1]))
+            elif name == "table":
+                for row in child.find_all("tr"):
+                    cells = [self._normalize(cell.get_text(" ")) for cell in row.find_all(["th", "td"])]
+                    cells = [cell for cell in cells if cell]
+                    if cells:
+                        blocks.append(ContentBlock("table_row", " | ".join(cells)))
+            elif name == "li":
+                self._collect(child, blocks, inline_kind="list_item")
+            elif name in TEXT_TAGS and not child.find(BLOCK_TAGS):
+                self._add(blocks, child.get_text(), "paragraph", link_chars=self._link_chars(child))
+            else:
+                self._collect(child, blocks)
+
+        flush()
+
+    def _add(self, blocks: List[ContentBlock], text: str, kind: str,
+             level: int = 0, link_chars: int = 0):
+        text = self._normalize(text)
+        if not text:
+            return
+
+        # Block gần như toàn link (menu, danh sách liên kết) không phải nội dung
+        if kind != "heading" and link_chars / len(text) > self.max_link_density:
+            return
+
+        blocks.append(ContentBlock(kind, text, level))
+
+    def _link_chars(self, tag: Tag) -> int:
+        if tag.name == "a":
+            return len(self._normalize(tag.get_text()))
+        return sum(len(self._normalize(link.get_text())) for link in tag.find_all("a"))
+
+    def _drop_repeated(self, blocks: List[ContentBlock]) -> List[ContentBlock]:
+        """Bỏ block đã xuất hiện trên nhiều trang và ghi nhận block của trang này"""
+        kept = []
+        seen_on_page = set()
+
+        for block in blocks:
+            key = hashlib.md5(block.text.lower().encode("utf-8")).hexdigest()
+            if self._block_pages.get(key, 0) >= self.boilerplate_min_pages:
+                continue
+
+            kept.append(block)
+            seen_on_page.add(key)
+
+        for key in seen_on_page:
+            self._block_pages[key] = self._block_pages.get(key, 0) + 1
+
+        return kept
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join(text.split())
@@ -0,0 +1,262 @@
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import re
+import threading
+import time
+import logging
+
+from app.config import settings
+from app.utils.helpers import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Dấu hiệu câu hỏi phụ thuộc ngữ cảnh trước (đại từ, câu hỏi nối tiếp)
+ANAPHORA_PATTERN = re.compile(
+    r"\b(nó|đó|đấy|này|kia|vậy|họ|thế còn|còn|cái đấy|loại đó|loại này|cái này|"
+    r"it|its|that|this|they|them|those|what about|how about)\b",
+    re.IGNORECASE
+)
+
+@dataclass
+class ConversationState:
+    turns: List[Dict] = field(default_factory=list)  # Các lượt chưa được tóm tắt
+    summary: str = ""
+    last_query: Optional[str] = None  # Câu truy vấn độc lập của lượt trước
+    # (last_query, message) -> câu truy vấn độc lập; chỉ giữ key của lượt gần nhất
+    condensed: Dict[tuple, str] = field(default_factory=dict)
+    last_used: float = field(default_factory=time.monotonic)
+
+class ConversationStore:
+    """
+    Lưu hội thoại trong bộ nhớ, dùng chung cho mọi instance RAGChatbot của process
+
+    Hội thoại không dùng quá ttl_seconds bị xóa; khi vượt max_conversations thì xóa
+    hội thoại lâu không dùng nhất (LRU).
+    """
+
+    def __init__(self, max_conversations: int = None, ttl_seconds: float = None):
+        self.max_conversations = max_conversations or settings.conversation_max_count
+        self.ttl_seconds = ttl_seconds or settings.conversation_ttl_seconds
+        self._states: "OrderedDict[str, ConversationState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: str) -> ConversationState:
+        with self._lock:
+            state = self._touch(conversation_id)
+            if state is None:
+                state = self._states[conversation_id] = ConversationState()
+                self._evict()
+            return state
+
+    def peek(self, conversation_id: str) -> Optional[ConversationState]:
+        with self._lock:
+            return self._touch(conversation_id)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._states)
+
+    def _touch(self, conversation_id: str) -> Optional[ConversationState]:
+        """Hội thoại còn hạn (đánh dấu vừa dùng), None nếu không có hoặc đã hết hạn"""
+        state = self._states.get(conversation_id)
+        if state is None:
+            return None
+
+        now = time.monotonic()
+        if now - state.last_used > self.ttl_seconds:
+            del self._states[conversation_id]
+            return None
+
+        state.last_used = now
+        self._states.move_to_end(conversation_id)
+        return state
+
+    def _evict(self):
+        """Xóa hội thoại hết hạn và hội thoại LRU vượt max_conversations (đầu OrderedDict cũ nhất)"""
+        expired_before = time.monotonic() - self.ttl_seconds
+        while self._states:
+            conversation_id, state = next(iter(self._states.items()))
+            if len(self._states) <= self.max_conversations and state.last_used >= expired_before:
+                break
+            del self._states[conversation_id]
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            self._states.pop(conversation_id, None)
+
+class ChatMetrics:
+    """Thống kê kích thước prompt và tỉ lệ retrieval có kết quả theo lượt chat"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.history_tokens = 0
+        self.retrieval_hits = 0
+        self.cached_tokens = 0
+        self.latency_ms = 0.0
+        self.rewritten_queries = 0
+        self.rewrite_cache_hits = 0
+        self.llm_rewrites = 0
+        self.summaries = 0
+        self.primary_answers = 0
+        self.fallback_answers = 0
+        self.extractive_answers = 0
+        self.faq_answers = 0
+
+    def record_turn(self, prompt_tokens: int, history_tokens: int, hit: bool,
+                    latency_ms: float = 0.0, cached_tokens: int = 0):
+        with self._lock:
+            self.turns += 1
+            self.prompt_tokens += prompt_tokens
+            self.history_tokens += history_tokens
+            self.retrieval_hits += int(hit)
+            self.latency_ms += latency_ms
+            self.cached_tokens += cached_tokens
+
+    def increment(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            turns = self.turns or 1
+            return {
+                "turns": self.turns,
+                "avg_prompt_tokens": round(self.prompt_tokens / turns, 1),
+                "avg_history_tokens": round(self.history_tokens / turns, 1),
+                "avg_cached_tokens": round(self.cached_tokens / turns, 1),
+                "avg_generation_latency_ms": round(self.latency_ms / turns, 1),
+                "retrieval_hit_rate": round(self.retrieval_hits / turns, 3),
+                "rewritten_queries": self.rewritten_queries,
+                "rewrite_cache_hits": self.rewrite_cache_hits,
+                "llm_rewrites": self.llm_rewrites,
+                "summaries": self.summaries,
+                "answers_by_tier": {
+                    "primary": self.primary_answers,
+                    "fallback": self.fallback_answers,
+                    "extractive": self.extractive_answers,
+                    "faq": self.faq_answers
+                }
+            }
+
+class QueryCondenser:
+    """
+    Chuyển câu hỏi nối tiếp thành câu truy vấn độc lập để retrieval
+
+    Câu không có dấu hiệu phụ thuộc ngữ cảnh được dùng nguyên văn. Câu phụ thuộc
+    ngữ cảnh được viết lại bằng LLM (model rẻ, qua tầng helper của gateway); nếu LLM
+    lỗi, quá tải hoặc bị tắt thì ghép với câu truy vấn của lượt trước. Kết quả được
+    cache theo hội thoại.
+    """
+
+    def __init__(self, gateway=None, metrics: Optional[ChatMetrics] = None):
+        self.gateway = gateway
+        self.metrics = metrics
+
+    def condense(self, message: str, state: ConversationState) -> str:
+        """
+        Tạo câu truy vấn độc lập cho message
+
+        Args:
+            message: Tin nhắn mới của khách hàng
+            state: Trạng thái hội thoại
+
+        Returns:
+            str: Câu truy vấn dùng để tìm kiếm
+        """
+        if not state.turns and not state.summary:
+            return message
+
+        # Cùng một câu hỏi nối tiếp nhưng sau chủ đề khác phải viết lại khác
+        cache_key = (state.last_query, message)
+        cached = state.condensed.get(cache_key)
+        if cached:
+            self._count("rewrite_cache_hits")
+            return cached
+
+        if not self._needs_context(message):
+            query = message
+        else:
+            query = self._rewrite_with_llm(message, state) or self._combine(message, state)
+            self._count("rewritten_queries")
+
+        # Lượt sau có last_query khác nên key cũ không còn dùng được
+        state.condensed = {cache_key: query}
+        return query
+
+    def _needs_context(self, message: str) -> bool:
+        words = message.split()
+        return bool(ANAPHORA_PATTERN.search(message)) or len(words) <= 3
+
+    def _combine(self, message: str, state: ConversationState) -> str:
+        previous = state.last_query or (state.turns[-1]["user"] if state.turns else "")
+        return f"{previous} {message}".strip()
+
+    def _rewrite_with_llm(self, message: str, state: ConversationState) -> Optional[str]:
+        if self.gateway is None or not settings.query_rewrite_llm_enabled:
+            return None
+
+        history = "\n".join(f"Khách hàng: {turn['user']}" for turn in state.turns[-3:])
+        prompt = (
+            "Viết lại câu hỏi cuối của khách hàng thành một câu hỏi độc lập, đầy đủ chủ ngữ "
+            "và tên sản phẩm, để tìm kiếm tài liệu. Chỉ trả về câu hỏi.\n\n"
+            f"Tóm tắt: {state.summary}\n{history}\nCâu hỏi cuối: {message}\nCâu hỏi độc lập:"
+        )
+
+        # Gateway áp deadline, giới hạn đồng thời và circuit breaker; None khi không dùng được
+        query = self.gateway.generate_helper(prompt)
+        if not query:
+            logger.debug("Query rewrite unavailable, using heuristic")
+            return None
+
+        self._count("llm_rewrites")
+        return query
+
+    def _count(self, name: str):
+        if self.metrics:
+            self.metrics.increment(name)
+
+class HistorySummarizer:
+    """Gộp dần các lượt cũ vào bản tóm tắt khi lịch sử vượt ngưỡng token (qua tầng helper của gateway)"""
+
+    def __init__(self, gateway=None, metrics: Optional[ChatMetrics] = None):
+        self.gateway = gateway
+        self.metrics = metrics
+
+    def maybe_summarize(self, state: ConversationState):
+        """Tóm tắt các lượt cũ, giữ lại history_recent_turns lượt gần nhất"""
+        history_tokens = sum(estimate_tokens(turn["user"] + turn["assistant"]) for turn in state.turns)
+        keep = settings.history_recent_turns
+
+        if history_tokens <= settings.history_token_threshold or len(state.turns) <= keep:
+            return
+
+        old_turns = state.turns[:-keep] if keep else state.turns
+        transcript = "\n".join(
+            f"Khách hàng: {turn['user']}\nTuanVu: {turn['assistant']}" for turn in old_turns
+        )
+
+        summary = None
+        if self.gateway is not None:
+            prompt = (
+                "Cập nhật bản tóm tắt hội thoại giữa khách hàng và nhân viên VPBank. Giữ lại "
+                "sản phẩm, con số và yêu cầu còn dang dở; tối đa 5 câu.\n\n"
+                f"Tóm tắt hiện tại: {state.summary or '(trống)'}\n\nCác lượt mới:\n{transcript}\n\nTóm tắt mới:"
+            )
+            summary = self.gateway.generate_helper(prompt)
+
+        # Không có bản tóm tắt mới thì giữ nguyên các lượt cũ, thử lại ở lượt sau
+        if not summary:
+            logger.warning("History summarization unavailable, keeping old turns")
+            return
+
+        if self.metrics:
+            self.metrics.increment("summaries")
+
+        state.summary = summary
+        state.turns = state.turns[-keep:] if keep else []
+
+conversation_store = ConversationStore()
+chat_metrics = ChatMetrics()
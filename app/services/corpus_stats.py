@@ -0,0 +1,104 @@
+from datetime import datetime
+from typing import Optional
+import threading
+import logging
+
+from sqlalchemy import text
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class CorpusStats:
+    """
+    Số documents/chunks không cần COUNT(*)
+
+    Giá trị nền lấy từ ước lượng pg_class.reltuples (được autovacuum/ANALYZE cập
+    nhật), làm mới định kỳ ở background; giữa hai lần làm mới, ingest và delete
+    cộng/trừ trực tiếp vào bộ đếm.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.documents = 0
+        self.chunks = 0
+        self.refreshed_at: Optional[datetime] = None
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def record_ingest(self, documents: int, chunks: int):
+        with self._lock:
+            self.documents += documents
+            self.chunks += chunks
+
+    def record_delete(self, documents: int, chunks: int):
+        with self._lock:
+            self.documents = max(self.documents - documents, 0)
+            self.chunks = max(self.chunks - chunks, 0)
+
+    def refresh(self, db):
+        """Đọc lại ước lượng từ pg_class; bảng chưa từng ANALYZE thì đếm chính xác"""
+        # Bảng partition không có reltuples riêng: cộng ước lượng của các partition
+        rows = db.execute(text("""
+            SELECT p.relname,
+                   CASE WHEN p.relkind = 'p' THEN (
+                       SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), -1)
+                       FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                       WHERE i.inhparent = p.oid
+                   ) ELSE p.reltuples END::bigint AS estimate
+            FROM pg_class p
+            WHERE p.oid IN (to_regclass('documents'), to_regclass('chunks'))
+        """)).fetchall()
+        estimates = {row.relname: row.estimate for row in rows}
+
+        for table in ("documents", "chunks"):
+            # reltuples = -1 (PG14+) hoặc 0 khi bảng chưa được ANALYZE
+            if estimates.get(table, -1) <= 0:
+                estimates[table] = db.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+        with self._lock:
+            self.documents = estimates["documents"]
+            self.chunks = estimates["chunks"]
+            self.refreshed_at = datetime.utcnow()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            documents, chunks = self.documents, self.chunks
+            refreshed_at = self.refreshed_at
+
+        return {
+            "total_documents": documents,
+            "total_chunks": chunks,
+            "avg_chunks_per_doc": round(chunks / documents, 2) if documents > 0 else 0,
+            "estimated": True,
+            "refreshed_at": refreshed_at.isoformat() if refreshed_at else None
+        }
+
+    def start_refresher(self, session_factory, interval: float = None):
+        """Chạy thread làm mới định kỳ (gọi một lần khi app khởi động)"""
+        if self._refresher and self._refresher.is_alive():
+            return
+
+        interval = interval or settings.stats_refresh_seconds
+        self._stop.clear()
+
+        def run():
+            while True:
+                db = session_factory()
+                try:
+                    self.refresh(db)
+                except Exception as e:
+                    logger.warning(f"Error refreshing corpus stats: {str(e)}")
+                finally:
+                    db.close()
+
+                if self._stop.wait(interval):
+                    return
+
+        self._refresher = threading.Thread(target=run, name="corpus-stats", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop.set()
+
+corpus_stats = CorpusStats()
@@ -0,0 +1,220 @@
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import posixpath
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Query params chỉ dùng để tracking, không đổi nội dung trang
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+    '_ga', '_gl', 'igshid', 'ref', 'print'
+}
+TRACKING_PREFIXES = ('utm_', 'pk_', 'hsa_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+FINGERPRINT_BITS = 64
+
+def canonicalize_url(url: str) -> str:
+    """
+    Chuẩn hóa URL để các biến thể của cùng một trang trùng nhau
+
+    Bỏ fragment, tracking params, port mặc định, dấu / cuối path;
+    hạ chữ thường scheme/host và sắp xếp query params còn lại.
+
+    Args:
+        url: URL cần chuẩn hóa
+
+    Returns:
+        str: URL đã chuẩn hóa
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    host = (parsed.hostname or '').lower()
+
+    netloc = host
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{host}:{parsed.port}"
+
+    path = re.sub(r'/{2,}', '/', parsed.path or '/')
+    path = posixpath.normpath(path) if path != '/' else path
+    if path in ('', '.'):
+        path = '/'
+    if path.endswith(('/index.html', '/index.htm', '/index.php')):
+        path = path.rsplit('/', 1)[0] or '/'
+
+    query = [
+        (key, value)
+        for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+
+    return urlunparse((scheme, netloc, path, '', urlencode(sorted(query)), ''))
+
+def _tokens(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """
+    Tính SimHash 64-bit của text dựa trên word shingles
+
+    Args:
+        text: Text cần tính fingerprint
+        shingle_size: Số từ trong một shingle
+
+    Returns:
+        int: Fingerprint 64-bit không dấu
+    """
+    tokens = _tokens(text)
+    if len(tokens) >= shingle_size:
+        shingles = [' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)]
+    else:
+        shingles = [' '.join(tokens)]
+
+    weights = [0] * FINGERPRINT_BITS
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        for bit in range(FINGERPRINT_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+
+    fingerprint = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            fingerprint |= 1 << bit
+
+    return fingerprint
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def to_signed(fingerprint: int) -> int:
+    """Chuyển fingerprint 64-bit không dấu sang BIGINT có dấu của Postgres"""
+    return fingerprint - (1 << 64) if fingerprint >= 1 << 63 else fingerprint
+
+def to_unsigned(fingerprint: int) -> int:
+    return fingerprint + (1 << 64) if fingerprint < 0 else fingerprint
+
+class SimHashIndex:
+    """
+    Index tìm fingerprint gần trùng trong bán kính Hamming cố định
+
+    Fingerprint được chia thành max_distance + 1 band; hai fingerprint cách nhau
+    tối đa max_distance bit chắc chắn trùng hoàn toàn ít nhất một band, nên chỉ
+    cần so sánh với các ứng viên cùng band.
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = -(-FINGERPRINT_BITS // self.bands)
+        self._tables: List[Dict[int, List[int]]] = [{} for _ in range(self.bands)]
+        self.size = 0
+
+    def _band_keys(self, fingerprint: int):
+        mask = (1 << self.band_bits) - 1
+        for band in range(self.bands):
+            yield band, (fingerprint >> (band * self.band_bits)) & mask
+
+    def add(self, fingerprint: int):
+        for band, key in self._band_keys(fingerprint):
+            self._tables[band].setdefault(key, []).append(fingerprint)
+        self.size += 1
+
+    def find(self, fingerprint: int) -> Optional[int]:
+        """Trả về fingerprint gần trùng đầu tiên, hoặc None"""
+        for band, key in self._band_keys(fingerprint):
+            for candidate in self._tables[band].get(key, ()):
+                if hamming_distance(candidate, fingerprint) <= self.max_distance:
+                    return candidate
+        return None
+
+@dataclass
+class DedupReport:
+    pages_seen: int = 0
+    pages_duplicate: int = 0
+    chunks_seen: int = 0
+    chunks_duplicate: int = 0
+    embeddings_saved: int = 0
+    rows_saved: int = 0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+class NearDuplicateDetector:
+    """
+    Phát hiện trang và chunk gần trùng trước khi embed
+
+    Được khởi tạo từ fingerprints đã lưu trong database và cập nhật dần
+    trong suốt một lần crawl.
+    """
+
+    def __init__(self, page_fingerprints: List[int] = None, chunk_fingerprints: List[int] = None,
+                 max_distance: int = 3):
+        self.pages = SimHashIndex(max_distance)
+        self.chunks = SimHashIndex(max_distance)
+        self.report = DedupReport()
+
+        for fingerprint in page_fingerprints or []:
+            self.pages.add(to_unsigned(fingerprint))
+        for fingerprint in chunk_fingerprints or []:
+            self.chunks.add(to_unsigned(fingerprint))
+
+    def check_page(self, text: str) -> Tuple[bool, int]:
+        """
+        Kiểm tra trang gần trùng (chưa ghi nhận fingerprint, xem register)
+
+        Returns:
+            tuple: (is_duplicate, fingerprint)
+        """
+        fingerprint = simhash(text)
+        self.report.pages_seen += 1
+
+        if self.pages.find(fingerprint) is not None:
+            self.report.pages_duplicate += 1
+            self.report.rows_saved += 1
+            return True, fingerprint
+
+        return False, fingerprint
+
+    def record_skipped_page_chunks(self, chunk_count: int):
+        """Ghi nhận số chunk không phải embed do trang bị bỏ qua"""
+        self.report.embeddings_saved += chunk_count
+        self.report.rows_saved += chunk_count
+
+    def filter_chunks(self, chunks: List[str]) -> Tuple[List[int], List[int]]:
+        """
+        Loại chunk gần trùng với chunk đã có (trong DB, trong lần crawl này hoặc trong chính trang)
+
+        Returns:
+            tuple: (vị trí các chunk giữ lại, fingerprints tương ứng)
+        """
+        kept, fingerprints = [], []
+        page_chunks = SimHashIndex(self.chunks.max_distance)
+
+        for i, chunk in enumerate(chunks):
+            fingerprint = simhash(chunk)
+            self.report.chunks_seen += 1
+
+            if self.chunks.find(fingerprint) is not None or page_chunks.find(fingerprint) is not None:
+                self.report.chunks_duplicate += 1
+                self.report.embeddings_saved += 1
+                self.report.rows_saved += 1
+                continue
+
+            page_chunks.add(fingerprint)
+            kept.append(i)
+            fingerprints.append(fingerprint)
+
+        return kept, fingerprints
+
+    def register(self, page_fingerprint: Optional[int], chunk_fingerprints: List[int] = None):
+        """Ghi nhận fingerprints của trang sau khi đã lưu thành công vào database"""
+        if page_fingerprint is not None:
+            self.pages.add(page_fingerprint)
+        for fingerprint in chunk_fingerprints or []:
+            self.chunks.add(fingerprint)
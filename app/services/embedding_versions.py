@@ -0,0 +1,446 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import random
+import re
+import threading
+import time
+import logging
+
+from sqlalchemy import text
+
+from app.config import settings
+from app.models.database import CHUNK_TEXT_SQL, SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+LEGACY_VERSION = "legacy"
+VERSION_NAME_PATTERN = re.compile(r"^[a-z0-9_]{1,40}$")
+
+# Chỉ đọc cột embedding của chunks/chunk_embeddings; tên version đã được kiểm tra nên chèn trực tiếp
+INDEX_EXPRESSIONS = {
+    "vector": "(embedding::vector({dimension})) vector_cosine_ops",
+    "halfvec": "((embedding::vector({dimension}))::halfvec({dimension})) halfvec_cosine_ops",
+    "binary": "(binary_quantize(embedding::vector({dimension}))::bit({dimension})) bit_hamming_ops",
+}
+
+@dataclass(frozen=True)
+class VersionInfo:
+    name: str
+    model: str
+    dimension: int
+    status: str
+
+    @property
+    def is_legacy(self) -> bool:
+        return self.name == LEGACY_VERSION
+
+def legacy_version() -> VersionInfo:
+    return VersionInfo(LEGACY_VERSION, settings.embedding_model, settings.embedding_dimension, "active")
+
+class EmbeddingVersionRegistry:
+    """
+    Danh sách phiên bản embedding, cache trong process
+
+    Được đọc lại từ bảng embedding_versions mỗi embedding_version_refresh_seconds,
+    nên sau cutover mọi worker chuyển sang phiên bản mới trong khoảng thời gian đó.
+    Khi bảng chưa tồn tại hoặc trống, chỉ có phiên bản legacy (chunks.embedding).
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, VersionInfo] = {LEGACY_VERSION: legacy_version()}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        db = SessionLocal()
+        try:
+            rows = db.execute(text("SELECT name, model, dimension, status FROM embedding_versions")).fetchall()
+            versions = {row.name: VersionInfo(row.name, row.model, row.dimension, row.status) for row in rows}
+        except Exception as e:
+            logger.warning(f"Error loading embedding versions: {str(e)}")
+            versions = None
+        finally:
+            db.close()
+
+        with self._lock:
+            if versions is not None:
+                versions.setdefault(LEGACY_VERSION, legacy_version())
+                self._versions = versions
+            self._loaded_at = time.monotonic()
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._loaded_at >= settings.embedding_version_refresh_seconds:
+            self.refresh()
+
+    def active(self) -> VersionInfo:
+        """Phiên bản search đang dùng"""
+        self._maybe_refresh()
+        with self._lock:
+            for version in self._versions.values():
+                if version.status == "active":
+                    return version
+        return legacy_version()
+
+    def get(self, name: str) -> Optional[VersionInfo]:
+        self._maybe_refresh()
+        with self._lock:
+            return self._versions.get(name)
+
+    def write_targets(self) -> List[VersionInfo]:
+        """Các phiên bản cần được ghi khi ingest (mọi phiên bản chưa retired)"""
+        self._maybe_refresh()
+        with self._lock:
+            return [version for version in self._versions.values() if version.status != "retired"]
+
+class ShadowStats:
+    """So sánh kết quả của phiên bản active và phiên bản shadow trên truy vấn thật"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self, version: Optional[str] = None):
+        """Xóa số liệu khi đổi phiên bản shadow (gọi khi đang giữ _lock hoặc trong __init__)"""
+        self.version = version
+        self.queries = 0
+        self.overlap = 0.0
+        self.active_top_similarity = 0.0
+        self.shadow_top_similarity = 0.0
+        self.shadow_latency_ms = 0.0
+        self.errors = 0
+
+    def record(self, version: str, active_keys: List[tuple], shadow_keys: List[tuple],
+               active_top: float, shadow_top: float, latency_ms: float):
+        with self._lock:
+            if version != self.version:
+                self._reset(version)
+            self.queries += 1
+            if active_keys:
+                self.overlap += len(set(active_keys) & set(shadow_keys)) / len(active_keys)
+            self.active_top_similarity += active_top
+            self.shadow_top_similarity += shadow_top
+            self.shadow_latency_ms += latency_ms
+
+    def record_error(self):
+        with self._lock:
+            self.errors += 1
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            queries = self.queries or 1
+            return {
+                "version": self.version,
+                "queries": self.queries,
+                "errors": self.errors,
+                "avg_overlap_at_k": round(self.overlap / queries, 3),
+                "avg_active_top_similarity": round(self.active_top_similarity / queries, 4),
+                "avg_shadow_top_similarity": round(self.shadow_top_similarity / queries, 4),
+                "avg_shadow_latency_ms": round(self.shadow_latency_ms / queries, 1)
+            }
+
+class ReembeddingService:
+    """Tạo phiên bản mới, backfill từ text đã lưu, đánh giá và cutover"""
+
+    def __init__(self, registry: EmbeddingVersionRegistry):
+        self.registry = registry
+
+    def create_version(self, db, name: str, model: str, dimension: int) -> VersionInfo:
+        """
+        Đăng ký phiên bản mới ở trạng thái building (ingest bắt đầu ghi kép ngay)
+
+        Raises:
+            ValueError: Tên không hợp lệ hoặc đã tồn tại
+        """
+        if not VERSION_NAME_PATTERN.match(name) or name == LEGACY_VERSION:
+            raise ValueError(f"Invalid version name: {name}")
+
+        inserted = db.execute(text("""
+            INSERT INTO embedding_versions (name, model, dimension, status)
+            VALUES (:name, :model, :dimension, 'building')
+            ON CONFLICT (name) DO NOTHING
+            RETURNING name
+        """), {"name": name, "model": model, "dimension": dimension}).first()
+        db.commit()
+
+        if inserted is None:
+            raise ValueError(f"Version already exists: {name}")
+
+        self.registry.refresh()
+        logger.info(f"Created embedding version {name} ({model}, {dimension})")
+        return VersionInfo(name, model, dimension, "building")
+
+    def backfill(self, name: str, progress: dict, max_passes: int = 3):
+        """
+        Embed lại mọi chunk chưa có vector của phiên bản, theo batch và giới hạn tốc độ
+
+        Mỗi lượt duyệt chunks theo id; chunk lỗi được bỏ qua và thử lại ở lượt sau.
+        Lượt sau cũng bắt các chunk được ingest trước khi worker khác thấy phiên bản mới.
+        Xong thì tạo index ANN và chuyển sang ready.
+        """
+        from app.services.embeddings import GeminiEmbeddings
+
+        self.registry.refresh()
+        version = self.registry.get(name)
+        if version is None or version.is_legacy:
+            raise ValueError(f"Unknown embedding version: {name}")
+
+        embedder = GeminiEmbeddings(version.model)
+        batch_size = settings.reembed_batch_size
+        min_interval = 60.0 / settings.reembed_requests_per_minute
+
+        db = SessionLocal()
+        try:
+            progress["total"] = db.execute(text("SELECT COUNT(*) FROM chunks")).scalar()
+            progress.setdefault("embedded", 0)
+            progress.setdefault("failed", 0)
+
+            select_sql = text(f"""
+                SELECT c.id, c.ingest_epoch, c.collection, {CHUNK_TEXT_SQL.format(chunk="c")} AS content
+                FROM chunks c
+                JOIN documents d ON d.id = c.document_id
+                WHERE c.id > :after
+                  AND COALESCE(c.content <> '', c.end_offset > c.start_offset)
+                  AND NOT EXISTS (
+                      SELECT 1 FROM chunk_embeddings e WHERE e.chunk_id = c.id AND e.version = :version
+                  )
+                ORDER BY c.id
+                LIMIT :batch_size
+            """)
+            insert_sql = text("""
+                INSERT INTO chunk_embeddings (chunk_id, version, ingest_epoch, collection, embedding)
+                VALUES (:chunk_id, :version, :ingest_epoch, :collection, CAST(:embedding AS vector))
+                ON CONFLICT DO NOTHING
+            """)
+
+            for pass_number in range(1, max_passes + 1):
+                progress["pass"] = pass_number
+                after = "00000000-0000-0000-0000-000000000000"
+                embedded_in_pass = 0
+
+                while True:
+                    rows = db.execute(select_sql, {"after": after, "version": name, "batch_size": batch_size}).fetchall()
+                    if not rows:
+                        break
+                    after = rows[-1].id
+
+                    started = time.monotonic()
+                    try:
+                        vectors = embedder.embed_documents([row.content for row in rows])
+                    except Exception as e:
+                        logger.warning(f"Re-embedding batch failed, will retry next pass: {str(e)}")
+                        progress["failed"] += len(rows)
+                        vectors = None
+
+                    if vectors is not None:
+                        if any(len(vector) != version.dimension for vector in vectors):
+                            raise ValueError(f"Model {version.model} did not return {version.dimension} dimensions")
+
+                        db.execute(insert_sql, [
+                            {"chunk_id": row.id, "version": name, "ingest_epoch": row.ingest_epoch,
+                             "collection": row.collection, "embedding": str(vector)}
+                            for row, vector in zip(rows, vectors)
+                        ])
+                        db.execute(text(
+                            "UPDATE embedding_versions SET backfilled = backfilled + :count WHERE name = :name"
+                        ), {"count": len(rows), "name": name})
+                        db.commit()
+
+                        embedded_in_pass += len(rows)
+                        progress["embedded"] += len(rows)
+
+                    # Giới hạn số request embed mỗi phút để không tranh quota với ingest/search
+                    elapsed = time.monotonic() - started
+                    if elapsed < min_interval:
+                        time.sleep(min_interval - elapsed)
+
+                logger.info(f"Re-embedding pass {pass_number} for {name}: {embedded_in_pass} chunks")
+                if not embedded_in_pass:
+                    break
+        finally:
+            db.close()
+
+        progress["step"] = "index"
+        self.build_index(version)
+
+        db = SessionLocal()
+        try:
+            db.execute(text(
+                "UPDATE embedding_versions SET status = 'ready' WHERE name = :name AND status = 'building'"
+            ), {"name": name})
+            db.commit()
+        finally:
+            db.close()
+
+        self.registry.refresh()
+        logger.info(f"Embedding version {name} is ready")
+
+    def build_index(self, version: VersionInfo):
+        """Partial index ANN cho phiên bản, theo embedding_index_mode hiện tại"""
+        expression = INDEX_EXPRESSIONS[settings.embedding_index_mode].format(dimension=version.dimension)
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunk_embeddings_{version.name}
+                ON chunk_embeddings USING hnsw ({expression})
+                WHERE version = '{version.name}'
+            """))
+
+    def evaluate(self, db, name: str, samples: int = 100, k: int = 10) -> dict:
+        """
+        So recall@k của phiên bản active và phiên bản name trên cùng bộ truy vấn
+
+        Truy vấn là câu đầu của các chunk lấy mẫu ngẫu nhiên (đã có vector ở cả hai
+        phiên bản); một hit là khi chunk nguồn nằm trong top k.
+        """
+        from app.services.vector_store import PgVectorStore
+
+        candidate = self.registry.get(name)
+        if candidate is None:
+            raise ValueError(f"Unknown embedding version: {name}")
+        active = self.registry.active()
+
+        rows = db.execute(text(f"""
+            SELECT c.document_id, c.chunk_index, {CHUNK_TEXT_SQL.format(chunk="c")} AS content
+            FROM chunks c
+            JOIN chunk_embeddings e ON e.chunk_id = c.id AND e.ingest_epoch = c.ingest_epoch AND e.version = :version
+            JOIN documents d ON d.id = c.document_id
+            WHERE COALESCE(length(c.content), c.end_offset - c.start_offset) > 50
+              AND c.collection = 'default'
+            ORDER BY random()
+            LIMIT :samples
+        """), {"version": name, "samples": samples}).fetchall()
+        if not rows:
+            return {"samples": 0}
+
+        queries = [self._sample_query(row.content) for row in rows]
+        expected = [(row.document_id, row.chunk_index) for row in rows]
+
+        store = PgVectorStore(db)
+        report = {"samples": len(rows), "k": k}
+        results = {}
+        for version in (active, candidate):
+            started = time.perf_counter()
+            results[version.name] = store.semantic_search_many(
+                queries, max_results=k, similarity_threshold=-1.0, version=version
+            )
+            hits = sum(
+                key in [(r.document_id, r.chunk_index) for r in found]
+                for key, found in zip(expected, results[version.name])
+            )
+            report[version.name] = {
+                "recall_at_k": round(hits / len(rows), 3),
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+            }
+
+        if active.name != candidate.name:
+            overlaps = [
+                len({(r.document_id, r.chunk_index) for r in a} & {(r.document_id, r.chunk_index) for r in b}) / k
+                for a, b in zip(results[active.name], results[candidate.name])
+            ]
+            report["overlap_at_k"] = round(sum(overlaps) / len(overlaps), 3)
+
+        return report
+
+    def activate(self, db, name: str):
+        """
+        Cutover: phiên bản name thành active, active cũ thành ready (để rollback)
+
+        Một câu UPDATE trong một transaction nên không có lúc nào có hai (hoặc không có)
+        phiên bản active.
+
+        Raises:
+            ValueError: Phiên bản không tồn tại hoặc chưa backfill xong
+        """
+        row = db.execute(text(
+            "SELECT status FROM embedding_versions WHERE name = :name FOR UPDATE"
+        ), {"name": name}).first()
+        if row is None and name == LEGACY_VERSION:
+            # Bảng chưa có dòng legacy (database tạo bằng create_tables)
+            legacy = legacy_version()
+            db.execute(text("""
+                INSERT INTO embedding_versions (name, model, dimension, status)
+                VALUES (:name, :model, :dimension, 'ready')
+            """), {"name": legacy.name, "model": legacy.model, "dimension": legacy.dimension})
+        elif row is None or row.status not in ("ready", "active"):
+            db.rollback()
+            raise ValueError(f"Version {name} is not ready")
+
+        db.execute(text("""
+            UPDATE embedding_versions
+            SET status = CASE WHEN name = :name THEN 'active' ELSE 'ready' END,
+                activated_at = CASE WHEN name = :name THEN now() ELSE activated_at END
+            WHERE name = :name OR status = 'active'
+        """), {"name": name})
+        db.commit()
+
+        self.registry.refresh()
+        logger.info(f"Activated embedding version {name}")
+
+    def retire(self, db, name: str):
+        """Ngừng ghi và giữ lại vector của phiên bản (không được là phiên bản active)"""
+        updated = db.execute(text("""
+            UPDATE embedding_versions SET status = 'retired'
+            WHERE name = :name AND status <> 'active'
+            RETURNING name
+        """), {"name": name}).first()
+        db.commit()
+
+        if updated is None:
+            raise ValueError(f"Version {name} does not exist or is active")
+        self.registry.refresh()
+
+    @staticmethod
+    def _sample_query(content: str, max_chars: int = 200) -> str:
+        lines = [line for line in content.splitlines() if line.strip()]
+        # Chunk structured bắt đầu bằng heading path, lấy dòng nội dung đầu tiên
+        body = lines[1] if len(lines) > 1 and " > " in lines[0] else lines[0]
+        return re.split(r"(?<=[.!?])\s", body)[0][:max_chars]
+
+class ShadowSearcher:
+    """Chạy lại một phần truy vấn thật trên phiên bản shadow ở background"""
+
+    def __init__(self, registry: EmbeddingVersionRegistry, stats: ShadowStats):
+        self.registry = registry
+        self.stats = stats
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="shadow-search")
+
+    def maybe_submit(self, query: str, max_results: int, filters, active_results: list):
+        name = settings.embedding_shadow_version
+        if not name or random.random() >= settings.embedding_shadow_sample_rate:
+            return
+
+        version = self.registry.get(name)
+        if version is None or version.name == self.registry.active().name:
+            return
+
+        self._executor.submit(self._run, version, query, max_results, filters, active_results)
+
+    def _run(self, version: VersionInfo, query: str, max_results: int, filters, active_results: list):
+        from app.services.vector_store import PgVectorStore
+
+        db = SessionLocal()
+        try:
+            started = time.perf_counter()
+            shadow_results = PgVectorStore(db).semantic_search(
+                query, max_results=max_results, similarity_threshold=-1.0,
+                filters=filters, version=version, shadow=False
+            )
+            self.stats.record(
+                version.name,
+                [(r.document_id, r.chunk_index) for r in active_results],
+                [(r.document_id, r.chunk_index) for r in shadow_results],
+                active_results[0].similarity if active_results else 0.0,
+                shadow_results[0].similarity if shadow_results else 0.0,
+                (time.perf_counter() - started) * 1000
+            )
+        except Exception as e:
+            self.stats.record_error()
+            logger.warning(f"Shadow search on {version.name} failed: {str(e)}")
+        finally:
+            db.close()
+
+embedding_registry = EmbeddingVersionRegistry()
+shadow_stats = ShadowStats()
+shadow_searcher = ShadowSearcher(embedding_registry, shadow_stats)
+reembedding_service = ReembeddingService(embedding_registry)
@@ -1,17 +1,19 @@
-import google.generativeai as genai
 from typing import List, Optional
 import numpy as np
 import logging
 from tenacity import retry, stop_after_attempt, wait_exponential
 
 from app.config import settings
+from app.utils.lazy import LazyModule
+
+genai = LazyModule("google.generativeai")
 
 logger = logging.getLogger(__name__)
 
 class GeminiEmbeddings:
-    def __init__(self):
+    def __init__(self, model_name: Optional[str] = None):
         genai.configure(api_key=settings.google_api_key)
-        self.model_name = settings.embedding_model
+        self.model_name = model_name or settings.embedding_model
     
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
     def embed_text(self, text: str) -> List[float]:
@@ -71,16 +73,70 @@ class GeminiEmbeddings:
             logger.error(f"Error creating query embedding: {str(e)}")
             raise
     
-    def embed_batch(self, texts: List[str], batch_size: int = 10) -> List[List[float]]:
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """
+        Tạo embedding cho nhiều query trong một request
+        
+        Args:
+            queries: Danh sách query cần embed
+            
+        Returns:
+            List[List[float]]: Vector embedding theo đúng thứ tự queries
+        """
+        try:
+            if any(not query.strip() for query in queries):
+                raise ValueError("Query is empty")
+            
+            result = genai.embed_content(
+                model=self.model_name,
+                content=queries,
+                task_type="retrieval_query"
+            )
+            
+            return result['embedding']
+            
+        except Exception as e:
+            logger.error(f"Error creating batch query embeddings: {str(e)}")
+            raise
+    
+    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Tạo embedding cho nhiều text trong một request
+        
+        Args:
+            texts: Danh sách text (không rỗng)
+            
+        Returns:
+            List[List[float]]: Vector embedding theo đúng thứ tự texts
+        """
+        try:
+            result = genai.embed_content(
+                model=self.model_name,
+                content=[text[:10000] for text in texts],
+                task_type="retrieval_document"
+            )
+            
+            return result['embedding']
+            
+        except Exception as e:
+            logger.error(f"Error creating batch document embeddings: {str(e)}")
+            raise
+    
+    def embed_batch(self, texts: List[str], batch_size: int = 10,
+                    fallback: bool = True) -> List[Optional[List[float]]]:
         """
         Tạo embedding cho nhiều texts
         
         Args:
             texts: Danh sách texts
             batch_size: Kích thước batch
+            fallback: True: text lỗi nhận zero vector settings.embedding_dimension chiều;
+                False: text lỗi nhận None để caller tự bỏ qua
             
         Returns:
-            List[List[float]]: Danh sách embeddings
+            List[Optional[List[float]]]: Danh sách embeddings
         """
         embeddings = []
         
@@ -95,9 +151,9 @@ class GeminiEmbeddings:
                 except Exception as e:
                     logger.error(f"Failed to embed text: {str(e)}")
                     # Tạo zero vector như fallback
-                    batch_embeddings.append([0.0] * 768)
+                    batch_embeddings.append([0.0] * settings.embedding_dimension if fallback else None)
             
             embeddings.extend(batch_embeddings)
-            logger.info(f"Processed batch {i//batch_size + 1}/{(len(texts)-1)//batch_size + 1}")
+            logger.debug("Processed batch %d/%d", i // batch_size + 1, (len(texts) - 1) // batch_size + 1)
         
-        return embeddings
\ No newline at end of file
+        return embeddings
@@ -0,0 +1,258 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from typing import Dict, List, Optional, Sequence
+import json
+import math
+import time
+import logging
+
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app.config import settings
+from app.models.database import SessionLocal
+from app.models.schemas import SearchResult
+from app.services.deduplication import canonicalize_url
+from app.services.embedding_versions import VersionInfo, embedding_registry
+from app.services.prompts import get_prompt_templates
+from app.services.vector_store import PgVectorStore
+from app.utils.helpers import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class EvalCase:
+    """
+    Một câu hỏi có nhãn
+
+    relevant_urls: trang chứa câu trả lời (đúng một trang bất kỳ chunk nào của nó).
+    relevant_chunks: chunk cụ thể, dạng {"url": ..., "chunk_index": ...}.
+    """
+    question: str
+    relevant_urls: List[str] = field(default_factory=list)
+    relevant_chunks: List[dict] = field(default_factory=list)
+
+    def labels(self) -> set:
+        return {("url", canonicalize_url(url)) for url in self.relevant_urls} | {
+            ("chunk", canonicalize_url(chunk["url"]), chunk["chunk_index"]) for chunk in self.relevant_chunks
+        }
+
+@dataclass
+class RetrievalConfig:
+    """
+    Một cấu hình retrieval cần so sánh; None nghĩa là dùng giá trị trong settings
+
+    chunk_size/merge threshold được áp dụng lúc ingest, nên để so sánh chúng cần
+    ingest vào một database khác và trỏ database_url tới đó.
+    """
+    name: str
+    max_results: Optional[int] = None
+    similarity_threshold: Optional[float] = None
+    expansion: Optional[str] = None
+    index_mode: Optional[str] = None
+    probes: Optional[int] = None  # ivfflat.probes
+    ef_search: Optional[int] = None  # hnsw.ef_search
+    version: Optional[str] = None
+    database_url: Optional[str] = None
+
+def load_cases(path: str) -> List[EvalCase]:
+    """Đọc tập câu hỏi có nhãn dạng JSONL (mỗi dòng một EvalCase)"""
+    with open(path, encoding="utf-8") as f:
+        return [EvalCase(**json.loads(line)) for line in f if line.strip()]
+
+def load_configs(path: str) -> List[RetrievalConfig]:
+    """Đọc danh sách cấu hình dạng JSON array"""
+    with open(path, encoding="utf-8") as f:
+        return [RetrievalConfig(**item) for item in json.load(f)]
+
+def _matched_labels(results: Sequence[SearchResult], labels: set) -> List[Optional[tuple]]:
+    """Nhãn được mỗi kết quả trả về lần đầu tiên (None nếu không liên quan hoặc đã đếm)"""
+    seen = set()
+    matched = []
+    for result in results:
+        url = canonicalize_url(result.document_url)
+        label = None
+        for candidate in (("chunk", url, result.chunk_index), ("url", url)):
+            if candidate in labels and candidate not in seen:
+                label = candidate
+                break
+        if label:
+            seen.add(label)
+        matched.append(label)
+    return matched
+
+def recall_at_k(matched: List[Optional[tuple]], total: int, k: int) -> float:
+    if total == 0:
+        return 0.0
+    return sum(1 for label in matched[:k] if label) / total
+
+def reciprocal_rank(matched: List[Optional[tuple]]) -> float:
+    for rank, label in enumerate(matched, start=1):
+        if label:
+            return 1.0 / rank
+    return 0.0
+
+def ndcg_at_k(matched: List[Optional[tuple]], total: int, k: int) -> float:
+    dcg = sum(1.0 / math.log2(rank + 1) for rank, label in enumerate(matched[:k], start=1) if label)
+    ideal = sum(1.0 / math.log2(rank + 1) for rank in range(1, min(total, k) + 1))
+    return dcg / ideal if ideal else 0.0
+
+class _PrecomputedEmbeddingStore(PgVectorStore):
+    """PgVectorStore dùng embedding query đã tính sẵn: mọi cấu hình dùng chung một lần gọi Gemini"""
+
+    def __init__(self, db, query_embeddings: Dict[tuple, List[float]]):
+        super().__init__(db)
+        self.query_embeddings = query_embeddings
+
+    def _embed_query(self, query: str, version: VersionInfo) -> List[float]:
+        return self.query_embeddings[(version.name, query)]
+
+class RetrievalEvaluator:
+    """
+    Chạy tập câu hỏi có nhãn qua pipeline retrieval (search + mở rộng ngữ cảnh) với nhiều cấu hình
+
+    Metric chất lượng của các cấu hình được tính song song, mỗi cấu hình một session.
+    Latency được đo ở một lượt riêng, lần lượt từng cấu hình, để p50/p95 và delta so
+    với baseline không bị ảnh hưởng bởi các cấu hình khác chạy cùng lúc trên database.
+    Query được embed một lần cho mỗi phiên bản embedding trước khi chạy, nên latency
+    đo được là của database và bước mở rộng, không gồm gọi Gemini.
+    """
+
+    def __init__(self, cases: List[EvalCase], k: int = 10):
+        self.cases = cases
+        self.k = k
+        self.templates = get_prompt_templates()
+        self._engines = {}
+
+    def run(self, configs: List[RetrievalConfig], parallel: int = None) -> List[dict]:
+        """
+        Đánh giá tất cả cấu hình
+
+        Args:
+            configs: Các cấu hình, cấu hình đầu tiên là baseline
+            parallel: Số cấu hình tính metric chất lượng đồng thời (mặc định tất cả)
+
+        Returns:
+            List[dict]: Báo cáo của từng cấu hình, theo thứ tự configs
+        """
+        embeddings = self._embed_questions(configs)
+
+        with ThreadPoolExecutor(max_workers=parallel or len(configs), thread_name_prefix="eval") as executor:
+            reports = list(executor.map(lambda config: self._evaluate(config, embeddings), configs))
+
+        # Lượt đo latency: từng cấu hình một, sau khi lượt trên đã làm nóng cache cho mọi cấu hình
+        for config, report in zip(configs, reports):
+            latencies = self._measure_latency(config, embeddings)
+            report["p50_ms"] = round(float(np.percentile(latencies, 50)), 1)
+            report["p95_ms"] = round(float(np.percentile(latencies, 95)), 1)
+            logger.info(f"Latency of {config.name}: p50 {report['p50_ms']} ms, p95 {report['p95_ms']} ms")
+
+        baseline = reports[0]
+        for report in reports[1:]:
+            report["delta"] = {
+                metric: round(report[metric] - baseline[metric], 4)
+                for metric in (f"recall@{self.k}", "mrr", f"ndcg@{self.k}", "p95_ms", "avg_prompt_tokens")
+            }
+        return reports
+
+    def _version(self, config: RetrievalConfig) -> VersionInfo:
+        if config.version is None:
+            return embedding_registry.active()
+        version = embedding_registry.get(config.version)
+        if version is None:
+            raise ValueError(f"Unknown embedding version: {config.version}")
+        return version
+
+    def _embed_questions(self, configs: List[RetrievalConfig]) -> Dict[tuple, List[float]]:
+        questions = [case.question for case in self.cases]
+        embeddings = {}
+
+        for version in {self._version(config).name: self._version(config) for config in configs}.values():
+            embedder = PgVectorStore(None)._embeddings_for(version)
+            started = time.perf_counter()
+            vectors = []
+            for i in range(0, len(questions), 100):
+                vectors.extend(embedder.embed_queries(questions[i:i + 100]))
+            logger.info(f"Embedded {len(questions)} questions for version {version.name} "
+                        f"in {time.perf_counter() - started:.1f}s")
+            embeddings.update({(version.name, question): vector for question, vector in zip(questions, vectors)})
+
+        return embeddings
+
+    def _session(self, config: RetrievalConfig):
+        if not config.database_url:
+            return SessionLocal()
+        if config.database_url not in self._engines:
+            self._engines[config.database_url] = sessionmaker(bind=create_engine(config.database_url))
+        return self._engines[config.database_url]()
+
+    def _open_store(self, config: RetrievalConfig, embeddings: Dict[tuple, List[float]]):
+        db = self._session(config)
+        if config.probes:
+            db.execute(text(f"SET ivfflat.probes = {int(config.probes)}"))
+        if config.ef_search:
+            db.execute(text(f"SET hnsw.ef_search = {int(config.ef_search)}"))
+        return db, _PrecomputedEmbeddingStore(db, embeddings)
+
+    def _retrieve(self, store: PgVectorStore, config: RetrievalConfig, version: VersionInfo, question: str):
+        """Search + mở rộng ngữ cảnh theo cấu hình, trả về (hits, expanded)"""
+        hits = store.semantic_search(
+            question,
+            max_results=config.max_results or settings.max_results,
+            similarity_threshold=config.similarity_threshold if config.similarity_threshold is not None
+            else settings.similarity_threshold,
+            version=version, shadow=False, index_mode=config.index_mode
+        )
+        return hits, store.expand_results(hits, mode=config.expansion)
+
+    def _evaluate(self, config: RetrievalConfig, embeddings: Dict[tuple, List[float]]) -> dict:
+        version = self._version(config)
+        db, store = self._open_store(config, embeddings)
+        try:
+            recalls, reciprocal_ranks, ndcgs, prompt_tokens = [], [], [], []
+
+            for case in self.cases:
+                hits, expanded = self._retrieve(store, config, version, case.question)
+
+                # Metric tính trên thứ tự hit; prompt tính trên ngữ cảnh sau khi mở rộng
+                labels = case.labels()
+                matched = _matched_labels(hits, labels)
+                recalls.append(recall_at_k(matched, len(labels), self.k))
+                reciprocal_ranks.append(reciprocal_rank(matched))
+                ndcgs.append(ndcg_at_k(matched, len(labels), self.k))
+
+                context = "\n".join(result.content for result in expanded)
+                prompt = self.templates.render_turn(question=case.question, context=context, history="")
+                prompt_tokens.append(estimate_tokens(prompt) + estimate_tokens(self.templates.system_instruction))
+
+            db.rollback()
+        finally:
+            db.close()
+
+        report = {
+            "config": {key: value for key, value in asdict(config).items() if value is not None},
+            "queries": len(self.cases),
+            f"recall@{self.k}": round(float(np.mean(recalls)), 4),
+            "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+            f"ndcg@{self.k}": round(float(np.mean(ndcgs)), 4),
+            "avg_prompt_tokens": round(float(np.mean(prompt_tokens)), 1)
+        }
+        logger.info(f"Evaluated {config.name}: {report}")
+        return report
+
+    def _measure_latency(self, config: RetrievalConfig, embeddings: Dict[tuple, List[float]]) -> List[float]:
+        """Latency (ms) của search + mở rộng cho từng câu hỏi, không có cấu hình nào khác chạy cùng lúc"""
+        version = self._version(config)
+        db, store = self._open_store(config, embeddings)
+        try:
+            latencies = []
+            for case in self.cases:
+                started = time.perf_counter()
+                self._retrieve(store, config, version, case.question)
+                latencies.append((time.perf_counter() - started) * 1000)
+            db.rollback()
+        finally:
+            db.close()
+
+        return latencies
@@ -0,0 +1,469 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional, Sequence, Tuple
+import argparse
+import json
+import re
+import threading
+import logging
+
+import numpy as np
+from sqlalchemy import text
+
+from app.config import settings
+from app.models.database import FaqEntry, engine
+from app.models.schemas import SearchResult
+from app.services.embedding_versions import VersionInfo, embedding_registry
+from app.services.llm_gateway import get_llm_gateway
+from app.services.prompts import get_prompt_templates
+from app.services.vector_store import PgVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Khóa của câu hỏi trong file JSONL (log, requests.jsonl, tập đánh giá)
+QUESTION_KEYS = ("question", "message", "query", "title")
+# Chỉ một worker đối chiếu/sinh lại câu trả lời tại một thời điểm
+REFRESH_LOCK_KEY = "faq_refresh"
+
+def load_questions(paths: Sequence[str]) -> List[str]:
+    """
+    Đọc câu hỏi lịch sử từ các file: JSONL (khóa question/message/query/title) hoặc text mỗi dòng một câu
+
+    Args:
+        paths: Đường dẫn các file
+
+    Returns:
+        List[str]: Câu hỏi, giữ nguyên lặp lại (tần suất được dùng làm trọng số khi phân cụm)
+    """
+    questions = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                if line.startswith("{"):
+                    item = json.loads(line)
+                    line = next((item[key] for key in QUESTION_KEYS if isinstance(item.get(key), str)), "")
+                if line.strip():
+                    questions.append(line.strip())
+    return questions
+
+def _normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+def _unit(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def _source_keys(results: List[SearchResult]) -> List[str]:
+    """Định danh các chunk nguồn để biết câu trả lời có còn dựa trên cùng ngữ cảnh không"""
+    return sorted(f"{result.document_id}:{result.chunk_index}" for result in results)
+
+@dataclass
+class FaqMatch:
+    id: str
+    question: str
+    answer: str
+    sources: List[SearchResult]
+    similarity: float
+
+class FaqBuilder:
+    """
+    Dựng và làm mới câu trả lời FAQ
+
+    build: embed câu hỏi lịch sử, phân cụm KMeans (trọng số theo tần suất), với mỗi
+    cụm đủ lớn lấy câu hỏi gần tâm nhất làm câu đại diện và sinh câu trả lời qua
+    đúng pipeline retrieval + prompt + gateway của chat. Câu trả lời chỉ được giữ
+    khi có nguồn và do model chính sinh ra (không phải tầng dự phòng/trích xuất).
+
+    refresh: retrieval lại cho từng câu đại diện; chỉ sinh lại khi tập chunk nguồn
+    thay đổi (document bị xóa, sửa hoặc có nội dung mới liên quan hơn).
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.store = PgVectorStore(db)
+        self.templates = get_prompt_templates()
+        self.gateway = get_llm_gateway()
+
+    def build(self, questions: List[str], n_clusters: Optional[int] = None,
+              min_cluster_size: Optional[int] = None, progress: Optional[dict] = None) -> dict:
+        """
+        Phân cụm câu hỏi và thay toàn bộ FAQ của phiên bản embedding active
+
+        Args:
+            questions: Câu hỏi lịch sử (có lặp lại)
+            n_clusters: Số cụm tối đa (mặc định settings.faq_max_clusters)
+            min_cluster_size: Số câu hỏi tối thiểu của một cụm
+            progress: Dict được cập nhật tiến độ
+
+        Returns:
+            dict: Số câu hỏi, số cụm, số câu trả lời được lưu/bị loại
+        """
+        from sklearn.cluster import KMeans
+
+        progress = progress if progress is not None else {}
+        min_cluster_size = min_cluster_size or settings.faq_min_cluster_size
+        version = embedding_registry.active()
+
+        # Gộp câu hỏi trùng, số lần xuất hiện là trọng số
+        grouped = {}
+        for question in questions:
+            key = _normalize_question(question)
+            original, count = grouped.get(key, (question, 0))
+            grouped[key] = (original, count + 1)
+        unique = [original for original, _ in grouped.values()]
+        weights = np.array([count for _, count in grouped.values()], dtype=np.float32)
+        progress.update({"questions": len(questions), "unique_questions": len(unique)})
+
+        if weights.sum() < min_cluster_size:
+            raise ValueError(f"Need at least {min_cluster_size} questions, got {len(questions)}")
+
+        embedder = self.store._embeddings_for(version)
+        vectors = []
+        for i in range(0, len(unique), 100):
+            vectors.extend(embedder.embed_queries(unique[i:i + 100]))
+        matrix = _unit(np.asarray(vectors, dtype=np.float32))
+
+        k = max(1, min(n_clusters or settings.faq_max_clusters, len(unique), int(weights.sum()) // min_cluster_size))
+        labels = KMeans(n_clusters=k, n_init=4, random_state=0).fit_predict(matrix, sample_weight=weights)
+        progress.update({"clusters": k, "small_clusters": 0, "answered": 0, "rejected": 0})
+
+        entries = []
+        for cluster in range(k):
+            members = np.flatnonzero(labels == cluster)
+            size = int(weights[members].sum())
+            if size < min_cluster_size:
+                progress["small_clusters"] += 1
+                continue
+
+            centroid = _unit(weights[members] @ matrix[members])
+            similarities = matrix[members] @ centroid
+            representative = int(members[np.argmax(similarities)])
+            # Cụm càng chặt thì ngưỡng càng cao; không bao giờ thấp hơn faq_min_similarity
+            threshold = float(min(max(settings.faq_min_similarity, np.quantile(similarities, 0.1)), 0.99))
+
+            question = unique[representative]
+            answer, sources = self._answer(question, matrix[representative].tolist(), version)
+            if answer is None:
+                progress["rejected"] += 1
+                continue
+
+            entries.append(FaqEntry(
+                question=question,
+                embedding_version=version.name,
+                centroid=centroid.tolist(),
+                question_embedding=matrix[representative].tolist(),
+                threshold=threshold,
+                cluster_size=size,
+                answer=answer,
+                sources=[source.model_dump(mode="json") for source in sources],
+                status="pending" if settings.faq_require_review else "approved"
+            ))
+            progress["answered"] += 1
+
+        # Thay FAQ cũ của phiên bản trong cùng một transaction
+        self.db.query(FaqEntry).filter(FaqEntry.embedding_version == version.name).delete()
+        self.db.add_all(entries)
+        self.db.commit()
+
+        logger.info(f"Built {len(entries)} FAQ entries from {len(questions)} questions: {progress}")
+        return progress
+
+    def refresh(self, progress: Optional[dict] = None) -> dict:
+        """
+        Đối chiếu mọi câu trả lời với corpus hiện tại, sinh lại những câu có nguồn đã thay đổi
+
+        FAQ của phiên bản embedding cũ được embed lại câu đại diện bằng phiên bản active
+        (tâm cụm mới là embedding đó) rồi sinh lại câu trả lời.
+        """
+        progress = progress if progress is not None else {}
+        progress.update({"checked": 0, "unchanged": 0, "regenerated": 0, "reembedded": 0, "stale": 0})
+        version = embedding_registry.active()
+
+        entries = self.db.query(FaqEntry).filter(FaqEntry.status != "rejected").all()
+
+        for entry in entries:
+            progress["checked"] += 1
+            embedding = np.asarray(entry.question_embedding, dtype=np.float32).tolist()
+
+            reembedded = entry.embedding_version != version.name
+            if reembedded:
+                embedding = self.store.embed_query(entry.question, version)
+                entry.embedding_version = version.name
+                entry.centroid = embedding
+                entry.question_embedding = embedding
+                progress["reembedded"] += 1
+
+            sources = self._retrieve(entry.question, embedding, version)
+            entry.checked_at = datetime.utcnow()
+            unchanged = _source_keys(sources) == sorted(
+                f"{source.get('document_id')}:{source.get('chunk_index')}" for source in entry.sources or []
+            )
+            if unchanged and not reembedded and entry.status != "stale":
+                self.db.commit()
+                progress["unchanged"] += 1
+                continue
+
+            answer = self._generate(entry.question, sources) if sources else None
+            if answer is None:
+                entry.status = "stale"
+                progress["stale"] += 1
+            else:
+                entry.status = "pending" if settings.faq_require_review else "approved"
+                entry.answer = answer
+                entry.sources = [source.model_dump(mode="json") for source in sources]
+                progress["regenerated"] += 1
+            entry.updated_at = datetime.utcnow()
+            self.db.commit()
+
+        logger.info(f"Refreshed FAQ entries: {progress}")
+        return progress
+
+    def _answer(self, question: str, embedding: List[float],
+                version: VersionInfo) -> Tuple[Optional[str], List[SearchResult]]:
+        sources = self._retrieve(question, embedding, version)
+        if not sources:
+            return None, sources
+        return self._generate(question, sources), sources
+
+    def _retrieve(self, question: str, embedding: List[float], version: VersionInfo) -> List[SearchResult]:
+        hits = self.store.semantic_search(
+            question, max_results=settings.max_results, similarity_threshold=settings.similarity_threshold,
+            version=version, shadow=False, query_embedding=embedding
+        )
+        return self.store.expand_results(hits)
+
+    def _generate(self, question: str, sources: List[SearchResult]) -> Optional[str]:
+        """Câu trả lời từ model chính, None nếu gateway phải dùng tầng dự phòng hoặc trả lời rỗng"""
+        context = "\n".join(source.content for source in sources)
+        prompt = self.templates.render_turn(question=question, context=context, history="")
+        result = self.gateway.generate(prompt, sources)
+        if result.tier != "primary" or not result.text.strip():
+            return None
+        return result.text
+
+class FaqIndex:
+    """
+    Index trong bộ nhớ của các FAQ đã duyệt: tâm cụm đã chuẩn hóa thành một ma trận
+
+    Tra cứu là một phép nhân ma trận-vector với embedding của câu hỏi (đã tính sẵn cho
+    retrieval), chọn tâm gần nhất và so với ngưỡng của cụm đó. Thread nền tải lại
+    index khi bảng faq_entries thay đổi và làm mới câu trả lời khi documents đã thay đổi
+    (bộ đếm insert/update/delete của pg_stat_user_tables) rồi đứng yên faq_corpus_quiet_seconds,
+    hoặc đã quá faq_max_age_hours.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version: Optional[str] = None
+        self._centroids = np.zeros((0, 0), dtype=np.float32)
+        self._thresholds = np.zeros(0, dtype=np.float32)
+        self._entries: List[dict] = []
+        self._signature = None
+        self._corpus_signature = None
+        self._corpus_changed_at: Optional[datetime] = None  # Lần cuối thấy documents thay đổi, None nếu đã làm mới
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        self.stats = {"lookups": 0, "hits": 0, "hit_latency_ms": 0.0, "miss_latency_ms": 0.0, "refreshes": 0}
+
+    def load(self, db):
+        """Tải các FAQ đã duyệt của phiên bản embedding active"""
+        version = embedding_registry.active().name
+        rows = db.query(
+            FaqEntry.id, FaqEntry.question, FaqEntry.answer, FaqEntry.sources, FaqEntry.centroid, FaqEntry.threshold
+        ).filter(FaqEntry.status == "approved", FaqEntry.embedding_version == version).all()
+
+        centroids = _unit(np.asarray([row.centroid for row in rows], dtype=np.float32)) if rows \
+            else np.zeros((0, 0), dtype=np.float32)
+        entries = [{
+            "id": str(row.id),
+            "question": row.question,
+            "answer": row.answer,
+            "sources": [SearchResult(**source) for source in row.sources or []]
+        } for row in rows]
+
+        with self._lock:
+            self._version = version
+            self._centroids = centroids
+            self._thresholds = np.asarray([row.threshold for row in rows], dtype=np.float32)
+            self._entries = entries
+        logger.info(f"Loaded {len(entries)} FAQ entries for version {version}")
+
+    def lookup(self, query_embedding: List[float], version: str) -> Optional[FaqMatch]:
+        """
+        Tìm FAQ có tâm cụm gần câu hỏi nhất
+
+        Args:
+            query_embedding: Embedding của câu hỏi
+            version: Phiên bản embedding đã dùng để embed câu hỏi
+
+        Returns:
+            Optional[FaqMatch]: FAQ khớp, None nếu không cụm nào vượt ngưỡng
+        """
+        with self._lock:
+            centroids, thresholds, entries = self._centroids, self._thresholds, self._entries
+            if version != self._version or not entries:
+                return None
+
+        query = _unit(np.asarray(query_embedding, dtype=np.float32))
+        if query.shape[0] != centroids.shape[1]:
+            return None
+
+        similarities = centroids @ query
+        best = int(np.argmax(similarities))
+        if similarities[best] < thresholds[best]:
+            return None
+
+        entry = entries[best]
+        return FaqMatch(entry["id"], entry["question"], entry["answer"], entry["sources"], float(similarities[best]))
+
+    def record_turn(self, hit: bool, latency_ms: float):
+        """Ghi latency của một lượt chat (trả lời từ FAQ hoặc qua retrieval + generate)"""
+        with self._lock:
+            self.stats["lookups"] += 1
+            if hit:
+                self.stats["hits"] += 1
+                self.stats["hit_latency_ms"] += latency_ms
+            else:
+                self.stats["miss_latency_ms"] += latency_ms
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            entries = len(self._entries)
+            version = self._version
+
+        hits, misses = stats["hits"], stats["lookups"] - stats["hits"]
+        avg_hit = stats["hit_latency_ms"] / hits if hits else None
+        avg_miss = stats["miss_latency_ms"] / misses if misses else None
+        return {
+            "entries": entries,
+            "embedding_version": version,
+            "lookups": stats["lookups"],
+            "hits": hits,
+            "hit_rate": round(hits / stats["lookups"], 3) if stats["lookups"] else 0.0,
+            "avg_hit_latency_ms": round(avg_hit, 1) if avg_hit is not None else None,
+            "avg_miss_latency_ms": round(avg_miss, 1) if avg_miss is not None else None,
+            # Ước lượng: mỗi hit lẽ ra tốn latency trung bình của một lượt không khớp FAQ
+            "estimated_saved_ms": round(hits * (avg_miss - avg_hit), 1) if avg_hit is not None and avg_miss else None,
+            "refreshes": stats["refreshes"]
+        }
+
+    def refresh(self, session_factory, progress: Optional[dict] = None) -> dict:
+        """Làm mới câu trả lời rồi tải lại index; chỉ một worker chạy tại một thời điểm (advisory lock)"""
+        with engine.connect() as conn:
+            locked = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"),
+                                  {"key": REFRESH_LOCK_KEY}).scalar()
+            if not locked:
+                raise RuntimeError("FAQ refresh is already running")
+            try:
+                db = session_factory()
+                try:
+                    progress = FaqBuilder(db).refresh(progress)
+                    self.load(db)
+                finally:
+                    db.close()
+            finally:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), {"key": REFRESH_LOCK_KEY})
+
+        with self._lock:
+            self.stats["refreshes"] += 1
+        return progress
+
+    def check(self, session_factory):
+        """Tải lại index nếu faq_entries đổi; làm mới câu trả lời khi documents đổi xong hoặc đã quá hạn"""
+        db = session_factory()
+        try:
+            signature = tuple(db.execute(text(
+                "SELECT COUNT(*), MAX(updated_at), MAX(checked_at), MIN(checked_at) FROM faq_entries"
+            )).first())
+            corpus_signature = db.execute(text("""
+                SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables
+                WHERE relid = to_regclass('documents')
+            """)).scalar()
+            if signature != self._signature:
+                self.load(db)
+                self._signature = signature
+        finally:
+            db.close()
+
+        count, _, _, oldest_check = signature
+        now = datetime.utcnow()
+        if self._corpus_signature is not None and corpus_signature != self._corpus_signature:
+            self._corpus_changed_at = now
+        self._corpus_signature = corpus_signature
+
+        # Chỉ làm mới khi documents đã ngừng thay đổi faq_corpus_quiet_seconds (không
+        # re-retrieval/sinh lại liên tục trong lúc đang crawl), hoặc câu trả lời đã quá hạn
+        corpus_settled = self._corpus_changed_at is not None and \
+            now - self._corpus_changed_at >= timedelta(seconds=settings.faq_corpus_quiet_seconds)
+        expired = oldest_check is not None and \
+            oldest_check < now - timedelta(hours=settings.faq_max_age_hours)
+
+        if count and (corpus_settled or expired):
+            try:
+                self.refresh(session_factory)
+            except RuntimeError:
+                pass  # Worker khác đang làm mới
+            self._corpus_changed_at = None
+
+    def start_refresher(self, session_factory, interval: float = None):
+        """Chạy thread kiểm tra định kỳ (gọi một lần khi app khởi động)"""
+        if self._refresher and self._refresher.is_alive():
+            return
+
+        interval = interval or settings.faq_check_seconds
+        self._stop.clear()
+
+        def run():
+            while True:
+                try:
+                    self.check(session_factory)
+                except Exception as e:
+                    logger.warning(f"Error checking FAQ index: {str(e)}")
+
+                if self._stop.wait(interval):
+                    return
+
+        self._refresher = threading.Thread(target=run, name="faq-index", daemon=True)
+        self._refresher.start()
+
+    def stop_refresher(self):
+        self._stop.set()
+
+faq_index = FaqIndex()
+
+def main():
+    from app.models.database import SessionLocal
+    from app.utils.logging import setup_logging
+
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Dựng/làm mới câu trả lời FAQ từ câu hỏi lịch sử")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build")
+    build_parser.add_argument("--questions", nargs="+", required=True,
+                              help="File JSONL (question/message/query/title) hoặc text mỗi dòng một câu")
+    build_parser.add_argument("--clusters", type=int, default=None)
+    build_parser.add_argument("--min-cluster-size", type=int, default=None)
+
+    subparsers.add_parser("refresh")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        db = SessionLocal()
+        try:
+            result = FaqBuilder(db).build(load_questions(args.questions), args.clusters, args.min_cluster_size)
+        finally:
+            db.close()
+    else:
+        result = faq_index.refresh(SessionLocal)
+    print(json.dumps(result, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, List, Optional
+import random
+import re
+import threading
+import time
+import logging
+
+from app.config import settings
+from app.models.schemas import SearchResult
+from app.services.prompts import ChatModel, get_chat_model, get_prompt_templates
+from app.utils.lazy import LazyModule
+
+genai = LazyModule("google.generativeai")
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """
+    Circuit breaker theo số lỗi liên tiếp
+
+    closed: gọi bình thường. open: sau failure_threshold lỗi liên tiếp, từ chối mọi
+    lời gọi trong reset_seconds. half_open: hết thời gian chờ, cho đúng một lời gọi
+    thử; thành công thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def cancel_trial(self):
+        """Lời gọi thử không được thực hiện (không có slot), cho phép thử lại lần sau"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.warning(f"Circuit breaker opened after {self.failures} failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+class HelperModel:
+    """Model không gắn system instruction của tenant, cho các lời gọi phụ"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        genai.configure(api_key=settings.google_api_key)
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate_content(self, prompt: str, **kwargs):
+        return self._model.generate_content(prompt, **kwargs)
+
+class ModelTier:
+    """Một tầng model: slot giới hạn đồng thời, executor để áp deadline và circuit breaker riêng"""
+
+    def __init__(self, name: str, model: ChatModel, max_concurrency: int,
+                 timeout: Optional[float] = None, max_retries: Optional[int] = None):
+        self.name = name
+        self.model = model
+        self.timeout = timeout if timeout is not None else settings.llm_timeout_seconds
+        self.max_retries = max_retries if max_retries is not None else settings.llm_max_retries
+        self.breaker = CircuitBreaker(settings.llm_breaker_failure_threshold, settings.llm_breaker_reset_seconds)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Executor bằng đúng số slot: lời gọi không bao giờ xếp hàng bên trong executor
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"llm-{name}")
+        self._lock = threading.Lock()
+        self.max_concurrency = max_concurrency
+
+        self.stats = {
+            "waiting": 0,
+            "in_flight": 0,
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "retries": 0,
+            "shed": 0,
+            "breaker_rejections": 0
+        }
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self.stats[name] += delta
+
+    def generate(self, prompt: str, tenant: Optional[str] = None) -> Optional[Any]:
+        """
+        Gọi model với deadline và retry; trả về None nếu tầng này quá tải hoặc lỗi
+
+        Args:
+            prompt: Phần động của prompt
+            tenant: Prompt tenant (system instruction) của lời gọi, mặc định tenant của tầng
+
+        Returns:
+            Response của Gemini, hoặc None để chuyển sang tầng tiếp theo
+        """
+        # Cùng model nhưng system instruction khác: dùng chung slot và circuit breaker của tầng
+        model = self.model if tenant is None else get_chat_model(self.model.model_name, tenant)
+
+        if not self.breaker.allow():
+            self._count("breaker_rejections")
+            return None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._count("retries")
+                # Exponential backoff với full jitter
+                time.sleep(random.uniform(0, settings.llm_retry_base_delay * (2 ** (attempt - 1))))
+
+            # Slot được giữ tới khi lời gọi thực sự kết thúc, kể cả khi đã quá deadline
+            self._count("waiting")
+            acquired = self._slots.acquire(timeout=settings.llm_queue_timeout_seconds)
+            self._count("waiting", -1)
+            if not acquired:
+                self._count("shed")
+                self.breaker.cancel_trial()
+                return None
+
+            self._count("in_flight")
+            self._count("calls")
+            future = self._executor.submit(self._call, model, prompt)
+            future.add_done_callback(self._release)
+
+            try:
+                response = future.result(timeout=self.timeout)
+                self._count("successes")
+                self.breaker.record_success()
+                return response
+            except FutureTimeoutError:
+                self._count("timeouts")
+                logger.warning(f"LLM tier {self.name} timed out after {self.timeout}s")
+            except Exception as e:
+                self._count("failures")
+                logger.warning(f"LLM tier {self.name} failed (attempt {attempt + 1}): {str(e)}")
+
+            self.breaker.record_failure()
+            if not self.breaker.allow():
+                break
+
+        return None
+
+    @staticmethod
+    def _call(model: ChatModel, prompt: str):
+        response = model.generate_content(prompt)
+        response.text  # Response bị chặn (safety) raise ở đây và được tính là lỗi
+        return response
+
+    def _release(self, _future):
+        self._count("in_flight", -1)
+        self._slots.release()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["model"] = self.model.model_name
+        stats["max_concurrency"] = self.max_concurrency
+        stats["breaker_state"] = self.breaker.state
+        return stats
+
+@dataclass
+class GenerationResult:
+    text: str
+    tier: str  # Tên tầng đã trả lời: primary, fallback hoặc extractive
+    response: Any = None  # Response gốc của Gemini (None với extractive)
+
+class LLMGateway:
+    """
+    Điểm gọi LLM duy nhất cho câu trả lời chat
+
+    Thử lần lượt model chính rồi model nhỏ hơn; tầng nào hết slot trong
+    llm_queue_timeout_seconds, quá deadline hoặc circuit đang mở thì chuyển
+    xuống tầng sau. Khi mọi model đều không trả lời được, ghép câu trả lời
+    trích xuất trực tiếp từ các chunk tìm được.
+
+    Lời gọi phụ trên đường đi của request (viết lại câu hỏi, tóm tắt lịch sử) đi qua
+    tầng helper riêng với deadline ngắn, không dùng chung slot với câu trả lời.
+    """
+
+    def __init__(self, tiers: List[ModelTier], helper: Optional[ModelTier] = None):
+        self.tiers = tiers
+        self.helper = helper
+        self._lock = threading.Lock()
+        self.extractive_answers = 0
+
+    def generate(self, prompt: str, sources: List[SearchResult], tenant: Optional[str] = None) -> GenerationResult:
+        """
+        Sinh câu trả lời, hạ dần tầng khi quá tải
+
+        Args:
+            prompt: Phần động của prompt
+            sources: Kết quả tìm kiếm dùng cho câu trả lời trích xuất
+            tenant: Prompt tenant của collection, mặc định settings.prompt_tenant
+
+        Returns:
+            GenerationResult: Câu trả lời và tầng đã sinh ra nó
+        """
+        for tier in self.tiers:
+            response = tier.generate(prompt, tenant)
+            if response is not None:
+                return GenerationResult(response.text, tier.name, response)
+
+        with self._lock:
+            self.extractive_answers += 1
+        logger.warning("All LLM tiers unavailable, returning extractive answer")
+        return GenerationResult(self._extractive_answer(sources, tenant), "extractive")
+
+    def generate_helper(self, prompt: str) -> Optional[str]:
+        """
+        Lời gọi phụ qua tầng helper
+
+        Args:
+            prompt: Prompt đầy đủ (không kèm system instruction của tenant)
+
+        Returns:
+            Optional[str]: Text trả về, None khi không có tầng helper, quá tải, quá deadline hoặc lỗi
+        """
+        if self.helper is None:
+            return None
+
+        response = self.helper.generate(prompt)
+        return response.text.strip() if response is not None else None
+
+    def _extractive_answer(self, sources: List[SearchResult], tenant: Optional[str] = None,
+                           max_sources: int = 3, max_sentences: int = 2) -> str:
+        """Câu trả lời trích từ các nguồn tốt nhất, theo fallback.txt/unavailable.txt của tenant"""
+        templates = get_prompt_templates(tenant)
+        if not sources:
+            return templates.unavailable
+
+        lines = []
+        for source in sources[:max_sources]:
+            sentences = re.split(r"(?<=[.!?])\s+", " ".join(source.content.split()))
+            excerpt = " ".join(sentences[:max_sentences])
+            lines.append(f"- {source.document_title}: {excerpt} ({source.document_url})")
+
+        return templates.render_fallback("\n".join(lines))
+
+    def get_stats(self) -> dict:
+        """Queue depth, số request bị shed và trạng thái circuit breaker của từng tầng"""
+        tiers = {tier.name: tier.get_stats() for tier in self.tiers}
+        with self._lock:
+            extractive = self.extractive_answers
+
+        return {
+            "queue_depth": sum(stats["waiting"] for stats in tiers.values()),
+            "in_flight": sum(stats["in_flight"] for stats in tiers.values()),
+            "shed": sum(stats["shed"] + stats["breaker_rejections"] for stats in tiers.values()),
+            "extractive_answers": extractive,
+            "tiers": tiers,
+            "helper": self.helper.get_stats() if self.helper else None
+        }
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    """Gateway dùng chung cho cả process (giới hạn đồng thời áp cho mọi request)"""
+    global _gateway
+
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                tiers = [ModelTier("primary", get_chat_model(settings.chat_model), settings.llm_max_concurrency)]
+                if settings.fallback_chat_model and settings.fallback_chat_model != settings.chat_model:
+                    tiers.append(ModelTier(
+                        "fallback",
+                        get_chat_model(settings.fallback_chat_model),
+                        settings.llm_fallback_max_concurrency
+                    ))
+                helper = None
+                if settings.query_rewrite_model:
+                    helper = ModelTier(
+                        "helper",
+                        HelperModel(settings.query_rewrite_model),
+                        settings.llm_helper_max_concurrency,
+                        timeout=settings.llm_helper_timeout_seconds,
+                        max_retries=0
+                    )
+                _gateway = LLMGateway(tiers, helper)
+
+    return _gateway
@@ -0,0 +1,264 @@
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+import threading
+import logging
+
+from sqlalchemy import text
+
+from app.models.database import SessionLocal, engine
+from app.services.partitions import partition_manager
+from app.services.vector_store import PgVectorStore
+
+logger = logging.getLogger(__name__)
+
+# Tên các partition của chunks (chunks_p<YYYYMM>, chunks_p_legacy)
+CHUNK_PARTITIONS_SQL = """
+    SELECT pc.relname FROM pg_inherits h JOIN pg_class pc ON pc.oid = h.inhrelid
+    WHERE h.inhparent = to_regclass('chunks')
+"""
+
+# Index ANN cần REINDEX sau khi xóa nhiều (ivfflat giữ nguyên centroid cũ, HNSW giữ node đã xóa)
+ANN_INDEX_METHODS = ("ivfflat", "hnsw")
+
+@dataclass
+class MaintenanceJob:
+    id: str
+    # bulk_delete, vacuum, reindex, reembed, drop_epoch, compact_text, faq_build, faq_refresh,
+    # collection_index, collection_delete
+    kind: str
+    params: dict = field(default_factory=dict)
+    status: str = "pending"  # pending, running, completed, failed
+    step: Optional[str] = None
+    progress: dict = field(default_factory=dict)
+    error: Optional[str] = None
+    created_at: datetime = field(default_factory=datetime.utcnow)
+    finished_at: Optional[datetime] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+class MaintenanceRunner:
+    """
+    Chạy bulk delete và VACUUM/REINDEX trong background thread, mỗi lúc một job
+
+    Job được giữ trong bộ nhớ của process; trạng thái và tiến độ đọc qua get_job.
+    VACUUM và REINDEX CONCURRENTLY không chạy được trong transaction nên dùng
+    connection AUTOCOMMIT riêng.
+    """
+
+    def __init__(self):
+        self.jobs: Dict[str, MaintenanceJob] = {}
+        self._lock = threading.Lock()
+        # Một job tại một thời điểm: hai VACUUM/REINDEX song song chỉ tranh I/O với search
+        self._run_lock = threading.Lock()
+
+    def submit_bulk_delete(self, domain: Optional[str] = None, url_prefix: Optional[str] = None,
+                           created_before: Optional[datetime] = None, batch_size: int = 500,
+                           vacuum: bool = False, reindex: bool = False,
+                           collection: Optional[str] = None) -> MaintenanceJob:
+        params = {
+            "domain": domain, "url_prefix": url_prefix,
+            "created_before": created_before.isoformat() if created_before else None,
+            "collection": collection, "batch_size": batch_size, "vacuum": vacuum, "reindex": reindex
+        }
+
+        def run(job: MaintenanceJob):
+            job.step = "delete"
+            db = SessionLocal()
+            try:
+                PgVectorStore(db).bulk_delete(
+                    domain=domain, url_prefix=url_prefix, created_before=created_before,
+                    batch_size=batch_size, progress=job.progress, collection=collection
+                )
+            finally:
+                db.close()
+
+            if job.progress.get("documents_deleted") and vacuum:
+                self._vacuum(job)
+            if job.progress.get("documents_deleted") and reindex:
+                self._reindex(job)
+
+        return self._submit("bulk_delete", params, run)
+
+    def submit_reembed(self, version: str) -> MaintenanceJob:
+        from app.services.embedding_versions import reembedding_service
+
+        def run(job: MaintenanceJob):
+            job.step = "reembed"
+            reembedding_service.backfill(version, job.progress)
+
+        return self._submit("reembed", {"version": version}, run)
+
+    def submit_drop_epoch(self, epoch: int) -> MaintenanceJob:
+        def run(job: MaintenanceJob):
+            job.step = "drop"
+            partition_manager.drop_epoch(epoch, job.progress)
+
+        return self._submit("drop_epoch", {"epoch": epoch}, run)
+
+    def submit_compact_text(self, batch_size: int = 1000, vacuum: bool = True) -> MaintenanceJob:
+        def run(job: MaintenanceJob):
+            job.step = "compact"
+            db = SessionLocal()
+            try:
+                PgVectorStore(db).compact_chunk_text(batch_size=batch_size, progress=job.progress)
+            finally:
+                db.close()
+
+            if job.progress.get("compacted") and vacuum:
+                self._vacuum(job, ["chunks"])
+
+        return self._submit("compact_text", {"batch_size": batch_size, "vacuum": vacuum}, run)
+
+    def submit_faq_build(self, paths: List[str], n_clusters: Optional[int] = None,
+                         min_cluster_size: Optional[int] = None) -> MaintenanceJob:
+        from app.services.faq import FaqBuilder, faq_index, load_questions
+
+        def run(job: MaintenanceJob):
+            job.step = "build"
+            db = SessionLocal()
+            try:
+                FaqBuilder(db).build(load_questions(paths), n_clusters, min_cluster_size, job.progress)
+                faq_index.load(db)
+            finally:
+                db.close()
+
+        params = {"paths": paths, "n_clusters": n_clusters, "min_cluster_size": min_cluster_size}
+        return self._submit("faq_build", params, run)
+
+    def submit_faq_refresh(self) -> MaintenanceJob:
+        from app.services.faq import faq_index
+
+        def run(job: MaintenanceJob):
+            job.step = "refresh"
+            faq_index.refresh(SessionLocal, job.progress)
+
+        return self._submit("faq_refresh", {}, run)
+
+    def submit_collection_index(self, name: str, rebuild: bool = False) -> MaintenanceJob:
+        from app.services.collection_registry import collection_service
+
+        def run(job: MaintenanceJob):
+            job.step = "reindex" if rebuild else "index"
+            collection_service.build_index(name, rebuild=rebuild, progress=job.progress)
+
+        return self._submit("collection_index", {"collection": name, "rebuild": rebuild}, run)
+
+    def submit_collection_delete(self, name: str) -> MaintenanceJob:
+        from app.services.collection_registry import collection_service
+
+        def run(job: MaintenanceJob):
+            job.step = "delete"
+            collection_service.delete(name, job.progress)
+
+        return self._submit("collection_delete", {"collection": name}, run)
+
+    def submit_vacuum(self, tables: List[str] = None) -> MaintenanceJob:
+        tables = tables or ["chunks", "documents"]
+        return self._submit("vacuum", {"tables": tables}, lambda job: self._vacuum(job, tables))
+
+    def submit_reindex(self) -> MaintenanceJob:
+        return self._submit("reindex", {}, self._reindex)
+
+    def get_job(self, job_id: str) -> Optional[dict]:
+        """Trạng thái job, kèm tiến độ trực tiếp từ pg_stat_progress_* khi đang VACUUM/REINDEX"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+
+        result = job.to_dict()
+        if job.status == "running" and job.step in ("vacuum", "reindex"):
+            result["live_progress"] = self._live_progress(job.step)
+        return result
+
+    def list_jobs(self) -> List[dict]:
+        with self._lock:
+            jobs = sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+        return [job.to_dict() for job in jobs]
+
+    def _submit(self, kind: str, params: dict, run: Callable[[MaintenanceJob], None]) -> MaintenanceJob:
+        job = MaintenanceJob(id=str(uuid4()), kind=kind, params=params)
+        with self._lock:
+            self.jobs[job.id] = job
+
+        def target():
+            with self._run_lock:
+                job.status = "running"
+                try:
+                    run(job)
+                    job.status = "completed"
+                except Exception as e:
+                    job.status = "failed"
+                    job.error = str(e)
+                    logger.error(f"Maintenance job {job.id} ({kind}) failed: {str(e)}")
+                finally:
+                    job.step = None
+                    job.finished_at = datetime.utcnow()
+
+        threading.Thread(target=target, name=f"maintenance-{kind}", daemon=True).start()
+        logger.info(f"Submitted maintenance job {job.id} ({kind})")
+        return job
+
+    def _vacuum(self, job: MaintenanceJob, tables: List[str] = None):
+        job.step = "vacuum"
+        vacuumed = job.progress.setdefault("vacuumed", [])
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table in tables or ["chunks", "documents"]:
+                if table not in ("chunks", "documents"):
+                    raise ValueError(f"Unsupported table: {table}")
+                conn.execute(text(f"VACUUM (ANALYZE) {table}"))
+                vacuumed.append(table)
+                logger.info(f"Vacuumed {table}")
+
+    def _reindex(self, job: MaintenanceJob):
+        """
+        REINDEX CONCURRENTLY các index ANN (ivfflat/hnsw): của chunks (trên từng partition,
+        gồm cả index ix_coll_* của collection) và của chunk_embeddings
+
+        Index của bảng cha đã chia partition không có dữ liệu riêng và không REINDEX
+        CONCURRENTLY được, nên chỉ lấy index lá (relkind 'i').
+        """
+        job.step = "reindex"
+        reindexed = job.progress.setdefault("reindexed", [])
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            indexes = [
+                row.indexname for row in conn.execute(text(f"""
+                    SELECT i.indexname, i.indexdef
+                    FROM pg_indexes i
+                    JOIN pg_class ic ON ic.oid = to_regclass(quote_ident(i.schemaname) || '.' || quote_ident(i.indexname))
+                    WHERE ic.relkind = 'i'
+                      AND (i.tablename IN ('chunks', 'chunk_embeddings') OR i.tablename IN ({CHUNK_PARTITIONS_SQL}))
+                    ORDER BY i.tablename, i.indexname
+                """))
+                if any(f"USING {method}" in row.indexdef for method in ANN_INDEX_METHODS)
+            ]
+            job.progress["indexes_total"] = len(indexes)
+
+            for name in indexes:
+                # CONCURRENTLY: search vẫn đọc index cũ trong lúc build index mới
+                conn.execute(text(f'REINDEX INDEX CONCURRENTLY "{name}"'))
+                reindexed.append(name)
+                logger.info(f"Reindexed {name}")
+
+    def _live_progress(self, step: str) -> Optional[dict]:
+        view = "pg_stat_progress_vacuum" if step == "vacuum" else "pg_stat_progress_create_index"
+        try:
+            with engine.connect() as conn:
+                # VACUUM/REINDEX trên chunks chạy trên từng partition chunks_p*
+                row = conn.execute(text(f"""
+                    SELECT p.*, c.relname
+                    FROM {view} p JOIN pg_class c ON c.oid = p.relid
+                    WHERE c.relname IN ('chunks', 'documents', 'chunk_embeddings')
+                       OR c.relname IN ({CHUNK_PARTITIONS_SQL})
+                    LIMIT 1
+                """)).mappings().first()
+            return {key: value for key, value in row.items() if value is not None} if row else None
+        except Exception as e:
+            logger.warning(f"Error reading {view}: {str(e)}")
+            return None
+
+maintenance_runner = MaintenanceRunner()
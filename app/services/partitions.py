@@ -0,0 +1,149 @@
+from typing import List, Optional, Set
+import re
+import threading
+import logging
+
+from sqlalchemy import text
+
+from app.models.database import engine
+from app.services.corpus_stats import corpus_stats
+from app.utils.helpers import ingest_epoch, next_epoch
+
+logger = logging.getLogger(__name__)
+
+LEGACY_EPOCH = 0
+PARTITION_NAME_PATTERN = re.compile(r"^chunks_p(\d{6}|_legacy)$")
+
+def partition_name(epoch: int) -> str:
+    return "chunks_p_legacy" if epoch == LEGACY_EPOCH else f"chunks_p{epoch}"
+
+class ChunkPartitionManager:
+    """
+    Tạo và xóa partition theo tháng của bảng chunks
+
+    Partition của tháng hiện tại và tháng sau được tạo khi app khởi động; ingest gọi
+    ensure() cho epoch của mình (no-op khi partition đã biết). DDL chạy trên
+    connection AUTOCOMMIT riêng để không giữ lock trên chunks trong transaction ingest.
+    Bảng chunks chưa chia partition (chưa chạy 010) vẫn ingest được: ensure() là no-op.
+    """
+
+    def __init__(self):
+        self._known: Set[int] = set()
+        self._lock = threading.Lock()
+        self._partitioned: Optional[bool] = None  # Kiểm tra một lần mỗi process
+
+    def ensure(self, epoch: int):
+        """Tạo partition cho epoch nếu chưa có (bỏ qua khi chunks chưa chia partition)"""
+        if epoch in self._known:
+            return
+
+        with self._lock:
+            if epoch in self._known:
+                return
+            if self._partitioned is None:
+                self._partitioned = self.is_partitioned()
+            if not self._partitioned:
+                self._known.add(epoch)
+                return
+
+            upper = 1 if epoch == LEGACY_EPOCH else next_epoch(epoch)
+            lower = "MINVALUE" if epoch == LEGACY_EPOCH else str(epoch)
+            with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f"""
+                    CREATE TABLE IF NOT EXISTS {partition_name(epoch)}
+                    PARTITION OF chunks FOR VALUES FROM ({lower}) TO ({upper})
+                """))
+            self._known.add(epoch)
+            logger.info(f"Ensured chunk partition {partition_name(epoch)}")
+
+    def ensure_upcoming(self):
+        """Partition cho tháng hiện tại và tháng sau (gọi khi khởi động)"""
+        if not self.is_partitioned():
+            logger.warning("Table chunks is not partitioned, apply migrations/upgrades/010_partitioned_chunks.sql")
+            return
+
+        current = ingest_epoch()
+        self.ensure(current)
+        self.ensure(next_epoch(current))
+
+    def is_partitioned(self) -> bool:
+        with engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('chunks')"
+            )).scalar() or False
+
+    def list_partitions(self) -> List[dict]:
+        """Các partition của chunks kèm số row ước lượng và kích thước (heap, TOAST, index)"""
+        with engine.connect() as conn:
+            rows = conn.execute(text("""
+                SELECT c.relname,
+                       GREATEST(c.reltuples, 0)::bigint AS estimated_rows,
+                       pg_table_size(c.oid) AS table_bytes,
+                       pg_indexes_size(c.oid) AS index_bytes,
+                       pg_get_expr(c.relpartbound, c.oid) AS bounds
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = to_regclass('chunks')
+                ORDER BY c.relname
+            """)).fetchall()
+
+        partitions = []
+        for row in rows:
+            match = PARTITION_NAME_PATTERN.match(row.relname)
+            partitions.append({
+                "name": row.relname,
+                "epoch": (LEGACY_EPOCH if match.group(1) == "_legacy" else int(match.group(1))) if match else None,
+                "bounds": row.bounds,
+                "estimated_rows": row.estimated_rows,
+                "table_bytes": row.table_bytes,
+                "index_bytes": row.index_bytes
+            })
+        return partitions
+
+    def drop_epoch(self, epoch: int, progress: Optional[dict] = None) -> dict:
+        """
+        Xóa toàn bộ dữ liệu của một epoch: DETACH + DROP partition chunks, rồi xóa documents
+
+        Không phải DELETE từng chunk nên không để lại dead tuple hay cần VACUUM/REINDEX.
+
+        Args:
+            epoch: Epoch cần xóa (YYYYMM, hoặc 0 cho dữ liệu trước khi chia partition)
+            progress: Dict được cập nhật tiến độ
+
+        Returns:
+            dict: Partition đã drop và số row đã xóa
+        """
+        progress = progress if progress is not None else {}
+        name = partition_name(epoch)
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            exists = conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar()
+            if not exists:
+                raise ValueError(f"Partition {name} does not exist")
+
+            chunks = conn.execute(text(
+                "SELECT GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = to_regclass(:name)"
+            ), {"name": name}).scalar()
+
+            # Foreign key tới chunks chặn DETACH khi còn row tham chiếu
+            progress["chunk_embeddings_deleted"] = conn.execute(
+                text("DELETE FROM chunk_embeddings WHERE ingest_epoch = :epoch"), {"epoch": epoch}
+            ).rowcount
+
+            conn.execute(text(f"ALTER TABLE chunks DETACH PARTITION {name}"))
+            conn.execute(text(f"DROP TABLE {name}"))
+            progress["partition_dropped"] = name
+            logger.info(f"Dropped chunk partition {name}")
+
+            progress["documents_deleted"] = conn.execute(
+                text("DELETE FROM documents WHERE ingest_epoch = :epoch"), {"epoch": epoch}
+            ).rowcount
+
+        with self._lock:
+            self._known.discard(epoch)
+        corpus_stats.record_delete(progress["documents_deleted"], chunks)
+
+        logger.info(f"Dropped epoch {epoch}: {progress}")
+        return progress
+
+partition_manager = ChunkPartitionManager()
@@ -0,0 +1,492 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Dict, List, Optional
+import functools
+import heapq
+import inspect
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Session profile của request hiện tại (None khi profiling tắt hoặc ngoài request)
+profile_session_var: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+
+CAPTURE_ID_PATTERN = re.compile(r"^\d{8}T\d{12}-[0-9a-f]{8}$")
+
+MAX_STACK_DEPTH = 64
+MAX_TOP_FUNCTIONS = 50
+MAX_SQL_TRACKED = 20  # Câu SQL lâu nhất giữ lại mỗi request
+MAX_SQL_TEXT = 4000
+MAX_PARAM_TEXT = 200
+EXPLAIN_TIMEOUT_MS = 5000
+
+def _frame_label(frame) -> str:
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+def _fold_stack(frame) -> str:
+    """Stack từ gốc tới frame đang chạy, dạng "module:function;..." (định dạng flamegraph)"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return ";".join(labels)
+
+def _truncate(value, limit: int) -> str:
+    value = str(value)
+    return value if len(value) <= limit else value[:limit] + "..."
+
+def _profiled_endpoint(call):
+    """Bọc endpoint để thread chạy nó được gắn vào profile session của request"""
+    if getattr(call, "_profiled", False):
+        return call
+
+    if inspect.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def async_wrapper(*args, **kwargs):
+            session = profile_session_var.get()
+            if session is None:
+                return await call(*args, **kwargs)
+            ident = threading.get_ident()
+            session.attach(ident)
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                session.detach(ident)
+
+        async_wrapper._profiled = True
+        return async_wrapper
+
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        session = profile_session_var.get()
+        if session is None:
+            return call(*args, **kwargs)
+        ident = threading.get_ident()
+        session.attach(ident)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            session.detach(ident)
+
+    wrapper._profiled = True
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """
+    Route class cho router (APIRouter(route_class=ProfiledRoute)): endpoint được bọc lúc tạo route
+
+    Endpoint sync chạy trong threadpool nên sampler cần biết thread nào thuộc request
+    nào; endpoint async chạy chung event loop nên stack lấy được có thể gồm cả việc
+    của request khác đang chạy xen kẽ.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _profiled_endpoint(endpoint), **kwargs)
+
+class ProfileSession:
+    """Stack đã lấy mẫu và các câu SQL của một request"""
+
+    def __init__(self, method: str, path: str, request_id: Optional[str], sampled: bool):
+        started_at = datetime.utcnow()
+        self.id = f"{started_at:%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.request_id = request_id
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.started_at = started_at
+        self.finished = False
+        self.threads: Dict[int, int] = {}  # thread ident -> số lần attach lồng nhau
+        self.stacks: Counter = Counter()
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self._sql: List[tuple] = []  # heap (duration_ms, seq, statement, params)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def attach(self, ident: int):
+        with self._lock:
+            self.threads[ident] = self.threads.get(ident, 0) + 1
+
+    def detach(self, ident: int):
+        with self._lock:
+            count = self.threads.get(ident, 0) - 1
+            if count > 0:
+                self.threads[ident] = count
+            else:
+                self.threads.pop(ident, None)
+
+    def attached_threads(self) -> List[int]:
+        with self._lock:
+            return list(self.threads)
+
+    def record_sample(self, stack: str):
+        if self.finished:
+            return
+
+        with self._lock:
+            self.stacks[stack] += 1
+
+    def record_sql(self, statement: str, params, duration_ms: float):
+        if self.finished:
+            return
+
+        with self._lock:
+            self.sql_count += 1
+            self.sql_ms += duration_ms
+            item = (duration_ms, next(self._seq), statement, params)
+            if len(self._sql) < MAX_SQL_TRACKED:
+                heapq.heappush(self._sql, item)
+            elif duration_ms > self._sql[0][0]:
+                heapq.heapreplace(self._sql, item)
+
+    def stack_counts(self) -> Counter:
+        with self._lock:
+            return Counter(self.stacks)
+
+    def slowest_sql(self) -> List[tuple]:
+        with self._lock:
+            return sorted(self._sql, key=lambda item: item[0], reverse=True)
+
+class SamplingProfiler:
+    """
+    Sampling profiler theo request, chi phí thấp, bật/tắt lúc chạy
+
+    Một thread nền đọc stack của các thread đang xử lý request qua sys._current_frames()
+    mỗi interval_ms; không dùng sys.setprofile/cProfile nên request không bị chậm thêm
+    theo số lần gọi hàm. Request được lấy mẫu ngẫu nhiên (sample_rate) được profile từ
+    đầu; request khác chỉ bắt đầu được lấy stack khi đã chạy quá watch_ms, nên request
+    chậm (>= slow_ms) luôn có profile mà không phải profile mọi request.
+
+    Capture (JSON: bảng hàm self/total kiểu pstats, SQL lâu nhất, EXPLAIN với request chậm;
+    kèm file .folded cho flamegraph.pl/speedscope) được ghi ở thread riêng sau khi
+    response đã gửi xong.
+    """
+
+    def __init__(self):
+        self.enabled = settings.profiling_enabled
+        self.sample_rate = settings.profiling_sample_rate
+        self.slow_ms = settings.profiling_slow_ms
+        self.watch_ms = settings.profiling_watch_ms
+        self.interval_ms = settings.profiling_interval_ms
+        self.capture_dir = settings.profiling_dir
+        self.max_captures = settings.profiling_max_captures
+        self.explain_top = settings.profiling_explain_top
+
+        self._lock = threading.Lock()
+        self._active: Dict[str, ProfileSession] = {}
+        self._sampler: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._writer = self._new_writer()
+        self._engine = None
+        self._stats = Counter()
+
+    def configure(self, enabled: bool = None, sample_rate: float = None, slow_ms: float = None):
+        """Đổi cấu hình lúc chạy (chỉ áp dụng cho worker hiện tại)"""
+        if sample_rate is not None:
+            self.sample_rate = sample_rate
+        if slow_ms is not None:
+            self.slow_ms = slow_ms
+        if enabled is not None:
+            self.enabled = enabled
+            if enabled:
+                self.start_sampler()
+        logger.info(
+            "Profiling config: enabled=%s sample_rate=%s slow_ms=%s",
+            self.enabled, self.sample_rate, self.slow_ms
+        )
+
+    def start(self, method: str, path: str, request_id: Optional[str] = None) -> Optional[ProfileSession]:
+        """Mở session cho một request; None khi profiling đang tắt"""
+        if not self.enabled:
+            return None
+
+        session = ProfileSession(method, path, request_id, sampled=random.random() < self.sample_rate)
+        with self._lock:
+            self._active[session.id] = session
+            self._stats["requests"] += 1
+            if session.sampled:
+                self._stats["sampled"] += 1
+        self._wakeup.set()
+        return session
+
+    def finish(self, session: ProfileSession, status: Optional[int]):
+        """Đóng session; request được lấy mẫu hoặc chậm được ghi capture ở background"""
+        duration_ms = (time.perf_counter() - session.started) * 1000
+        session.finished = True
+        with self._lock:
+            self._active.pop(session.id, None)
+
+        slow = duration_ms >= self.slow_ms
+        if not (slow or session.sampled):
+            return
+
+        with self._lock:
+            self._stats["slow" if slow else "sampled_captures"] += 1
+        logger.debug("Profile capture %s: %s %s %.1fms", session.id, session.method, session.path, duration_ms)
+        self._writer.submit(self._write_capture, session, status, duration_ms, slow)
+
+    def start_sampler(self):
+        """Chạy thread lấy mẫu stack (gọi khi app khởi động hoặc khi bật profiling)"""
+        if self._sampler and self._sampler.is_alive():
+            return
+
+        self._stop.clear()
+        self._sampler = threading.Thread(target=self._run_sampler, name="profile-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop_sampler(self):
+        """Dừng sampler và chờ ghi xong các capture; capture sau đó đi vào writer mới"""
+        self._stop.set()
+        self._wakeup.set()
+        writer, self._writer = self._writer, self._new_writer()
+        writer.shutdown(wait=True)
+
+    @staticmethod
+    def _new_writer() -> ThreadPoolExecutor:
+        # Thread của executor chỉ được tạo khi có capture đầu tiên
+        return ThreadPoolExecutor(max_workers=1, thread_name_prefix="profile-writer")
+
+    def _run_sampler(self):
+        own_ident = threading.get_ident()
+        while not self._stop.is_set():
+            with self._lock:
+                sessions = list(self._active.values())
+
+            if not sessions:
+                # Không có request nào: ngủ tới khi có request mới
+                self._wakeup.wait(1.0)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self._sample(sessions, own_ident)
+            except Exception as e:
+                logger.warning(f"Error sampling stacks: {str(e)}")
+
+            self._stop.wait(self.interval_ms / 1000)
+
+    def _sample(self, sessions: List[ProfileSession], own_ident: int):
+        watch_after = time.perf_counter() - self.watch_ms / 1000
+        targets = [
+            (session, session.attached_threads()) for session in sessions
+            if session.sampled or session.started <= watch_after
+        ]
+        if not any(threads for _, threads in targets):
+            return
+
+        frames = sys._current_frames()
+        for session, threads in targets:
+            for ident in threads:
+                frame = frames.get(ident)
+                if frame is not None and ident != own_ident:
+                    session.record_sample(_fold_stack(frame))
+
+    def install_sql_hooks(self, engine):
+        """Đo thời gian từng câu SQL của request đang được profile (dùng lại engine cho EXPLAIN)"""
+        if self._engine is engine:
+            return
+        self._engine = engine
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if profile_session_var.get() is not None:
+                conn.info.setdefault("profile_query_start", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            session = profile_session_var.get()
+            starts = conn.info.get("profile_query_start")
+            if session is None or not starts:
+                return
+            duration_ms = (time.perf_counter() - starts.pop()) * 1000
+            session.record_sql(statement, None if executemany else parameters, duration_ms)
+
+    def _write_capture(self, session: ProfileSession, status: Optional[int], duration_ms: float, slow: bool):
+        try:
+            os.makedirs(self.capture_dir, exist_ok=True)
+
+            stacks = session.stack_counts()
+            self_counts = Counter()
+            total_counts = Counter()
+            for stack, count in stacks.items():
+                labels = stack.split(";")
+                self_counts[labels[-1]] += count
+                for label in set(labels):
+                    total_counts[label] += count
+
+            samples = sum(stacks.values()) or 1
+            top_functions = [
+                {
+                    "function": label,
+                    "self": count,
+                    "total": total_counts[label],
+                    "self_pct": round(count * 100 / samples, 1),
+                    "total_pct": round(total_counts[label] * 100 / samples, 1)
+                }
+                for label, count in self_counts.most_common(MAX_TOP_FUNCTIONS)
+            ]
+
+            slowest = session.slowest_sql()
+            sql = [
+                {
+                    "duration_ms": round(duration, 2),
+                    "statement": _truncate(statement, MAX_SQL_TEXT),
+                    "params": self._format_params(params)
+                }
+                for duration, _, statement, params in slowest
+            ]
+            if slow:
+                for item, (_, _, statement, params) in zip(sql, slowest[:self.explain_top]):
+                    item["explain"] = self._explain(statement, params)
+
+            capture = {
+                "id": session.id,
+                "kind": "slow" if slow else "sampled",
+                "method": session.method,
+                "path": session.path,
+                "status": status,
+                "request_id": session.request_id,
+                "captured_at": session.started_at.isoformat(),
+                "duration_ms": round(duration_ms, 1),
+                # Request không được lấy mẫu chỉ có stack từ watch_ms trở đi
+                "profiled_from_ms": 0 if session.sampled else self.watch_ms,
+                "interval_ms": self.interval_ms,
+                "samples": sum(stacks.values()),
+                "sql_count": session.sql_count,
+                "sql_ms": round(session.sql_ms, 1),
+                "top_functions": top_functions,
+                "sql": sql
+            }
+
+            # File .folded trước, JSON sau: có JSON là capture đã ghi xong
+            folded_path = os.path.join(self.capture_dir, f"{session.id}.folded")
+            with open(folded_path + ".tmp", "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            os.replace(folded_path + ".tmp", folded_path)
+
+            json_path = os.path.join(self.capture_dir, f"{session.id}.json")
+            with open(json_path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(capture, f, ensure_ascii=False, default=str)
+            os.replace(json_path + ".tmp", json_path)
+
+            with self._lock:
+                self._stats["captures"] += 1
+            self._prune()
+
+        except Exception as e:
+            with self._lock:
+                self._stats["capture_errors"] += 1
+            logger.error(f"Error writing profile capture {session.id}: {str(e)}")
+
+    @staticmethod
+    def _format_params(params):
+        if params is None:
+            return None
+        if isinstance(params, dict):
+            return {key: _truncate(value, MAX_PARAM_TEXT) for key, value in params.items()}
+        if isinstance(params, (list, tuple)):
+            return [_truncate(value, MAX_PARAM_TEXT) for value in params]
+        return _truncate(params, MAX_PARAM_TEXT)
+
+    def _explain(self, statement: str, params):
+        """EXPLAIN (không ANALYZE, không chạy câu lệnh) với đúng tham số của request"""
+        if self._engine is None or params is None:
+            return None
+        if not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+            return None
+
+        try:
+            with self._engine.connect() as conn:
+                conn.exec_driver_sql(f"SET LOCAL statement_timeout = {EXPLAIN_TIMEOUT_MS}")
+                plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", params).scalar()
+                conn.rollback()
+            return plan
+        except Exception as e:
+            logger.warning(f"Error explaining profiled query: {str(e)}")
+            return {"error": _truncate(e, MAX_PARAM_TEXT)}
+
+    def _prune(self):
+        captures = sorted(name[:-5] for name in os.listdir(self.capture_dir) if name.endswith(".json"))
+        for capture_id in captures[:-self.max_captures] if self.max_captures > 0 else []:
+            for suffix in (".json", ".folded"):
+                try:
+                    os.remove(os.path.join(self.capture_dir, capture_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def capture_path(self, capture_id: str, suffix: str = ".json") -> Optional[str]:
+        """Đường dẫn file của capture; None nếu id không hợp lệ hoặc không tồn tại"""
+        if not CAPTURE_ID_PATTERN.match(capture_id):
+            return None
+        path = os.path.join(self.capture_dir, capture_id + suffix)
+        return path if os.path.isfile(path) else None
+
+    def get_capture(self, capture_id: str) -> Optional[dict]:
+        path = self.capture_path(capture_id)
+        if path is None:
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_captures(self, limit: int = 50, kind: Optional[str] = None) -> List[dict]:
+        """Tóm tắt các capture mới nhất (của mọi worker dùng chung capture_dir)"""
+        if not os.path.isdir(self.capture_dir):
+            return []
+
+        summaries = []
+        ids = sorted((name[:-5] for name in os.listdir(self.capture_dir) if name.endswith(".json")), reverse=True)
+        for capture_id in ids:
+            try:
+                capture = self.get_capture(capture_id)
+            except (OSError, ValueError):
+                continue
+            if capture is None or (kind and capture.get("kind") != kind):
+                continue
+            summaries.append({
+                key: capture.get(key) for key in (
+                    "id", "kind", "method", "path", "status", "request_id", "captured_at",
+                    "duration_ms", "samples", "sql_count", "sql_ms"
+                )
+            })
+            if len(summaries) >= limit:
+                break
+        return summaries
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            active = len(self._active)
+
+        return {
+            "enabled": self.enabled,
+            "sample_rate": self.sample_rate,
+            "slow_ms": self.slow_ms,
+            "watch_ms": self.watch_ms,
+            "interval_ms": self.interval_ms,
+            "active_requests": active,
+            **{key: stats.get(key, 0) for key in (
+                "requests", "sampled", "sampled_captures", "slow", "captures", "capture_errors"
+            )}
+        }
+
+profiler = SamplingProfiler()
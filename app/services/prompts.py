@@ -0,0 +1,157 @@
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from string import Template
+from typing import Dict, Optional, Tuple
+import threading
+import logging
+
+from app.config import settings
+from app.utils.lazy import LazyModule
+
+genai = LazyModule("google.generativeai")
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE_DIR = Path(__file__).resolve().parent.parent / "prompts"
+
+# Câu trả lời khi không gọi được LLM, dùng khi tenant không có fallback.txt/unavailable.txt
+DEFAULT_FALLBACK = Template(
+    "Dạ, hệ thống đang bận, em xin gửi anh/chị thông tin liên quan nhất em tìm được:\n"
+    "$sources\n"
+    "Anh/chị cần thêm thông tin gì, em xin hỗ trợ ạ."
+)
+DEFAULT_UNAVAILABLE = "Dạ, hệ thống đang bận nên em chưa thể trả lời ngay. Anh/chị vui lòng thử lại sau ạ."
+
+@dataclass(frozen=True)
+class PromptTemplates:
+    """
+    Prompt của một tenant, gồm hai phần:
+
+    system_instruction: phần tĩnh (vai trò, hướng dẫn trả lời), giống hệt nhau ở
+    mọi lượt nên được gắn một lần vào model và có thể cache phía provider.
+    turn: phần động của mỗi lượt (lịch sử, cơ sở kiến thức, câu hỏi).
+    fallback/unavailable: câu trả lời trích xuất khi không gọi được LLM (có/không có nguồn).
+    """
+    tenant: str
+    system_instruction: str
+    turn: Template
+    fallback: Template = DEFAULT_FALLBACK
+    unavailable: str = DEFAULT_UNAVAILABLE
+
+    def render_turn(self, question: str, context: str, history: str) -> str:
+        return self.turn.substitute(question=question, context=context, history=history)
+
+    def render_fallback(self, sources: str) -> str:
+        return self.fallback.substitute(sources=sources).strip()
+
+_templates: Dict[str, PromptTemplates] = {}
+_templates_lock = threading.Lock()
+
+def get_prompt_templates(tenant: Optional[str] = None) -> PromptTemplates:
+    """
+    Lấy prompt templates của tenant, đọc và compile từ file ở lần gọi đầu tiên
+
+    Args:
+        tenant: Tên tenant (thư mục con trong prompt_template_dir), mặc định settings.prompt_tenant
+
+    Returns:
+        PromptTemplates: Templates đã compile
+    """
+    tenant = tenant or settings.prompt_tenant
+
+    if tenant not in _templates:
+        with _templates_lock:
+            if tenant not in _templates:
+                base_dir = Path(settings.prompt_template_dir) if settings.prompt_template_dir else DEFAULT_TEMPLATE_DIR
+                tenant_dir = base_dir / tenant
+
+                fallback_path = tenant_dir / "fallback.txt"
+                unavailable_path = tenant_dir / "unavailable.txt"
+
+                _templates[tenant] = PromptTemplates(
+                    tenant=tenant,
+                    system_instruction=(tenant_dir / "system.txt").read_text(encoding="utf-8").strip(),
+                    turn=Template((tenant_dir / "turn.txt").read_text(encoding="utf-8")),
+                    fallback=Template(fallback_path.read_text(encoding="utf-8")) if fallback_path.is_file()
+                    else DEFAULT_FALLBACK,
+                    unavailable=unavailable_path.read_text(encoding="utf-8").strip() if unavailable_path.is_file()
+                    else DEFAULT_UNAVAILABLE
+                )
+                logger.info(f"Loaded prompt templates for tenant {tenant}")
+
+    return _templates[tenant]
+
+class ChatModel:
+    """
+    GenerativeModel đã gắn sẵn system instruction của một tenant
+
+    Nếu SDK hỗ trợ, system instruction được cấu hình trên model (và cache phía
+    provider khi bật prompt_context_cache); nếu không, nó được gửi làm part đầu
+    tiên với nội dung không đổi giữa các lượt để provider có thể tái sử dụng prefix.
+    """
+
+    def __init__(self, model_name: str, templates: PromptTemplates):
+        self.model_name = model_name
+        self.templates = templates
+        self.system_attached = False
+        self._expires_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._model = self._build()
+
+    def generate_content(self, dynamic_prompt: str, **kwargs):
+        model = self._current_model()
+        if self.system_attached:
+            return model.generate_content(dynamic_prompt, **kwargs)
+        return model.generate_content([self.templates.system_instruction, dynamic_prompt], **kwargs)
+
+    def _current_model(self):
+        # Cached content hết hạn theo TTL, tạo lại trước khi hết hạn
+        if self._expires_at and datetime.utcnow() >= self._expires_at:
+            with self._lock:
+                if self._expires_at and datetime.utcnow() >= self._expires_at:
+                    self._model = self._build()
+        return self._model
+
+    def _build(self):
+        if settings.prompt_context_cache and hasattr(genai, "caching"):
+            try:
+                ttl = timedelta(seconds=settings.prompt_cache_ttl_seconds)
+                cached = genai.caching.CachedContent.create(
+                    model=self.model_name,
+                    system_instruction=self.templates.system_instruction,
+                    ttl=ttl
+                )
+                self.system_attached = True
+                self._expires_at = datetime.utcnow() + ttl - timedelta(seconds=60)
+                logger.info(f"Created cached system prompt for {self.model_name}/{self.templates.tenant}")
+                return genai.GenerativeModel.from_cached_content(cached)
+            except Exception as e:
+                # Provider yêu cầu số token tối thiểu để cache; prompt ngắn hơn thì bỏ qua
+                logger.warning(f"Context caching unavailable, using system instruction: {str(e)}")
+
+        self._expires_at = None
+        try:
+            model = genai.GenerativeModel(self.model_name, system_instruction=self.templates.system_instruction)
+            self.system_attached = True
+            return model
+        except TypeError:
+            # SDK cũ chưa hỗ trợ system_instruction
+            self.system_attached = False
+            return genai.GenerativeModel(self.model_name)
+
+_chat_models: Dict[Tuple[str, str], ChatModel] = {}
+_chat_models_lock = threading.Lock()
+
+def get_chat_model(model_name: str, tenant: Optional[str] = None) -> ChatModel:
+    """Lấy ChatModel dùng chung cho (model, tenant)"""
+    templates = get_prompt_templates(tenant)
+    key = (model_name, templates.tenant)
+
+    if key not in _chat_models:
+        with _chat_models_lock:
+            if key not in _chat_models:
+                genai.configure(api_key=settings.google_api_key)
+                _chat_models[key] = ChatModel(model_name, templates)
+
+    return _chat_models[key]
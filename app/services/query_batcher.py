@@ -0,0 +1,165 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import threading
+import time
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class QueryEmbeddingBatcher:
+    """
+    Gom các query đến gần nhau về thời gian thành một request embed duy nhất.
+
+    Query đầu tiên mở một cửa sổ `window_ms`; mọi query đến trong cửa sổ đó
+    (hoặc cho đến khi đủ `max_batch_size`) được gửi chung một batch. Các query
+    giống hệt nhau đang chờ hoặc đang được embed dùng chung một kết quả.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], List[List[float]]],
+                 window_ms: float = 5.0, max_batch_size: int = 32,
+                 max_concurrency: int = 4, timeout: float = 30.0):
+        self._embed_fn = embed_fn
+        self.timeout = timeout
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self._cond = threading.Condition()
+        self._queue: List[str] = []
+        self._pending: Dict[str, Future] = {}  # query -> future (đang chờ hoặc đang embed)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix="query-embed"
+        )
+        # Chỉ gom batch mới khi còn slot, để query tiếp tục dồn vào batch kế tiếp
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._worker: Optional[threading.Thread] = None
+
+        self.stats = {
+            "requests": 0,
+            "deduplicated": 0,
+            "batches": 0,
+            "embedded": 0,
+            "errors": 0
+        }
+
+    def embed(self, query: str, timeout: Optional[float] = None) -> List[float]:
+        """
+        Lấy embedding cho một query, chờ batch chứa nó hoàn tất
+
+        Args:
+            query: Query cần embed
+            timeout: Thời gian chờ tối đa (giây), mặc định self.timeout
+
+        Returns:
+            List[float]: Vector embedding
+        """
+        if not query.strip():
+            raise ValueError("Query is empty")
+
+        with self._cond:
+            self.stats["requests"] += 1
+            future = self._pending.get(query)
+
+            if future is not None:
+                self.stats["deduplicated"] += 1
+            else:
+                future = Future()
+                self._pending[query] = future
+                self._queue.append(query)
+                self._ensure_worker()
+                self._cond.notify()
+
+        return future.result(timeout if timeout is not None else self.timeout)
+
+    def get_stats(self) -> dict:
+        """Lấy thống kê batching"""
+        with self._cond:
+            stats = dict(self.stats)
+
+        stats["avg_batch_size"] = round(stats["embedded"] / stats["batches"], 2) if stats["batches"] else 0
+        return stats
+
+    def _ensure_worker(self):
+        """Khởi động worker thread nếu chưa chạy (gọi khi đang giữ lock)"""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run,
+                name="query-batcher",
+                daemon=True
+            )
+            self._worker.start()
+
+    def _run(self):
+        """Vòng lặp gom batch"""
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+
+            self._slots.acquire()
+
+            with self._cond:
+                # Chờ hết cửa sổ hoặc đến khi đủ batch
+                deadline = time.monotonic() + self.window
+                while len(self._queue) < self.max_batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                batch = self._queue[:self.max_batch_size]
+                del self._queue[:self.max_batch_size]
+                self.stats["batches"] += 1
+                self.stats["embedded"] += len(batch)
+
+            self._executor.submit(self._flush, batch)
+
+    def _flush(self, batch: List[str]):
+        """Gửi một batch và trả kết quả cho các caller"""
+        with self._cond:
+            futures = [self._pending[query] for query in batch]
+
+        try:
+            vectors = self._embed_fn(batch)
+            if len(vectors) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(vectors)}")
+            for future, vector in zip(futures, vectors):
+                future.set_result(vector)
+
+        except Exception as e:
+            logger.error(f"Error embedding query batch of {len(batch)}: {str(e)}")
+            with self._cond:
+                self.stats["errors"] += 1
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
+        finally:
+            with self._cond:
+                for query in batch:
+                    self._pending.pop(query, None)
+            self._slots.release()
+
+_batchers: Dict[str, QueryEmbeddingBatcher] = {}
+_batcher_lock = threading.Lock()
+
+def get_query_batcher(model_name: Optional[str] = None) -> QueryEmbeddingBatcher:
+    """Lấy batcher dùng chung cho cả process (mỗi embedding model một batcher)"""
+    model_name = model_name or settings.embedding_model
+
+    if model_name not in _batchers:
+        with _batcher_lock:
+            if model_name not in _batchers:
+                from app.services.embeddings import GeminiEmbeddings
+
+                _batchers[model_name] = QueryEmbeddingBatcher(
+                    embed_fn=GeminiEmbeddings(model_name).embed_queries,
+                    window_ms=settings.query_batch_window_ms,
+                    max_batch_size=settings.query_batch_max_size,
+                    max_concurrency=settings.query_batch_max_concurrency,
+                    timeout=settings.query_batch_timeout_seconds
+                )
+
+    return _batchers[model_name]
@@ -0,0 +1,443 @@
+"""
+Snapshot documents, chunks và embeddings ra thư mục dạng cột, và nạp lại bằng COPY.
+
+    python -m app.services.snapshot export --out snapshots/2024-06-01
+    python -m app.services.snapshot import --src snapshots/2024-06-01 --workers 4 --defer-indexes
+
+Cấu trúc snapshot:
+    manifest.json                 model/số chiều embedding, số rows, sha256 từng file, các collection
+    documents-00000.jsonl.gz      mỗi dòng một document
+    chunks-00000.jsonl.gz         mỗi dòng một chunk (không có embedding)
+    embeddings-00000.npy          float32 [rows, dimension], cùng thứ tự với chunks-00000
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import List
+import argparse
+import csv
+import gzip
+import hashlib
+import io
+import json
+import time
+import logging
+
+import numpy as np
+from sqlalchemy import select, text
+
+from app.config import settings
+from app.models.database import Chunk, Collection, Document, SessionLocal, engine
+from app.services.collection_registry import DEFAULT_COLLECTION
+from app.services.partitions import LEGACY_EPOCH, partition_manager
+
+logger = logging.getLogger(__name__)
+
+# Format 2 thêm ingest_epoch và offset text của chunk; snapshot format 1 được nạp vào epoch legacy
+# Format 3 thêm collection; snapshot cũ hơn được nạp vào collection default
+# Format 4 thêm các row của bảng collections vào manifest
+SNAPSHOT_FORMAT = 4
+SUPPORTED_FORMATS = {1, 2, 3, 4}
+
+DOCUMENT_COLUMNS = ["id", "url", "title", "content", "domain", "simhash", "meta_data", "created_at",
+                    "ingest_epoch", "collection"]
+CHUNK_COLUMNS = ["id", "ingest_epoch", "document_id", "content", "start_offset", "end_offset", "chunk_index",
+                 "section_index", "heading_path", "simhash", "meta_data", "domain", "url", "title",
+                 "scraped_at", "created_at", "collection"]
+COLLECTION_COLUMNS = ["name", "description", "prompt_tenant", "embedding_version", "chunk_size",
+                      "chunk_overlap", "chunking_mode", "sources", "created_at"]
+JSON_COLUMNS = {"meta_data"}
+# Marker NULL riêng để chuỗi rỗng trong content/title vẫn là chuỗi rỗng sau COPY
+NULL_MARKER = "\\N"
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _to_json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is not None and not isinstance(value, (str, int, float, bool, dict, list)):
+        return str(value)  # UUID
+    return value
+
+class SnapshotExporter:
+    """Ghi snapshot theo shard, đọc database bằng server-side cursor nên không giữ cả corpus trong bộ nhớ"""
+
+    def __init__(self, out_dir: Path, shard_size: int = 50000):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.files: List[dict] = []
+
+    def export(self) -> dict:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        started = time.perf_counter()
+
+        db = SessionLocal()
+        try:
+            collections = self._export_collections(db)
+            documents = self._export_documents(db)
+            chunks = self._export_chunks(db)
+        finally:
+            db.close()
+
+        manifest = {
+            "format": SNAPSHOT_FORMAT,
+            "created_at": datetime.utcnow().isoformat(),
+            "embedding_model": settings.embedding_model,
+            "embedding_dimension": settings.embedding_dimension,
+            "documents": documents,
+            "chunks": chunks,
+            "collections": collections,
+            "files": self.files
+        }
+        (self.out_dir / "manifest.json").write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+
+        logger.info(f"Exported {documents} documents, {chunks} chunks in {time.perf_counter() - started:.1f}s")
+        return manifest
+
+    def _export_collections(self, db) -> List[dict]:
+        """Cấu hình các collection (bảng nhỏ, ghi thẳng vào manifest)"""
+        rows = db.execute(select(*[getattr(Collection, name) for name in COLLECTION_COLUMNS])
+                          .order_by(Collection.name)).fetchall()
+        return [{name: _to_json_value(getattr(row, name)) for name in COLLECTION_COLUMNS} for row in rows]
+
+    def _export_documents(self, db) -> int:
+        columns = [getattr(Document, name) for name in DOCUMENT_COLUMNS]
+        rows = db.execute(
+            select(*columns).order_by(Document.id).execution_options(stream_results=True, yield_per=1000)
+        )
+
+        total, shard, writer = 0, 0, None
+        for row in rows:
+            if writer is None or total % self.shard_size == 0 and total:
+                if writer is not None:
+                    self._close_jsonl(writer, "documents", shard)
+                    shard += 1
+                writer = self._open_jsonl("documents", shard)
+
+            writer["file"].write(json.dumps(
+                {name: _to_json_value(getattr(row, name)) for name in DOCUMENT_COLUMNS}, ensure_ascii=False
+            ) + "\n")
+            writer["rows"] += 1
+            total += 1
+
+        if writer is not None:
+            self._close_jsonl(writer, "documents", shard)
+        return total
+
+    def _export_chunks(self, db) -> int:
+        columns = [getattr(Chunk, name) for name in CHUNK_COLUMNS] + [Chunk.embedding]
+        rows = db.execute(
+            select(*columns).order_by(Chunk.document_id, Chunk.chunk_index)
+            .execution_options(stream_results=True, yield_per=1000)
+        )
+
+        dimension = settings.embedding_dimension
+        total, shard = 0, 0
+        writer, vectors = None, None
+
+        for row in rows:
+            position = total % self.shard_size
+            if position == 0:
+                if writer is not None:
+                    self._close_chunk_shard(writer, vectors, shard)
+                    shard += 1
+                writer = self._open_jsonl("chunks", shard)
+                vectors = np.zeros((self.shard_size, dimension), dtype=np.float32)
+
+            item = {name: _to_json_value(getattr(row, name)) for name in CHUNK_COLUMNS}
+            item["has_embedding"] = row.embedding is not None
+            if row.embedding is not None:
+                vectors[position] = row.embedding
+            writer["file"].write(json.dumps(item, ensure_ascii=False) + "\n")
+            writer["rows"] += 1
+            total += 1
+
+        if writer is not None:
+            self._close_chunk_shard(writer, vectors, shard)
+        return total
+
+    def _open_jsonl(self, kind: str, shard: int) -> dict:
+        path = self.out_dir / f"{kind}-{shard:05d}.jsonl.gz"
+        return {"path": path, "file": gzip.open(path, "wt", encoding="utf-8", compresslevel=6), "rows": 0}
+
+    def _close_jsonl(self, writer: dict, kind: str, shard: int):
+        writer["file"].close()
+        self.files.append({
+            "name": writer["path"].name, "kind": kind, "shard": shard,
+            "rows": writer["rows"], "sha256": _sha256(writer["path"])
+        })
+
+    def _close_chunk_shard(self, writer: dict, vectors: np.ndarray, shard: int):
+        self._close_jsonl(writer, "chunks", shard)
+
+        # Vector float32 liên tục, nạp lại bằng np.load(mmap_mode="r")
+        path = self.out_dir / f"embeddings-{shard:05d}.npy"
+        np.save(path, np.ascontiguousarray(vectors[:writer["rows"]]))
+        self.files.append({
+            "name": path.name, "kind": "embeddings", "shard": shard,
+            "rows": writer["rows"], "sha256": _sha256(path)
+        })
+        logger.info(f"Wrote chunk shard {shard} ({writer['rows']} rows)")
+
+class _CsvStream:
+    """
+    File-like chỉ đọc cho COPY ... FROM STDIN, render dòng CSV khi psycopg2 đọc tới
+
+    Mỗi lần read() chỉ giữ khoảng size ký tự trong bộ nhớ thay vì cả shard
+    (50.000 chunk x ~12 KB text của vector 768 chiều).
+    """
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._pending = ""
+        self.rows = 0
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._pending]
+        available = len(self._pending)
+        while size < 0 or available < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            self._writer.writerow(row)
+            line = self._buffer.getvalue()
+            self._buffer.seek(0)
+            self._buffer.truncate()
+            parts.append(line)
+            available += len(line)
+            self.rows += 1
+
+        data = "".join(parts)
+        if size < 0 or len(data) <= size:
+            self._pending = ""
+            return data
+        self._pending = data[size:]
+        return data[:size]
+
+class SnapshotImporter:
+    """
+    Nạp snapshot vào database trống bằng COPY, mỗi shard chunks một worker và một connection
+
+    Checksum của mọi file được kiểm tra trước khi ghi bất kỳ row nào.
+    """
+
+    def __init__(self, src_dir: Path, workers: int = 4, defer_indexes: bool = False, truncate: bool = False):
+        self.src_dir = src_dir
+        self.workers = workers
+        self.defer_indexes = defer_indexes
+        self.truncate = truncate
+        self.manifest = json.loads((src_dir / "manifest.json").read_text(encoding="utf-8"))
+
+    def run(self) -> dict:
+        started = time.perf_counter()
+
+        if self.manifest.get("format") not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported snapshot format: {self.manifest.get('format')}")
+        if self.manifest["embedding_dimension"] != settings.embedding_dimension:
+            raise ValueError(
+                f"Snapshot dimension {self.manifest['embedding_dimension']} "
+                f"does not match embedding_dimension {settings.embedding_dimension}"
+            )
+
+        self._verify_checksums()
+        self._prepare_target()
+        self._restore_collections()
+
+        dropped = self._drop_ann_indexes() if self.defer_indexes else []
+
+        documents = sum(self._copy_documents(entry) for entry in self._entries("documents"))
+        logger.info(f"Loaded {documents} documents")
+
+        # Chunk được COPY vào partition theo epoch của document
+        with engine.connect() as conn:
+            epochs = conn.execute(text("SELECT DISTINCT ingest_epoch FROM documents")).scalars().all()
+        for epoch in epochs:
+            partition_manager.ensure(epoch)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="snapshot-import") as executor:
+            chunks = sum(executor.map(self._copy_chunk_shard, self._entries("chunks")))
+        logger.info(f"Loaded {chunks} chunks")
+
+        self._recreate_indexes(dropped)
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("ANALYZE documents"))
+            conn.execute(text("ANALYZE chunks"))
+
+        elapsed = time.perf_counter() - started
+        logger.info(f"Imported snapshot in {elapsed:.1f}s")
+        return {"documents": documents, "chunks": chunks, "seconds": round(elapsed, 1)}
+
+    def _entries(self, kind: str) -> List[dict]:
+        return sorted((entry for entry in self.manifest["files"] if entry["kind"] == kind),
+                      key=lambda entry: entry["shard"])
+
+    def _verify_checksums(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            digests = executor.map(lambda entry: _sha256(self.src_dir / entry["name"]), self.manifest["files"])
+            for entry, digest in zip(self.manifest["files"], digests):
+                if digest != entry["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {entry['name']}")
+        logger.info(f"Verified {len(self.manifest['files'])} snapshot files")
+
+    def _prepare_target(self):
+        with engine.begin() as conn:
+            if self.truncate:
+                conn.execute(text("TRUNCATE documents, chunks CASCADE"))
+                return
+
+            existing = conn.execute(text("SELECT EXISTS (SELECT 1 FROM documents)")).scalar()
+            if existing:
+                raise ValueError("Target database is not empty (use --truncate)")
+
+    def _restore_collections(self):
+        """
+        Nạp các collection của snapshot trước documents, để collection không phải default có cấu hình
+
+        Snapshot format 3 không có bảng collections: chỉ nạp khi database đích đã có
+        mọi collection được dùng trong snapshot. Collection đã có ở đích được giữ nguyên.
+        Index ANN riêng của collection được build lại qua POST /admin/collections/<name>/reindex.
+        """
+        collections = self.manifest.get("collections")
+        if collections is None:
+            if self.manifest.get("format") != 3:
+                return  # Format 1/2 chỉ có collection default
+            used = {
+                item.get("collection", DEFAULT_COLLECTION)
+                for entry in self._entries("documents") for item in self._read_jsonl(entry)
+            } - {DEFAULT_COLLECTION}
+            with engine.connect() as conn:
+                existing = set(conn.execute(text("SELECT name FROM collections")).scalars().all())
+            missing = sorted(used - existing)
+            if missing:
+                raise ValueError(
+                    f"Snapshot has no collections table and target is missing collections: {', '.join(missing)} "
+                    "(create them first or re-export with a newer version)"
+                )
+            return
+
+        with engine.begin() as conn:
+            for collection in collections:
+                conn.execute(text(f"""
+                    INSERT INTO collections ({', '.join(COLLECTION_COLUMNS)})
+                    VALUES (:name, :description, :prompt_tenant, :embedding_version, :chunk_size,
+                            :chunk_overlap, :chunking_mode, CAST(:sources AS jsonb), :created_at)
+                    ON CONFLICT (name) DO NOTHING
+                """), {**collection, "sources": json.dumps(collection.get("sources") or [], ensure_ascii=False)})
+        logger.info(f"Restored {len(collections)} collections")
+
+    def _drop_ann_indexes(self) -> List[str]:
+        """Bỏ index ANN của chunks trước khi nạp; build lại một lần nhanh hơn cập nhật từng row"""
+        with engine.begin() as conn:
+            rows = conn.execute(text("""
+                SELECT indexname, indexdef FROM pg_indexes
+                WHERE tablename = 'chunks' AND (indexdef LIKE '%USING ivfflat%' OR indexdef LIKE '%USING hnsw%')
+            """)).fetchall()
+            for row in rows:
+                conn.execute(text(f'DROP INDEX IF EXISTS "{row.indexname}"'))
+
+        logger.info(f"Dropped {len(rows)} ANN indexes before load")
+        return [row.indexdef for row in rows]
+
+    def _recreate_indexes(self, definitions: List[str]):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for definition in definitions:
+                started = time.perf_counter()
+                # Định nghĩa index của bảng partition có dạng "ON ONLY chunks", chỉ tạo index rỗng ở bảng cha
+                conn.execute(text(definition.replace(" ON ONLY ", " ON ", 1)))
+                logger.info(f"Rebuilt index in {time.perf_counter() - started:.1f}s: {definition}")
+
+    def _copy_documents(self, entry: dict) -> int:
+        def rows():
+            for item in self._read_jsonl(entry):
+                item.setdefault("ingest_epoch", LEGACY_EPOCH)
+                item.setdefault("collection", DEFAULT_COLLECTION)
+                yield [self._csv_value(name, item.get(name)) for name in DOCUMENT_COLUMNS]
+
+        stream = _CsvStream(rows())
+        self._copy("documents", DOCUMENT_COLUMNS, stream)
+        return stream.rows
+
+    def _copy_chunk_shard(self, entry: dict) -> int:
+        vectors = np.load(self.src_dir / f"embeddings-{entry['shard']:05d}.npy", mmap_mode="r")
+
+        def rows():
+            count = 0
+            for i, item in enumerate(self._read_jsonl(entry)):
+                item.setdefault("ingest_epoch", LEGACY_EPOCH)
+                item.setdefault("collection", DEFAULT_COLLECTION)
+                values = [self._csv_value(name, item.get(name)) for name in CHUNK_COLUMNS]
+                embedding = "[" + ",".join(map(repr, vectors[i].tolist())) + "]" if item.get("has_embedding") else NULL_MARKER
+                yield values + [embedding]
+                count += 1
+
+            # Raise trong lúc COPY: COPY bị hủy và shard không được commit
+            if count != entry["rows"]:
+                raise ValueError(f"{entry['name']} has {count} rows, manifest says {entry['rows']}")
+
+        stream = _CsvStream(rows())
+        self._copy("chunks", CHUNK_COLUMNS + ["embedding"], stream)
+        logger.info(f"Loaded chunk shard {entry['shard']} ({stream.rows} rows)")
+        return stream.rows
+
+    def _copy(self, table: str, columns: List[str], stream: "_CsvStream"):
+        connection = engine.raw_connection()
+        try:
+            with connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '{NULL_MARKER}')", stream
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+    def _read_jsonl(self, entry: dict):
+        with gzip.open(self.src_dir / entry["name"], "rt", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    @staticmethod
+    def _csv_value(name: str, value) -> str:
+        if value is None:
+            return NULL_MARKER
+        if name in JSON_COLUMNS:
+            return json.dumps(value, ensure_ascii=False)
+        return value
+
+def main():
+    from app.utils.logging import setup_logging
+
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Export/import snapshot của vector corpus")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export")
+    export_parser.add_argument("--out", required=True)
+    export_parser.add_argument("--shard-size", type=int, default=50000)
+
+    import_parser = subparsers.add_parser("import")
+    import_parser.add_argument("--src", required=True)
+    import_parser.add_argument("--workers", type=int, default=4)
+    import_parser.add_argument("--defer-indexes", action="store_true",
+                               help="Bỏ index ANN trước khi nạp và build lại sau")
+    import_parser.add_argument("--truncate", action="store_true",
+                               help="Xóa dữ liệu hiện có trước khi nạp")
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        manifest = SnapshotExporter(Path(args.out), args.shard_size).export()
+        print(json.dumps({"documents": manifest["documents"], "chunks": manifest["chunks"]}))
+    else:
+        result = SnapshotImporter(Path(args.src), args.workers, args.defer_indexes, args.truncate).run()
+        print(json.dumps(result))
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,29 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-from typing import List, Dict, Any
-import nltk
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from typing import List, Dict, Any, Tuple, TYPE_CHECKING
 import numpy as np
 import logging
 
-logger = logging.getLogger(__name__)
+from app.services.content_extractor import ContentBlock
+
+if TYPE_CHECKING:
+    from langchain.schema import Document
 
-# Download NLTK data
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('stopwords', quiet=True)
-except:
-    pass
+# langchain và sklearn được import khi dùng lần đầu (hoặc pre-warm lúc khởi động),
+# để import module này không làm chậm startup
+
+logger = logging.getLogger(__name__)
 
 class SemanticTextProcessor:
     def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        from langchain.text_splitter import RecursiveCharacterTextSplitter
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
             separators=["\n\n", "\n", ". ", "! ", "? ", " ", ""]
         )
     
-    def semantic_chunking(self, text: str, metadata: Dict[str, Any] = None) -> List[Document]:
+    def semantic_chunking(self, text: str, metadata: Dict[str, Any] = None) -> List["Document"]:
         """
         Chia text thành chunks dựa trên ngữ nghĩa
         
@@ -40,6 +37,8 @@ class SemanticTextProcessor:
         if not text.strip():
             return []
         
+        from langchain.schema import Document
+        
         # Chia text cơ bản
         initial_chunks = self.text_splitter.split_text(text)
         
@@ -62,6 +61,104 @@ class SemanticTextProcessor:
         
         return documents
     
+    def structured_chunking(self, blocks: List[ContentBlock], metadata: Dict[str, Any] = None) -> List["Document"]:
+        """
+        Chia nội dung có cấu trúc (output của ContentExtractor) thành chunks theo section
+        
+        Mỗi section (heading và nội dung bên dưới) là parent của các chunk con.
+        Chunk không cắt ngang một dòng bảng hay một mục danh sách, bảng bị chia
+        sẽ lặp lại dòng tiêu đề, và mỗi chunk bắt đầu bằng heading path của section.
+        
+        Args:
+            blocks: Các block nội dung theo thứ tự trong trang
+            metadata: Metadata đi kèm
+            
+        Returns:
+            List[Document]: Danh sách chunks, metadata có section_index và heading_path
+        """
+        from langchain.schema import Document
+        
+        pieces = []
+        for section_index, (heading_path, section_blocks) in enumerate(self._split_sections(blocks)):
+            prefix = " > ".join(heading_path)
+            budget = max(self.chunk_size - len(prefix) - 1, self.chunk_size // 2)
+            
+            for body in self._pack_section(section_blocks, budget):
+                pieces.append((f"{prefix}\n{body}" if prefix else body, section_index, prefix))
+        
+        documents = []
+        for i, (chunk, section_index, heading_path) in enumerate(pieces):
+            chunk_metadata = (metadata or {}).copy()
+            chunk_metadata.update({
+                "chunk_index": i,
+                "chunk_size": len(chunk),
+                "total_chunks": len(pieces),
+                "section_index": section_index,
+                "heading_path": heading_path
+            })
+            documents.append(Document(page_content=chunk, metadata=chunk_metadata))
+        
+        return documents
+    
+    def _split_sections(self, blocks: List[ContentBlock]) -> List[Tuple[List[str], List[ContentBlock]]]:
+        """Nhóm blocks thành các section theo cây heading"""
+        sections = []
+        heading_stack: List[Tuple[int, str]] = []
+        current: List[ContentBlock] = []
+        
+        def close_section():
+            if current:
+                sections.append(([text for _, text in heading_stack], list(current)))
+                current.clear()
+        
+        for block in blocks:
+            if block.kind == "heading":
+                close_section()
+                while heading_stack and heading_stack[-1][0] >= block.level:
+                    heading_stack.pop()
+                heading_stack.append((block.level, block.text))
+            else:
+                current.append(block)
+        
+        close_section()
+        return sections
+    
+    def _pack_section(self, blocks: List[ContentBlock], budget: int) -> List[str]:
+        """Gom các block của một section thành chunks không vượt quá budget"""
+        chunks: List[str] = []
+        current: List[str] = []
+        size = 0
+        table_header = None
+        previous_kind = None
+        
+        for block in blocks:
+            line = block.render()
+            
+            if block.kind == "table_row":
+                if previous_kind != "table_row":
+                    table_header = line
+            else:
+                table_header = None
+            previous_kind = block.kind
+            
+            parts = [line] if len(line) <= budget else self.text_splitter.split_text(line)
+            for part in parts:
+                if current and size + len(part) + 1 > budget:
+                    chunks.append("\n".join(current))
+                    current, size = [], 0
+                    # Lặp lại tiêu đề bảng ở chunk tiếp theo
+                    if table_header and part != table_header:
+                        current.append(table_header)
+                        size = len(table_header) + 1
+                
+                current.append(part)
+                size += len(part) + 1
+        
+        if current:
+            chunks.append("\n".join(current))
+        
+        return chunks
+    
     def _merge_similar_chunks(self, chunks: List[str], similarity_threshold: float = 0.6) -> List[str]:
         """
         Merge các chunks có similarity cao
@@ -77,6 +174,9 @@ class SemanticTextProcessor:
             return chunks
         
         try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            from sklearn.metrics.pairwise import cosine_similarity
+            
             # Tính TF-IDF vectors
             vectorizer = TfidfVectorizer(stop_words='english', max_features=1000)
             tfidf_matrix = vectorizer.fit_transform(chunks)
@@ -125,6 +225,8 @@ class SemanticTextProcessor:
             List[str]: Danh sách keywords
         """
         try:
+            from sklearn.feature_extraction.text import TfidfVectorizer
+            
             vectorizer = TfidfVectorizer(
                 stop_words='english',
                 max_features=max_keywords * 2,
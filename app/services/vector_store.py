@@ -1,22 +1,62 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from typing import List, Tuple, Optional
+from sqlalchemy import text, tuple_
+from typing import Dict, List, Tuple, Optional
+from datetime import datetime
+from urllib.parse import urlparse
+import json
+import time
 import logging
-from uuid import UUID
+from uuid import UUID, uuid4
 
-from app.models.database import Document, Chunk
-from app.models.schemas import SearchResult
+from app.models.database import CHUNK_TEXT_SQL, Document, Chunk, ChunkEmbedding
+from app.models.schemas import SearchResult, SearchFilters
+from app.services.collection_registry import DEFAULT_COLLECTION, CollectionInfo, collection_registry
+from app.services.corpus_stats import corpus_stats
 from app.services.embeddings import GeminiEmbeddings
+from app.services.embedding_versions import VersionInfo, embedding_registry, shadow_searcher
+from app.services.deduplication import simhash, to_signed
+from app.services.partitions import partition_manager
+from app.services.query_batcher import get_query_batcher
+from app.utils.helpers import ingest_epoch
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Cache kết quả kiểm tra phiên bản pgvector cho iterative scan
+_iterative_scan_supported: Optional[bool] = None
+
+def _version_tuple(version: Optional[str]) -> Tuple[int, ...]:
+    """'0.8.0' -> (0, 8, 0); phiên bản không đọc được coi như (0,)"""
+    parts = []
+    for part in (version or "").split("."):
+        if not part.isdigit():
+            break
+        parts.append(int(part))
+    return tuple(parts) or (0,)
+
 class PgVectorStore:
     def __init__(self, db: Session):
         self.db = db
-        self.embeddings = GeminiEmbeddings()
+        self._embeddings: Optional[GeminiEmbeddings] = None
+    
+    @property
+    def embeddings(self) -> GeminiEmbeddings:
+        # Chỉ tạo client Gemini khi thực sự cần embed (stats/list/delete không cần)
+        if self._embeddings is None:
+            self._embeddings = GeminiEmbeddings()
+        return self._embeddings
+    
+    def _embeddings_for(self, version: VersionInfo) -> GeminiEmbeddings:
+        if version.model == self.embeddings.model_name:
+            return self.embeddings
+        return GeminiEmbeddings(version.model)
     
     def add_document(self, url: str, title: str, content: str, 
-                    chunks: List[str], metadata: dict = None) -> UUID:
+                    chunks: List[str], metadata: dict = None,
+                    fingerprint: Optional[int] = None,
+                    chunk_fingerprints: Optional[List[int]] = None,
+                    chunk_metadata: Optional[List[dict]] = None,
+                    collection: Optional[CollectionInfo] = None) -> UUID:
         """
         Thêm document và chunks vào vector store
         
@@ -26,38 +66,101 @@ class PgVectorStore:
             content: Nội dung gốc
             chunks: Danh sách chunks
             metadata: Metadata
+            fingerprint: SimHash của nội dung trang
+            chunk_fingerprints: SimHash của từng chunk
+            chunk_metadata: Metadata riêng của từng chunk (section_index, heading_path)
+            collection: Collection chứa document, mặc định collection default
             
         Returns:
             UUID: ID của document
         """
         try:
+            collection = collection or collection_registry.default()
+            metadata = metadata or {}
+            domain = metadata.get("domain") or urlparse(url).netloc
+            scraped_at = self._parse_scraped_at(metadata.get("scraped_at"))
+            epoch = ingest_epoch()
+            partition_manager.ensure(epoch)
+            
             # Tạo document
             doc = Document(
                 url=url,
                 title=title,
                 content=content,
-                meta_data=str(metadata or {})
+                domain=domain,
+                simhash=to_signed(fingerprint) if fingerprint is not None else None,
+                meta_data=metadata,
+                ingest_epoch=epoch,
+                collection=collection.name
             )
             self.db.add(doc)
             self.db.flush()  # Để lấy ID
             
-            # Tạo embeddings cho chunks
-            logger.info(f"Creating embeddings for {len(chunks)} chunks")
-            embeddings = self.embeddings.embed_batch(chunks)
+            # Tạo embeddings cho chunks, cho mọi phiên bản embedding đang được ghi
+            # (trong lúc re-embed, chunk mới được ghi cả phiên bản cũ và mới); collection đã
+            # chọn phiên bản embedding riêng thì chỉ ghi phiên bản đó
+            logger.debug("Creating embeddings for %d chunks", len(chunks))
+            targets = collection_registry.write_targets(collection)
+            embeddings = None
+            versioned = []
+            for version in targets:
+                if version.is_legacy:
+                    embeddings = self._embeddings_for(version).embed_batch(chunks)
+                    continue
+                
+                # Phiên bản trong chunk_embeddings không dùng zero vector fallback: thiếu hoặc
+                # sai số chiều sẽ làm hỏng cast của index ANN, nên dừng ingest trang này
+                vectors = self._embeddings_for(version).embed_batch(chunks, fallback=False)
+                if any(vector is None for vector in vectors):
+                    raise ValueError(f"Embedding with {version.model} failed for {url}")
+                if any(len(vector) != version.dimension for vector in vectors):
+                    raise ValueError(f"Model {version.model} did not return {version.dimension} dimensions")
+                versioned.append((version, vectors))
             
-            # Lưu chunks
-            for i, (chunk_content, embedding) in enumerate(zip(chunks, embeddings)):
+            # Lưu chunks; chunk là đoạn liên tục của content chỉ lưu offset
+            offsets = self._locate_chunks(content, chunks) if settings.chunk_text_storage == "offsets" \
+                else [None] * len(chunks)
+            chunk_ids = []
+            for i, chunk_content in enumerate(chunks):
+                chunk_fingerprint = chunk_fingerprints[i] if chunk_fingerprints else None
+                section = chunk_metadata[i] if chunk_metadata else {}
+                span = offsets[i]
+                chunk_ids.append(uuid4())
                 chunk = Chunk(
+                    id=chunk_ids[-1],
+                    ingest_epoch=epoch,
                     document_id=doc.id,
-                    content=chunk_content,
-                    embedding=embedding,
+                    content=None if span else chunk_content,
+                    start_offset=span[0] if span else None,
+                    end_offset=span[1] if span else None,
+                    embedding=embeddings[i] if embeddings else None,
                     chunk_index=i,
-                    meta_data=str(metadata or {})
+                    section_index=section.get("section_index"),
+                    heading_path=section.get("heading_path"),
+                    simhash=to_signed(chunk_fingerprint) if chunk_fingerprint is not None else None,
+                    meta_data=metadata,
+                    domain=domain,
+                    url=url,
+                    title=title,
+                    scraped_at=scraped_at,
+                    collection=collection.name
                 )
                 self.db.add(chunk)
             
+            if versioned:
+                self.db.flush()
+                for version, vectors in versioned:
+                    self.db.add_all(
+                        ChunkEmbedding(
+                            chunk_id=chunk_id, version=version.name, ingest_epoch=epoch,
+                            collection=collection.name, embedding=vector
+                        )
+                        for chunk_id, vector in zip(chunk_ids, vectors)
+                    )
+            
             self.db.commit()
-            logger.info(f"Added document {doc.id} with {len(chunks)} chunks")
+            corpus_stats.record_ingest(1, len(chunks))
+            logger.info(f"Added document {doc.id} with {len(chunks)} chunks to {collection.name}")
             
             return doc.id
             
@@ -66,8 +169,36 @@ class PgVectorStore:
             logger.error(f"Error adding document: {str(e)}")
             raise
     
+    @staticmethod
+    def _locate_chunks(content: str, chunks: List[str]) -> List[Optional[Tuple[int, int]]]:
+        """
+        Vị trí [start, end) của từng chunk trong content, None nếu chunk không phải đoạn liên tục
+        
+        Chunk theo thứ tự trong trang và có thể chồng nhau (chunk_overlap), nên tìm
+        tiếp từ sau điểm bắt đầu của chunk trước; chunk đã bị gộp/thêm heading path
+        không tìm thấy và được lưu inline.
+        """
+        spans = []
+        cursor = 0
+        for chunk in chunks:
+            start = content.find(chunk, cursor) if chunk else -1
+            if start < 0 and chunk:
+                start = content.find(chunk)
+            if start < 0:
+                spans.append(None)
+                continue
+            spans.append((start, start + len(chunk)))
+            cursor = start + 1
+        return spans
+    
     def semantic_search(self, query: str, max_results: int = 10, 
-                       similarity_threshold: float = 0.7) -> List[SearchResult]:
+                       similarity_threshold: float = 0.7,
+                       filters: Optional[SearchFilters] = None,
+                       version: Optional[VersionInfo] = None,
+                       shadow: bool = True,
+                       index_mode: Optional[str] = None,
+                       query_embedding: Optional[List[float]] = None,
+                       collection: Optional[CollectionInfo] = None) -> List[SearchResult]:
         """
         Tìm kiếm semantic trong vector store
         
@@ -75,86 +206,733 @@ class PgVectorStore:
             query: Câu truy vấn
             max_results: Số kết quả tối đa
             similarity_threshold: Ngưỡng similarity
+            filters: Điều kiện lọc theo domain, URL, thời gian, metadata
+            version: Phiên bản embedding, mặc định phiên bản search của collection
+            shadow: Cho phép chạy lại truy vấn trên phiên bản shadow (nếu được cấu hình)
+            index_mode: Ghi đè settings.embedding_index_mode
+            query_embedding: Embedding của query đã tính sẵn bằng phiên bản này (bỏ qua bước embed)
+            collection: Chỉ tìm trong collection này, mặc định collection default
             
         Returns:
             List[SearchResult]: Kết quả tìm kiếm
         """
         try:
-            # Tạo query embedding
-            query_embedding = self.embeddings.embed_query(query)
+            collection = collection or collection_registry.default()
+            version = version or collection_registry.search_version(collection)
             
-            # Thực hiện vector search
-            sql_query = text("""
-                SELECT 
-                    c.content,
-                    c.embedding <=> :query_embedding as distance,
-                    1 - (c.embedding <=> :query_embedding) as similarity,
-                    d.url,
-                    d.title
-                FROM chunks c
-                JOIN documents d ON c.document_id = d.id
-                WHERE (1 - (c.embedding <=> :query_embedding)) >= :threshold
-                ORDER BY c.embedding <=> :query_embedding
-                LIMIT :max_results
-            """)
+            # Tạo query embedding
+            if query_embedding is None:
+                query_embedding = self._embed_query(query, version)
             
-            result = self.db.execute(sql_query, {
+            params = {
                 'query_embedding': str(query_embedding),
                 'threshold': similarity_threshold,
-                'max_results': max_results
-            })
+                'max_results': max_results,
+                'candidates': max_results * settings.rescore_factor
+            }
+            filter_sql = self._filter_conditions(filters, params)
+            
+            # Thực hiện vector search, filter nằm trong cùng câu ANN
+            sql_query = text(self._ann_sql("CAST(:query_embedding AS vector)", filter_sql,
+                                           index_mode=index_mode, version=version, collection=collection))
+            
+            # Câu ANN luôn có điều kiện collection, kể cả "default" (không có index riêng)
+            self._enable_iterative_scan()
+            
+            result = self.db.execute(sql_query, params)
             
             search_results = []
             for row in result:
-                search_results.append(SearchResult(
-                    content=row.content,
-                    similarity=float(row.similarity),
-                    document_url=row.url,
-                    document_title=row.title
-                ))
-            
-            logger.info(f"Found {len(search_results)} results for query: {query}")
+                search_results.append(self._to_search_result(row))
+            
+            # Iterative scan ở chế độ relaxed có thể trả về thứ tự gần đúng
+            search_results.sort(key=lambda r: r.similarity, reverse=True)
+            
+            # Phiên bản shadow được so với phiên bản active, tức là search của collection default
+            if shadow and collection.is_default:
+                shadow_searcher.maybe_submit(query, max_results, filters, search_results)
+            
+            logger.debug("Found %d results for query: %.80s", len(search_results), query)
             return search_results
             
         except Exception as e:
             logger.error(f"Error in semantic search: {str(e)}")
             raise
     
-    def get_document_by_url(self, url: str) -> Optional[Document]:
-        """Lấy document theo URL"""
-        return self.db.query(Document).filter(Document.url == url).first()
+    def semantic_search_many(self, queries: List[str], max_results: int = 10,
+                             similarity_threshold: float = 0.7,
+                             filters: Optional[SearchFilters] = None,
+                             version: Optional[VersionInfo] = None,
+                             collection: Optional[CollectionInfo] = None) -> List[List[SearchResult]]:
+        """
+        Tìm kiếm semantic cho nhiều query trong một câu SQL
+        
+        Args:
+            queries: Danh sách câu truy vấn
+            max_results: Số kết quả tối đa cho mỗi query
+            similarity_threshold: Ngưỡng similarity
+            filters: Điều kiện lọc áp dụng cho mọi query
+            version: Phiên bản embedding, mặc định phiên bản search của collection
+            collection: Chỉ tìm trong collection này, mặc định collection default
+            
+        Returns:
+            List[List[SearchResult]]: Kết quả theo đúng thứ tự queries
+        """
+        try:
+            if not queries:
+                return []
+            
+            collection = collection or collection_registry.default()
+            version = version or collection_registry.search_version(collection)
+            embedder = self._embeddings_for(version)
+            
+            # Embed các query khác nhau theo batch
+            unique_queries = list(dict.fromkeys(queries))
+            batch_size = settings.batch_search_embed_size
+            query_embeddings = []
+            for i in range(0, len(unique_queries), batch_size):
+                query_embeddings.extend(
+                    embedder.embed_queries(unique_queries[i:i + batch_size])
+                )
+            
+            params = {
+                'query_embeddings': [str(embedding) for embedding in query_embeddings],
+                'threshold': similarity_threshold,
+                'max_results': max_results,
+                'candidates': max_results * settings.rescore_factor
+            }
+            filter_sql = self._filter_conditions(filters, params)
+            
+            # Một lần quét index cho mỗi query qua LATERAL join
+            sql_query = text(f"""
+                SELECT 
+                    q.ord,
+                    r.*
+                FROM unnest(CAST(:query_embeddings AS vector[])) WITH ORDINALITY AS q(embedding, ord)
+                CROSS JOIN LATERAL ({self._ann_sql("q.embedding", filter_sql, version=version, collection=collection)}
+                ) r
+                ORDER BY q.ord, r.similarity DESC
+            """)
+            
+            # Câu ANN luôn có điều kiện collection, kể cả "default" (không có index riêng)
+            self._enable_iterative_scan()
+            
+            result = self.db.execute(sql_query, params)
+            
+            unique_results: List[List[SearchResult]] = [[] for _ in unique_queries]
+            for row in result:
+                unique_results[row.ord - 1].append(self._to_search_result(row))
+            
+            for results in unique_results:
+                results.sort(key=lambda r: r.similarity, reverse=True)
+            
+            positions = {query: i for i, query in enumerate(unique_queries)}
+            logger.info("Batch search for %d queries (%d unique)", len(queries), len(unique_queries))
+            return [list(unique_results[positions[query]]) for query in queries]
+            
+        except Exception as e:
+            logger.error(f"Error in batch semantic search: {str(e)}")
+            raise
+    
+    def expand_results(self, results: List[SearchResult], mode: Optional[str] = None) -> List[SearchResult]:
+        """
+        Mở rộng các hit thành đoạn ngữ cảnh lớn hơn (small-to-big retrieval)
+        
+        window: lấy thêm expansion_window chunk trước/sau mỗi hit.
+        section: lấy cả section chứa hit (giới hạn expansion_max_section_chunks mỗi phía).
+        Các cửa sổ chồng nhau trong cùng document được gộp, sau đó toàn bộ được
+        đọc bằng một range query trên (document_id, chunk_index).
+        
+        Args:
+            results: Kết quả semantic search
+            mode: Ghi đè settings.retrieval_expansion
+            
+        Returns:
+            List[SearchResult]: Mỗi phần tử là một đoạn đã gộp, sắp theo similarity
+        """
+        mode = mode or settings.retrieval_expansion
+        if mode == "none" or not results:
+            return results
+        
+        try:
+            radius = settings.expansion_window if mode == "window" else settings.expansion_max_section_chunks
+            
+            # Gom cửa sổ theo (document, section) rồi gộp các khoảng chồng nhau
+            windows: Dict[tuple, List[list]] = {}
+            passthrough = []
+            for result in results:
+                if result.document_id is None or result.chunk_index is None:
+                    passthrough.append(result)
+                    continue
+                
+                section = result.section_index if mode == "section" else None
+                windows.setdefault((result.document_id, section), []).append(
+                    [result.chunk_index - radius, result.chunk_index + radius, result]
+                )
+            
+            merged = []
+            for (document_id, section), intervals in windows.items():
+                intervals.sort(key=lambda interval: interval[0])
+                current = None
+                for low, high, result in intervals:
+                    if current and low <= current["high"] + 1:
+                        current["high"] = max(current["high"], high)
+                        current["hits"].append(result)
+                    else:
+                        current = {"document_id": document_id, "section": section,
+                                   "low": low, "high": high, "hits": [result]}
+                        merged.append(current)
+            
+            if not merged:
+                return results
+            
+            sql_query = text(f"""
+                SELECT r.ord, c.chunk_index, {CHUNK_TEXT_SQL.format(chunk="c")} AS content, c.heading_path
+                FROM unnest(
+                    CAST(:document_ids AS uuid[]),
+                    CAST(:lows AS integer[]),
+                    CAST(:highs AS integer[]),
+                    CAST(:sections AS integer[])
+                ) WITH ORDINALITY AS r(document_id, low, high, section_index, ord)
+                JOIN chunks c
+                  ON c.document_id = r.document_id
+                 AND c.chunk_index BETWEEN r.low AND r.high
+                JOIN documents d ON d.id = c.document_id
+                WHERE r.section_index IS NULL OR c.section_index = r.section_index
+                ORDER BY r.ord, c.chunk_index
+            """)
+            
+            rows = self.db.execute(sql_query, {
+                'document_ids': [str(window["document_id"]) for window in merged],
+                'lows': [window["low"] for window in merged],
+                'highs': [window["high"] for window in merged],
+                'sections': [window["section"] for window in merged]
+            })
+            
+            passages: Dict[int, List[str]] = {}
+            for row in rows:
+                parts = passages.setdefault(row.ord - 1, [])
+                content = row.content
+                # Chunk cùng section lặp lại heading path ở dòng đầu
+                if parts and row.heading_path and content.startswith(row.heading_path + "\n"):
+                    content = content[len(row.heading_path) + 1:]
+                parts.append(content)
+            
+            expanded = list(passthrough)
+            for i, window in enumerate(merged):
+                best = max(window["hits"], key=lambda hit: hit.similarity)
+                parts = passages.get(i)
+                content = best.content
+                if parts:
+                    content = parts[0]
+                    for part in parts[1:]:
+                        content = self._join_overlapping(content, part)
+                
+                expanded.append(best.model_copy(update={
+                    "content": content,
+                    "chunk_index": max(window["low"], 0)
+                }))
+            
+            expanded.sort(key=lambda result: result.similarity, reverse=True)
+            logger.debug("Expanded %d hits into %d passages", len(results), len(expanded))
+            return expanded
+            
+        except Exception as e:
+            logger.error(f"Error expanding search results: {str(e)}")
+            return results
+    
+    @staticmethod
+    def _join_overlapping(left: str, right: str) -> str:
+        """Nối hai chunk liền kề, bỏ phần overlap do text splitter tạo ra"""
+        max_overlap = min(len(left), len(right), settings.chunk_overlap)
+        for size in range(max_overlap, 20, -1):
+            if left.endswith(right[:size]):
+                return left + right[size:]
+        
+        return left + "\n" + right
+    
+    @staticmethod
+    def _to_search_result(row) -> SearchResult:
+        return SearchResult(
+            content=row.content,
+            similarity=float(row.similarity),
+            document_url=row.url,
+            document_title=row.title,
+            document_id=row.document_id,
+            chunk_index=row.chunk_index,
+            section_index=row.section_index
+        )
+    
+    def _ann_sql(self, query_vector: str, filter_sql: str, index_mode: Optional[str] = None,
+                 version: Optional[VersionInfo] = None, collection: Optional[CollectionInfo] = None) -> str:
+        """
+        Tạo câu ANN theo chế độ index embedding
+        
+        vector: quét trực tiếp index float32.
+        halfvec/binary: lấy ứng viên qua index lượng tử hóa, sau đó tính lại
+        similarity bằng vector đầy đủ và chỉ giữ top kết quả.
+        
+        Tên version và collection được chèn dạng hằng số (đã kiểm tra khi tạo) để planner
+        chọn được partial index ix_coll_<collection>_<version> của collection.
+        
+        Args:
+            query_vector: Biểu thức SQL của query vector (kiểu vector)
+            filter_sql: Điều kiện lọc từ _filter_conditions
+            index_mode: Ghi đè settings.embedding_index_mode
+            version: Phiên bản embedding (legacy: chunks.embedding, còn lại: chunk_embeddings)
+            collection: Collection cần tìm, mặc định collection default
+            
+        Returns:
+            str: Câu SELECT trả về content, similarity, url, title và vị trí chunk
+        """
+        mode = index_mode or settings.embedding_index_mode
+        version = version or embedding_registry.active()
+        collection = collection or collection_registry.default()
+        dimension = version.dimension
+        
+        if version.is_legacy:
+            embedding = "c.embedding"
+            source = "chunks c"
+            filter_sql = f" AND c.collection = '{collection.name}'" + filter_sql
+        else:
+            # Khớp biểu thức của partial index ix_chunk_embeddings_<version> / ix_coll_<collection>_<version>
+            embedding = f"e.embedding::vector({dimension})"
+            source = "chunk_embeddings e JOIN chunks c ON c.id = e.chunk_id AND c.ingest_epoch = e.ingest_epoch"
+            filter_sql = f" AND e.version = '{version.name}' AND e.collection = '{collection.name}'" + filter_sql
+        
+        columns = f"""
+                    c.content,
+                    c.start_offset,
+                    c.end_offset,
+                    1 - ({embedding} <=> {query_vector}) as similarity,
+                    c.url,
+                    c.title,
+                    c.document_id,
+                    c.chunk_index,
+                    c.section_index"""
+        
+        if mode == "vector":
+            return self._resolve_text_sql(f"""
+                SELECT {columns}
+                FROM {source}
+                WHERE (1 - ({embedding} <=> {query_vector})) >= :threshold{filter_sql}
+                ORDER BY {embedding} <=> {query_vector}
+                LIMIT :max_results""")
+        
+        if mode == "halfvec":
+            order_by = f"({embedding})::halfvec({dimension}) <=> {query_vector}::halfvec({dimension})"
+        elif mode == "binary":
+            order_by = f"binary_quantize({embedding})::bit({dimension}) <~> binary_quantize({query_vector})"
+        else:
+            raise ValueError(f"Unknown embedding index mode: {mode}")
+        
+        return self._resolve_text_sql(f"""
+                SELECT candidates.* FROM (
+                    SELECT {columns}
+                    FROM {source}
+                    WHERE TRUE{filter_sql}
+                    ORDER BY {order_by}
+                    LIMIT :candidates
+                ) candidates
+                WHERE candidates.similarity >= :threshold
+                ORDER BY candidates.similarity DESC
+                LIMIT :max_results""")
+    
+    @staticmethod
+    def _resolve_text_sql(hits_sql: str) -> str:
+        """Chỉ đọc documents.content cho các hit cuối cùng, sau khi ANN đã giới hạn số row"""
+        return f"""
+                SELECT {CHUNK_TEXT_SQL.format(chunk="hits")} AS content,
+                       hits.similarity, hits.url, hits.title,
+                       hits.document_id, hits.chunk_index, hits.section_index
+                FROM ({hits_sql}
+                ) hits
+                LEFT JOIN documents d ON d.id = hits.document_id
+                ORDER BY hits.similarity DESC"""
+    
+    def _filter_conditions(self, filters: Optional[SearchFilters], params: dict) -> str:
+        """Tạo điều kiện WHERE cho filters và thêm tham số tương ứng vào params"""
+        if filters is None:
+            return ""
+        
+        conditions = []
+        
+        if filters.domain:
+            conditions.append("c.domain = :filter_domain")
+            params['filter_domain'] = filters.domain
+        
+        if filters.url_prefix:
+            escaped = filters.url_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            conditions.append("c.url LIKE :filter_url_prefix")
+            params['filter_url_prefix'] = escaped + "%"
+        
+        if filters.scraped_after:
+            conditions.append("c.scraped_at >= :filter_scraped_after")
+            params['filter_scraped_after'] = filters.scraped_after
+        
+        if filters.scraped_before:
+            conditions.append("c.scraped_at < :filter_scraped_before")
+            params['filter_scraped_before'] = filters.scraped_before
+        
+        if filters.metadata:
+            conditions.append("c.meta_data @> CAST(:filter_metadata AS jsonb)")
+            params['filter_metadata'] = json.dumps(filters.metadata)
+        
+        return "".join(f" AND {condition}" for condition in conditions)
+    
+    def _enable_iterative_scan(self):
+        """Bật iterative index scan cho transaction hiện tại (pgvector >= 0.8)
+        
+        Cần cho mọi câu ANN: điều kiện collection (và filter) được áp sau khi quét index
+        toàn bảng, nên không có iterative scan thì trả về ít hơn max_results.
+        """
+        mode = settings.vector_iterative_scan
+        if mode == "auto":
+            mode = "relaxed_order" if self._iterative_scan_supported() else "off"
+        if mode == "off":
+            return
+        
+        self.db.execute(text("SELECT set_config('hnsw.iterative_scan', :mode, true)"), {'mode': mode})
+        # ivfflat chỉ hỗ trợ relaxed_order
+        self.db.execute(text("SELECT set_config('ivfflat.iterative_scan', 'relaxed_order', true)"))
+    
+    def _iterative_scan_supported(self) -> bool:
+        """pgvector đã cài có hỗ trợ iterative scan không (kiểm tra một lần mỗi process)"""
+        global _iterative_scan_supported
+        if _iterative_scan_supported is None:
+            version = self.db.execute(
+                text("SELECT extversion FROM pg_extension WHERE extname = :name"),
+                {'name': settings.pgvector_extension}
+            ).scalar()
+            _iterative_scan_supported = _version_tuple(version) >= (0, 8)
+            if not _iterative_scan_supported:
+                logger.warning(
+                    "pgvector %s không hỗ trợ iterative scan, truy vấn theo collection chưa có index riêng "
+                    "có thể trả về ít kết quả hơn max_results", version
+                )
+        return _iterative_scan_supported
+    
+    @staticmethod
+    def _parse_scraped_at(value) -> Optional[datetime]:
+        """Chuyển scraped_at trong metadata của scraper sang datetime"""
+        if not value:
+            return None
+        if isinstance(value, datetime):
+            return value
+        
+        try:
+            return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+        except ValueError:
+            return None
+    
+    def embed_query(self, query: str, version: Optional[VersionInfo] = None) -> List[float]:
+        """Embedding của query bằng phiên bản active (hoặc version), để dùng lại cho semantic_search"""
+        return self._embed_query(query, version or embedding_registry.active())
+    
+    def _embed_query(self, query: str, version: VersionInfo) -> List[float]:
+        """Embed query bằng model của phiên bản, gom batch với các request đồng thời nếu được bật"""
+        if settings.query_batching_enabled:
+            return get_query_batcher(version.model).embed(query)
+        
+        return self._embeddings_for(version).embed_query(query)
+    
+    def list_documents(self, limit: int = 20, after: Optional[Tuple[datetime, UUID]] = None,
+                       domain: Optional[str] = None, include_content: bool = False) -> list:
+        """
+        Lấy một trang documents, mới nhất trước, phân trang keyset theo (created_at, id)
+        
+        Chỉ select các cột cần trả về; với index (created_at, id) hoặc
+        (domain, created_at, id), trang sâu cũng nhanh như trang đầu.
+        
+        Args:
+            limit: Số documents tối đa
+            after: (created_at, id) của document cuối trang trước
+            domain: Chỉ lấy documents của domain này
+            include_content: Có lấy cột content không
+            
+        Returns:
+            list: Rows có id, url, title, domain, created_at (và content)
+        """
+        columns = [Document.id, Document.url, Document.title, Document.domain, Document.created_at]
+        if include_content:
+            columns.append(Document.content)
+        
+        query = self.db.query(*columns)
+        if domain:
+            query = query.filter(Document.domain == domain)
+        if after:
+            query = query.filter(tuple_(Document.created_at, Document.id) < tuple_(*after))
+        
+        return query.order_by(Document.created_at.desc(), Document.id.desc()).limit(limit).all()
+    
+    def iter_documents(self, domain: Optional[str] = None, include_content: bool = False,
+                       batch_size: int = 500):
+        """Duyệt toàn bộ documents theo từng trang keyset, không giữ cả corpus trong bộ nhớ"""
+        after = None
+        while True:
+            rows = self.list_documents(batch_size, after, domain, include_content)
+            yield from rows
+            
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1].created_at, rows[-1].id)
+    
+    def get_document_by_url(self, url: str, collection: str = DEFAULT_COLLECTION) -> Optional[Document]:
+        """Lấy document theo URL trong một collection"""
+        return self.db.query(Document).filter(Document.collection == collection, Document.url == url).first()
+    
+    def get_fingerprints(self, domain: str, collection: str = DEFAULT_COLLECTION) -> Tuple[List[int], List[int]]:
+        """
+        Lấy fingerprints đã lưu của một domain trong một collection
+        
+        Returns:
+            tuple: (fingerprints của documents, fingerprints của chunks)
+        """
+        page_fingerprints = [
+            row.simhash for row in self.db.query(Document.simhash)
+            .filter(Document.collection == collection, Document.domain == domain, Document.simhash.isnot(None))
+        ]
+        chunk_fingerprints = [
+            row.simhash for row in self.db.query(Chunk.simhash)
+            .filter(Chunk.collection == collection, Chunk.domain == domain, Chunk.simhash.isnot(None))
+        ]
+        return page_fingerprints, chunk_fingerprints
+    
+    def backfill_fingerprints(self, batch_size: int = 500) -> int:
+        """
+        Tính SimHash cho documents và chunks được lưu trước khi có deduplication
+        
+        Returns:
+            int: Số rows đã cập nhật
+        """
+        updated = 0
+        
+        while True:
+            rows = (
+                self.db.query(Document)
+                .filter(Document.simhash.is_(None), Document.content.isnot(None))
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            
+            for row in rows:
+                row.simhash = to_signed(simhash(row.content))
+            
+            self.db.commit()
+            updated += len(rows)
+            logger.info(f"Backfilled {updated} fingerprints")
+        
+        # Text của chunk có thể là offset trong documents.content (compact_chunk_text)
+        chunk_text = CHUNK_TEXT_SQL.format(chunk="c")
+        select_sql = text(f"""
+            SELECT c.id, c.ingest_epoch, {chunk_text} AS content
+            FROM chunks c
+            JOIN documents d ON d.id = c.document_id
+            WHERE c.simhash IS NULL AND {chunk_text} IS NOT NULL
+            LIMIT :batch_size
+        """)
+        update_sql = text(
+            "UPDATE chunks SET simhash = :simhash WHERE id = :id AND ingest_epoch = :ingest_epoch"
+        )
+        while True:
+            rows = self.db.execute(select_sql, {"batch_size": batch_size}).fetchall()
+            if not rows:
+                break
+            
+            self.db.execute(update_sql, [
+                {"simhash": to_signed(simhash(row.content)), "id": row.id, "ingest_epoch": row.ingest_epoch}
+                for row in rows
+            ])
+            self.db.commit()
+            updated += len(rows)
+            logger.info(f"Backfilled {updated} fingerprints")
+        
+        return updated
     
     def delete_document(self, document_id: UUID) -> bool:
-        """Xóa document và chunks"""
+        """Xóa document, chunks được xóa theo FK ON DELETE CASCADE"""
         try:
-            # Xóa chunks trước
-            self.db.query(Chunk).filter(Chunk.document_id == document_id).delete()
+            # Subquery đếm chunks nhìn snapshot trước khi cascade chạy
+            row = self.db.execute(text("""
+                WITH deleted AS (
+                    DELETE FROM documents WHERE id = :document_id RETURNING id
+                )
+                SELECT
+                    (SELECT COUNT(*) FROM deleted) AS documents,
+                    (SELECT COUNT(*) FROM chunks WHERE document_id = :document_id) AS chunks
+            """), {"document_id": document_id}).first()
+            self.db.commit()
             
-            # Xóa document
-            doc = self.db.query(Document).filter(Document.id == document_id).first()
-            if doc:
-                self.db.delete(doc)
-                self.db.commit()
-                return True
+            if not row.documents:
+                return False
             
-            return False
+            corpus_stats.record_delete(row.documents, row.chunks)
+            return True
             
         except Exception as e:
             self.db.rollback()
             logger.error(f"Error deleting document: {str(e)}")
             raise
     
+    def bulk_delete(self, domain: Optional[str] = None, url_prefix: Optional[str] = None,
+                    created_before: Optional[datetime] = None, batch_size: int = 500,
+                    pause_seconds: float = 0.0, progress: Optional[dict] = None,
+                    collection: Optional[str] = None) -> dict:
+        """
+        Xóa documents (và chunks theo cascade) theo domain, URL prefix, tuổi hoặc collection
+        
+        Mỗi batch là một transaction ngắn để không giữ lock lâu; documents đang bị
+        transaction khác khóa được bỏ qua thay vì chờ.
+        
+        Args:
+            domain: Chỉ xóa documents của domain này
+            url_prefix: Chỉ xóa documents có URL bắt đầu bằng prefix
+            created_before: Chỉ xóa documents tạo trước thời điểm này
+            batch_size: Số documents mỗi batch
+            pause_seconds: Nghỉ giữa các batch để nhường I/O cho search
+            progress: Dict được cập nhật sau mỗi batch (để báo tiến độ)
+            collection: Chỉ xóa documents của collection này
+            
+        Returns:
+            dict: Số batches, documents và chunks đã xóa
+        """
+        conditions, params = [], {"batch_size": batch_size}
+        if domain:
+            conditions.append("domain = :domain")
+            params["domain"] = domain
+        if url_prefix:
+            conditions.append("url LIKE :url_prefix ESCAPE '\\'")
+            params["url_prefix"] = self._escape_like(url_prefix) + "%"
+        if created_before:
+            conditions.append("created_at < :created_before")
+            params["created_before"] = created_before
+        if collection:
+            conditions.append("collection = :collection")
+            params["collection"] = collection
+        
+        if not conditions:
+            raise ValueError("Bulk delete requires at least one filter")
+        
+        sql = text(f"""
+            WITH batch AS (
+                SELECT id FROM documents
+                WHERE {" AND ".join(conditions)}
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            ),
+            deleted AS (
+                DELETE FROM documents d USING batch WHERE d.id = batch.id RETURNING d.id
+            )
+            SELECT
+                (SELECT COUNT(*) FROM deleted) AS documents,
+                (SELECT COUNT(*) FROM chunks WHERE document_id IN (SELECT id FROM batch)) AS chunks
+        """)
+        
+        progress = progress if progress is not None else {}
+        progress.update({"batches": 0, "documents_deleted": 0, "chunks_deleted": 0})
+        
+        while True:
+            try:
+                row = self.db.execute(sql, params).first()
+                self.db.commit()
+            except Exception as e:
+                self.db.rollback()
+                logger.error(f"Error in bulk delete: {str(e)}")
+                raise
+            
+            if not row.documents:
+                break
+            
+            corpus_stats.record_delete(row.documents, row.chunks)
+            progress["batches"] += 1
+            progress["documents_deleted"] += row.documents
+            progress["chunks_deleted"] += row.chunks
+            logger.info(f"Bulk delete batch {progress['batches']}: {row.documents} documents, {row.chunks} chunks")
+            
+            if pause_seconds:
+                time.sleep(pause_seconds)
+        
+        return dict(progress)
+    
+    def compact_chunk_text(self, batch_size: int = 1000, pause_seconds: float = 0.05,
+                           progress: Optional[dict] = None) -> dict:
+        """
+        Chuyển text inline của các chunk cũ sang offset trong documents.content
+        
+        Duyệt chunks theo id từng batch ngắn; chunk không phải đoạn liên tục của
+        document (đã gộp, có heading path) giữ nguyên text inline. Cần VACUUM
+        chunks sau đó để thu hồi chỗ trống.
+        
+        Args:
+            batch_size: Số chunk mỗi batch
+            pause_seconds: Nghỉ giữa các batch
+            progress: Dict được cập nhật tiến độ
+            
+        Returns:
+            dict: Số chunk đã quét và đã chuyển sang offset
+        """
+        progress = progress if progress is not None else {}
+        progress.setdefault("scanned", 0)
+        progress.setdefault("compacted", 0)
+        
+        sql_query = text("""
+            WITH batch AS (
+                SELECT id, ingest_epoch FROM chunks
+                WHERE content IS NOT NULL AND id > :after
+                ORDER BY id
+                LIMIT :batch_size
+            ), located AS (
+                SELECT c.id, c.ingest_epoch, strpos(d.content, c.content) AS position, length(c.content) AS length
+                FROM batch b
+                JOIN chunks c ON c.id = b.id AND c.ingest_epoch = b.ingest_epoch
+                JOIN documents d ON d.id = c.document_id
+            ), updated AS (
+                UPDATE chunks c
+                SET start_offset = l.position - 1, end_offset = l.position - 1 + l.length, content = NULL
+                FROM located l
+                WHERE c.id = l.id AND c.ingest_epoch = l.ingest_epoch AND l.position > 0
+                RETURNING 1
+            )
+            SELECT
+                (SELECT id FROM batch ORDER BY id DESC LIMIT 1) AS last_id,
+                (SELECT COUNT(*) FROM batch) AS scanned,
+                (SELECT COUNT(*) FROM updated) AS compacted
+        """)
+        
+        after = "00000000-0000-0000-0000-000000000000"
+        try:
+            while True:
+                row = self.db.execute(sql_query, {"after": after, "batch_size": batch_size}).first()
+                self.db.commit()
+                if not row.scanned:
+                    break
+                
+                after = row.last_id
+                progress["scanned"] += row.scanned
+                progress["compacted"] += row.compacted
+                time.sleep(pause_seconds)
+            
+            logger.info(f"Compacted chunk text: {progress}")
+            return progress
+            
+        except Exception as e:
+            self.db.rollback()
+            logger.error(f"Error compacting chunk text: {str(e)}")
+            raise
+    
+    @staticmethod
+    def _escape_like(value: str) -> str:
+        return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    
     def get_stats(self) -> dict:
-        """Lấy thống kê về vector store"""
+        """Lấy thống kê về vector store (ước lượng, làm mới ở background)"""
         try:
-            doc_count = self.db.query(Document).count()
-            chunk_count = self.db.query(Chunk).count()
+            if corpus_stats.refreshed_at is None:
+                corpus_stats.refresh(self.db)
             
-            return {
-                "total_documents": doc_count,
-                "total_chunks": chunk_count,
-                "avg_chunks_per_doc": round(chunk_count / doc_count, 2) if doc_count > 0 else 0
-            }
+            return corpus_stats.snapshot()
             
         except Exception as e:
             logger.error(f"Error getting stats: {str(e)}")
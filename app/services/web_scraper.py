@@ -1,12 +1,17 @@
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
-from typing import List, Dict, Set
+from typing import Dict, Iterator, List, Optional
 import time
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import posixpath
 
+from app.config import settings
+from app.services.content_extractor import ContentBlock, ContentExtractor
+from app.services.crawl_frontier import CrawlFrontier, fetch_sitemap
+from app.services.deduplication import canonicalize_url
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -15,10 +20,17 @@ class ScrapedContent:
     title: str
     content: str
     metadata: Dict[str, str]
+    blocks: List[ContentBlock] = field(default_factory=list)
 
 class WebScraper:
     def __init__(self, delay: float = 1.0):
         self.delay = delay
+        self.duplicate_urls = 0  # Số URL bị bỏ qua do trùng URL chuẩn
+        # Dùng chung trong một lần crawl để học boilerplate lặp lại giữa các trang
+        self.extractor = ContentExtractor(
+            boilerplate_min_pages=settings.boilerplate_min_pages,
+            max_link_density=settings.max_link_density
+        )
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
@@ -87,13 +99,17 @@ class WebScraper:
             title = soup.find('title')
             title = title.get_text().strip() if title else "Untitled"
             
-            # Loại bỏ script và style
-            for script in soup(["script", "style", "nav", "footer", "aside"]):
-                script.decompose()
+            # URL chuẩn: ưu tiên rel=canonical cùng domain
+            canonical_url = canonicalize_url(response.url or url)
+            canonical_link = soup.find('link', rel='canonical', href=True)
+            if canonical_link:
+                candidate = canonicalize_url(urljoin(url, canonical_link['href']))
+                if urlparse(candidate).netloc == urlparse(canonical_url).netloc:
+                    canonical_url = candidate
             
-            # Lấy text chính
-            content = soup.get_text()
-            content = self._clean_text(content)
+            # Lấy nội dung chính theo block, giữ heading/bảng/danh sách
+            blocks = self.extractor.extract(soup)
+            content = self.extractor.to_text(blocks)
             
             # Metadata
             metadata = {
@@ -101,8 +117,10 @@ class WebScraper:
                 "domain": urlparse(url).netloc,
                 "content_length": str(len(content))
             }
+            if canonical_url != url:
+                metadata["source_url"] = url
             
-            return ScrapedContent(url, title, content, metadata)
+            return ScrapedContent(canonical_url, title, content, metadata, blocks)
             
         except Exception as e:
             logger.error(f"Error scraping {url}: {str(e)}")
@@ -120,45 +138,78 @@ class WebScraper:
         Returns:
             List[ScrapedContent]: Danh sách nội dung đã scrape
         """
-        visited: Set[str] = set()
-        to_visit: List[tuple] = [(start_url, 0)]  # (url, depth)
-        results: List[ScrapedContent] = []
+        return list(self.iter_website(start_url, max_depth, max_pages))
+    
+    def iter_website(self, start_url: str, max_depth: int = 2, max_pages: int = 10,
+                     frontier: Optional[CrawlFrontier] = None) -> Iterator[ScrapedContent]:
+        """
+        Scrape website theo thứ tự priority của frontier, trả từng trang ngay khi scrape xong
         
-        base_domain = urlparse(start_url).netloc
-        count = 0
-        while to_visit and len(results) < max_pages:
-            url, depth = to_visit.pop(0)
+        Trang chỉ được ghi done vào frontier khi caller lấy trang tiếp theo, tức là
+        sau khi trang trước đã được xử lý xong; checkpoint chạy mỗi crawl_checkpoint_every trang.
+        
+        Args:
+            start_url: URL bắt đầu
+            max_depth: Độ sâu tối đa
+            max_pages: Số trang tối đa (tính cả các trang đã scrape trước khi resume)
+            frontier: Frontier đã restore khi resume; None để tạo mới
             
-            if url in visited or depth > max_depth:
+        Yields:
+            ScrapedContent: Nội dung từng trang
+        """
+        base_domain = urlparse(canonicalize_url(start_url)).netloc
+        
+        if frontier is None:
+            frontier = CrawlFrontier()
+        if frontier.done == 0 and len(frontier) == 0:
+            frontier.push(canonicalize_url(start_url), 0)
+            if settings.crawl_sitemap_enabled and max_depth > 0:
+                added = frontier.seed_sitemap(fetch_sitemap(self.session, start_url))
+                logger.info(f"Seeded frontier with {added} sitemap URLs")
+        
+        count = frontier.done
+        while count < max_pages:
+            item = frontier.pop()
+            if item is None:
+                break
+            url, depth = item
+            
+            if depth > max_depth or not self._is_valid_url(url):
+                frontier.mark_done(url, "skipped")
                 continue
             
-            # Kiểm tra URL có hợp lệ không
-            if not self._is_valid_url(url):
-                continue
-                
-            count += 1
-            visited.add(url)
-            
             try:
                 # Scrape trang hiện tại
                 content = self.scrape_url(url)
-                results.append(content)
-                logger.info(f"Scraped: {count} - {url}")
+                
+                # Trang khai báo rel=canonical trỏ về trang đã thấy
+                if content.url != url and not frontier.mark_seen(content.url):
+                    self.duplicate_urls += 1
+                    logger.debug("Skipped %s: canonical %s already seen", url, content.url)
+                    frontier.mark_done(url, "skipped")
+                    continue
                 
                 # Tìm links mới nếu chưa đạt max depth
                 if depth < max_depth:
-                    new_links = self._extract_links(url, base_domain)
-                    for link in new_links:
-                        if link not in visited and self._is_valid_url(link):
-                            to_visit.append((link, depth + 1))
-                
-                time.sleep(self.delay)
+                    for link in self._extract_links(url, base_domain):
+                        frontier.push(link, depth + 1)
                 
             except Exception as e:
                 logger.error(f"Failed to scrape {url}: {str(e)}")
+                frontier.mark_done(url, "failed")
                 continue
+            
+            count += 1
+            logger.debug("Scraped: %d - %s", count, url)
+            yield content
+            
+            frontier.mark_done(url)
+            if count % settings.crawl_checkpoint_every == 0:
+                frontier.checkpoint(count)
+            
+            time.sleep(self.delay)
         
-        return results
+        frontier.checkpoint(count)
     
     def _extract_links(self, url: str, base_domain: str) -> List[str]:
         """Trích xuất links từ trang"""
@@ -169,7 +220,7 @@ class WebScraper:
             links = []
             for link in soup.find_all('a', href=True):
                 href = link['href']
-                full_url = urljoin(url, href)
+                full_url = canonicalize_url(urljoin(url, href))
                 
                 # Chỉ lấy links cùng domain và hợp lệ
                 if (urlparse(full_url).netloc == base_domain and 
@@ -181,15 +232,3 @@ class WebScraper:
         except Exception as e:
             logger.error(f"Error extracting links from {url}: {str(e)}")
             return []
-    
-    def _clean_text(self, text: str) -> str:
-        """Làm sạch text"""
-        lines = text.split('\n')
-        cleaned_lines = []
-        
-        for line in lines:
-            line = line.strip()
-            if line and len(line) > 10:
-                cleaned_lines.append(line)
-        
-        return '\n'.join(cleaned_lines)
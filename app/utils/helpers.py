@@ -0,0 +1,47 @@
+from datetime import datetime
+from typing import Tuple
+from uuid import UUID
+import base64
+
+def estimate_tokens(text: str) -> int:
+    """
+    Ước lượng số token của text mà không cần gọi tokenizer
+
+    Tiếng Việt có dấu trung bình khoảng 3 ký tự/token với tokenizer của Gemini.
+    """
+    if not text:
+        return 0
+    return max(1, len(text) // 3)
+
+def encode_cursor(created_at: datetime, document_id: UUID) -> str:
+    """Mã hóa vị trí (created_at, id) của row cuối trang thành cursor dạng chuỗi"""
+    raw = f"{created_at.isoformat()}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """
+    Giải mã cursor do encode_cursor tạo
+
+    Raises:
+        ValueError: Cursor không hợp lệ
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, document_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), UUID(document_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def ingest_epoch(moment: datetime = None) -> int:
+    """
+    Epoch ingest (YYYYMM) dùng làm khóa partition của chunks
+
+    Epoch 0 là dữ liệu có từ trước khi chia partition.
+    """
+    moment = moment or datetime.utcnow()
+    return moment.year * 100 + moment.month
+
+def next_epoch(epoch: int) -> int:
+    """Epoch của tháng kế tiếp"""
+    year, month = divmod(epoch, 100)
+    return (year + 1) * 100 + 1 if month == 12 else epoch + 1
@@ -0,0 +1,64 @@
+from types import ModuleType
+from typing import Dict, List, Optional
+import importlib
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Các thư viện nặng chỉ cần khi chat/embed/chunking, không cần để app nhận request
+PREWARM_MODULES = [
+    "google.generativeai",
+    "langchain.text_splitter",
+    "langchain.schema",
+    "sklearn.feature_extraction.text",
+    "sklearn.metrics.pairwise",
+]
+
+class LazyModule:
+    """
+    Module được import ở lần truy cập thuộc tính đầu tiên
+
+        genai = LazyModule("google.generativeai")
+        genai.embed_content(...)  # import tại đây
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, item: str):
+        return getattr(self._load(), item)
+
+def prewarm(modules: List[str] = None) -> Dict[str, float]:
+    """
+    Import trước các thư viện nặng để request đầu tiên không phải chờ
+
+    Args:
+        modules: Tên module cần import, mặc định PREWARM_MODULES
+
+    Returns:
+        Dict[str, float]: Thời gian import của từng module (ms)
+    """
+    timings = {}
+
+    for name in modules or PREWARM_MODULES:
+        started = time.perf_counter()
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            logger.warning(f"Failed to pre-warm {name}: {str(e)}")
+            continue
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    logger.info(f"Pre-warmed modules (ms): {timings}")
+    return timings
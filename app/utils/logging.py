@@ -1,36 +1,135 @@
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from queue import SimpleQueue
+from typing import Optional
+import atexit
+import json
 import logging
+import random
 import sys
-from pathlib import Path
+
+from app.config import settings
+
+# ID của request hiện tại, gắn vào mọi log record sinh ra trong request đó
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Thuộc tính có sẵn của LogRecord; phần còn lại là field truyền qua extra=
+_RECORD_ATTRIBUTES = set(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+
+_listener: Optional[QueueListener] = None
+
+class RequestIdFilter(logging.Filter):
+    """Gắn request_id từ context của thread/task đang log (phải chạy trước khi record vào queue)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Chỉ giữ một phần các record DEBUG (sự kiện tần suất cao: mỗi search, mỗi batch embed)
+
+    Record có thể tự đặt tỉ lệ qua extra={"sample_rate": ...}; WARNING trở lên không bao giờ bị bỏ.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+
+        rate = getattr(record, "sample_rate", self.rate if record.levelno <= logging.DEBUG else 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+class JsonFormatter(logging.Formatter):
+    """Một dòng JSON mỗi record: thời gian, level, logger, message, request_id và các field extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None),
+            "thread": record.threadName
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and key not in payload and key != "sample_rate":
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler chỉ format ở thread gọi log khi cần
+
+    Record không có args/exc_info được đưa nguyên vào queue (cùng process), không
+    copy và không format. Record có args hoặc exc_info vẫn được format ngay như
+    QueueHandler mặc định: args có thể là object mutable hoặc ORM object gắn với
+    session của thread gọi log, không được repr() muộn ở listener thread. Record
+    DEBUG bị SamplingFilter loại thì không tới bước này.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.args or record.exc_info:
+            return super().prepare(record)
+        return record
 
 def setup_logging():
-    """Setup logging configuration"""
-    
+    """
+    Cấu hình logging: root logger chỉ có một QueueHandler, ghi file/stdout chạy ở listener thread
+
+    Thread gọi log (kể cả event loop) chỉ lọc level, gắn request_id và đưa record
+    vào queue; format JSON và I/O nằm ở listener. File log xoay vòng theo kích thước.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
     # Tạo logs directory
-    log_dir = Path("logs")
+    log_dir = Path(settings.log_dir)
     log_dir.mkdir(exist_ok=True)
-    
-    # Logging format
-    log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    
-    # Root logger
-    logging.basicConfig(
-        level=logging.INFO,
-        format=log_format,
-        handlers=[
-            logging.FileHandler(log_dir / "app.log"),
-            logging.StreamHandler(sys.stdout)
-        ]
+
+    if settings.log_format == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+
+    file_handler = RotatingFileHandler(
+        log_dir / "app.log",
+        maxBytes=settings.log_max_bytes,
+        backupCount=settings.log_backup_count,
+        encoding="utf-8"
     )
-    
-    # Specific loggers
-    loggers = [
-        "app.services.web_scraper",
-        "app.services.text_processor", 
-        "app.services.embeddings",
-        "app.services.vector_store",
-        "app.services.chatbot"
-    ]
-    
-    for logger_name in loggers:
-        logger = logging.getLogger(logger_name)
-        logger.setLevel(logging.INFO)
\ No newline at end of file
+    stream_handler = logging.StreamHandler(sys.stdout)
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+
+    queue = SimpleQueue()
+    queue_handler = DeferredQueueHandler(queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(SamplingFilter(settings.log_debug_sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings.log_level.upper())
+
+    _listener = QueueListener(queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    # Ghi hết các record còn trong queue khi process thoát
+    atexit.register(stop_logging)
+
+def stop_logging():
+    """Dừng listener sau khi đã ghi hết queue"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
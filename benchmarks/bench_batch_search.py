@@ -0,0 +1,61 @@
+"""
+So sánh throughput giữa /search/batch và gọi lần lượt /search/semantic.
+
+Cần một API đang chạy với dữ liệu thật:
+
+    python -m benchmarks.bench_batch_search --base-url http://localhost:8000 \
+        --queries-file questions.txt --batch-size 100
+"""
+import argparse
+import time
+
+import requests
+
+DEFAULT_QUERIES = [
+    "phí thường niên thẻ tín dụng",
+    "số hotline chăm sóc khách hàng",
+    "cách mở tài khoản trên VPBank NEO",
+    "lãi suất tiết kiệm kỳ hạn 12 tháng",
+    "quên mật khẩu đăng nhập",
+]
+
+def load_queries(path: str, count: int):
+    if path:
+        with open(path, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+    return [queries[i % len(queries)] for i in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--queries-file", default=None)
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-results", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries_file, args.count)
+    session = requests.Session()
+    params = {"max_results": args.max_results, "similarity_threshold": 0.0}
+
+    start = time.perf_counter()
+    for query in queries:
+        response = session.post(f"{args.base_url}/api/v1/search/semantic", json={"query": query, **params})
+        response.raise_for_status()
+    single_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(0, len(queries), args.batch_size):
+        batch = queries[i:i + args.batch_size]
+        response = session.post(f"{args.base_url}/api/v1/search/batch", json={"queries": batch, **params})
+        response.raise_for_status()
+    batch_elapsed = time.perf_counter() - start
+
+    print(f"single: {len(queries) / single_elapsed:8.1f} queries/s ({single_elapsed:.2f}s)")
+    print(f"batch:  {len(queries) / batch_elapsed:8.1f} queries/s ({batch_elapsed:.2f}s)")
+    print(f"speedup: {single_elapsed / batch_elapsed:.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Đo chi phí logging trên thread xử lý request: handler đồng bộ cũ so với pipeline queue.
+
+Mỗi request giả lập sinh ra các log giống đường nóng thật: một dòng INFO,
+một dòng kết quả search, một dòng mỗi batch embedding và mỗi trang scrape.
+"sync" là cấu hình cũ (FileHandler + StreamHandler trên root, f-string, mọi dòng
+ở INFO); "queue" là app.utils.logging (QueueHandler, format JSON ở listener,
+dòng tần suất cao ở DEBUG và được sample). --disk-latency-us giả lập đĩa chậm
+bằng cách sleep trong mỗi lần ghi file.
+
+    python -m benchmarks.bench_logging --requests 5000 --clients 8 --disk-latency-us 0 200
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import logging
+import os
+import tempfile
+import time
+from logging.handlers import QueueListener, RotatingFileHandler
+from queue import SimpleQueue
+
+import numpy as np
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/bench")
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+
+from app.utils.logging import DeferredQueueHandler, JsonFormatter, RequestIdFilter, SamplingFilter, request_id_var
+
+QUERY = "Lãi suất tiết kiệm kỳ hạn 12 tháng cho khách hàng cá nhân hiện nay là bao nhiêu? " * 3
+
+class _SlowDisk:
+    """Sleep trước mỗi lần ghi để giả lập đĩa/volume mạng chậm"""
+    latency = 0.0
+
+    def emit(self, record):
+        if self.latency:
+            time.sleep(self.latency)
+        super().emit(record)
+
+class SlowFileHandler(_SlowDisk, logging.FileHandler):
+    def __init__(self, filename: str, latency_us: float):
+        super().__init__(filename, encoding="utf-8")
+        self.latency = latency_us / 1_000_000
+
+class SlowRotatingFileHandler(_SlowDisk, RotatingFileHandler):
+    def __init__(self, filename: str, latency_us: float):
+        super().__init__(filename, maxBytes=10 * 1024 * 1024, backupCount=2, encoding="utf-8")
+        self.latency = latency_us / 1_000_000
+
+def request_sync(logger: logging.Logger, batches: int, pages: int):
+    logger.info(f"Found 5 results for query: {QUERY}")
+    for i in range(batches):
+        logger.info(f"Processed batch {i + 1}/{batches}")
+    for i in range(pages):
+        logger.info(f"Scraped: {i} - https://example.com/page/{i}")
+    logger.info("Generated response for conversation conv-1 (primary)")
+
+def request_queue(logger: logging.Logger, batches: int, pages: int):
+    logger.debug("Found %d results for query: %.80s", 5, QUERY)
+    for i in range(batches):
+        logger.debug("Processed batch %d/%d", i + 1, batches)
+    for i in range(pages):
+        logger.debug("Scraped: %d - %s", i, f"https://example.com/page/{i}")
+    logger.info("Generated response for conversation %s (%s)", "conv-1", "primary")
+
+def configure_sync(log_dir: str, latency_us: float):
+    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    handlers = [SlowFileHandler(os.path.join(log_dir, "sync.log"), latency_us), logging.StreamHandler(open(os.devnull, "w"))]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers, None
+
+def configure_queue(log_dir: str, latency_us: float, sample_rate: float):
+    formatter = JsonFormatter()
+    targets = [SlowRotatingFileHandler(os.path.join(log_dir, "queue.log"), latency_us),
+               logging.StreamHandler(open(os.devnull, "w"))]
+    for handler in targets:
+        handler.setFormatter(formatter)
+
+    queue = SimpleQueue()
+    handler = DeferredQueueHandler(queue)
+    handler.addFilter(RequestIdFilter())
+    handler.addFilter(SamplingFilter(sample_rate))
+    listener = QueueListener(queue, *targets, respect_handler_level=True)
+    listener.start()
+    return [handler], listener
+
+def run(mode: str, args, latency_us: float) -> dict:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        if mode == "sync":
+            handlers, listener = configure_sync(log_dir, latency_us)
+            request, level = request_sync, logging.INFO
+        else:
+            handlers, listener = configure_queue(log_dir, latency_us, args.sample_rate)
+            request, level = request_queue, logging.DEBUG if args.debug else logging.INFO
+        for handler in handlers:
+            root.addHandler(handler)
+        root.setLevel(level)
+        logger = logging.getLogger("bench")
+
+        def one(i: int) -> float:
+            request_id_var.set(f"req-{i}")
+            started = time.perf_counter()
+            request(logger, args.batches, args.pages)
+            return (time.perf_counter() - started) * 1_000_000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.clients) as pool:
+            latencies = list(pool.map(one, range(args.requests)))
+        elapsed = time.perf_counter() - started
+
+        drain_started = time.perf_counter()
+        if listener:
+            listener.stop()
+        drain = time.perf_counter() - drain_started
+
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+
+    return {
+        "mean_us": float(np.mean(latencies)),
+        "p99_us": float(np.percentile(latencies, 99)),
+        "req_s": args.requests / elapsed,
+        "drain_s": drain
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--batches", type=int, default=4, help="Số dòng log batch embedding mỗi request")
+    parser.add_argument("--pages", type=int, default=2, help="Số dòng log trang scrape mỗi request")
+    parser.add_argument("--disk-latency-us", type=float, nargs="+", default=[0.0, 200.0])
+    parser.add_argument("--sample-rate", type=float, default=0.01)
+    parser.add_argument("--debug", action="store_true", help="Bật level DEBUG cho pipeline queue (đo sampling)")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8} {'disk_us':>8} {'mean_us':>10} {'p99_us':>10} {'req/s':>10} {'drain_s':>8}")
+    for latency_us in args.disk_latency_us:
+        for mode in ("sync", "queue"):
+            result = run(mode, args, latency_us)
+            print(f"{mode:<8} {latency_us:>8.0f} {result['mean_us']:>10.1f} {result['p99_us']:>10.1f} "
+                  f"{result['req_s']:>10.1f} {result['drain_s']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
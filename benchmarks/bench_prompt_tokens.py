@@ -0,0 +1,86 @@
+"""
+So sánh prompt một chuỗi (cách cũ) với system instruction tĩnh + phần động mỗi lượt.
+
+Với mỗi câu hỏi mẫu: số token input provider tính (count_tokens), số token được
+cache (nếu SDK/model trả về) và latency sinh câu trả lời.
+
+    python -m benchmarks.bench_prompt_tokens --turns 10
+
+Gọi Gemini thật, cần GOOGLE_API_KEY.
+"""
+import argparse
+import statistics
+import time
+
+import google.generativeai as genai
+
+from app.config import settings
+from app.services.prompts import get_chat_model, get_prompt_templates
+
+QUESTIONS = [
+    "Thẻ tín dụng VPBank StepUp có ưu đãi gì?",
+    "Phí thường niên của thẻ đó là bao nhiêu?",
+    "Làm sao để mở tài khoản trên VPBank NEO?",
+    "Tôi quên mật khẩu đăng nhập thì làm thế nào?",
+    "Lãi suất vay mua nhà hiện tại là bao nhiêu?",
+]
+
+CONTEXT = "Nguồn 1:\nTiêu đề: Thẻ tín dụng\nURL: https://www.vpbank.com.vn/ca-nhan/the-tin-dung\nNội dung: " + (
+    "Thẻ VPBank StepUp hoàn tiền tới 15% cho chi tiêu ăn uống và giải trí trực tuyến. " * 20
+)
+
+def run_legacy(model, templates, question: str, history: str):
+    prompt = templates.system_instruction + "\n\n" + templates.render_turn(question, CONTEXT, history)
+    tokens = model.count_tokens(prompt).total_tokens
+    started = time.perf_counter()
+    response = model.generate_content(prompt)
+    return tokens, (time.perf_counter() - started) * 1000, response
+
+def run_split(chat_model, templates, question: str, history: str):
+    prompt = templates.render_turn(question, CONTEXT, history)
+    started = time.perf_counter()
+    response = chat_model.generate_content(prompt)
+    latency = (time.perf_counter() - started) * 1000
+    usage = getattr(response, "usage_metadata", None)
+    tokens = getattr(usage, "prompt_token_count", None) if usage else None
+    return tokens, latency, response
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=len(QUESTIONS))
+    args = parser.parse_args()
+
+    genai.configure(api_key=settings.google_api_key)
+    templates = get_prompt_templates()
+    legacy_model = genai.GenerativeModel(settings.chat_model)
+    chat_model = get_chat_model(settings.chat_model)
+
+    print(f"system instruction attached: {chat_model.system_attached}")
+
+    results = {"legacy": ([], []), "split": ([], [])}
+    cached = 0
+    history = ""
+    for i in range(args.turns):
+        question = QUESTIONS[i % len(QUESTIONS)]
+
+        tokens, latency, _ = run_legacy(legacy_model, templates, question, history)
+        results["legacy"][0].append(tokens)
+        results["legacy"][1].append(latency)
+
+        tokens, latency, response = run_split(chat_model, templates, question, history)
+        if tokens is not None:
+            results["split"][0].append(tokens)
+        results["split"][1].append(latency)
+        usage = getattr(response, "usage_metadata", None)
+        cached += getattr(usage, "cached_content_token_count", 0) or 0
+
+        history += f"Khách hàng: {question}\nTuanVu: {response.text[:300]}\n\n"
+
+    for name, (tokens, latencies) in results.items():
+        avg_tokens = f"{statistics.mean(tokens):.0f}" if tokens else "n/a"
+        print(f"{name:7s} avg_prompt_tokens={avg_tokens} "
+              f"p50={statistics.median(latencies):.0f}ms max={max(latencies):.0f}ms")
+    print(f"split   cached_tokens_total={cached}")
+
+if __name__ == "__main__":
+    main()
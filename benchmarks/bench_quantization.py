@@ -0,0 +1,78 @@
+"""
+So sánh các chế độ index embedding (vector, halfvec, binary) trên database thật.
+
+Với mỗi chế độ: kích thước index, recall@k so với tìm kiếm chính xác (quét tuần tự
+bằng vector đầy đủ) và latency p50/p99. Query là embedding của các chunk ngẫu nhiên
+đã có trong database, nên không tốn quota Gemini.
+
+    python -m benchmarks.bench_quantization --queries 200 --k 10
+
+Cần chạy migrations/upgrades/002_quantized_embedding_indexes.sql trước.
+"""
+import argparse
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from app.config import settings
+from app.models.database import SessionLocal
+from app.services.vector_store import PgVectorStore
+
+INDEXES = {
+    "vector": "chunks_embedding_idx",
+    "halfvec": "ix_chunks_embedding_halfvec",
+    "binary": "ix_chunks_embedding_binary",
+}
+
+def index_size(db, name: str) -> str:
+    row = db.execute(text(
+        "SELECT pg_size_pretty(pg_relation_size(to_regclass(:name))) AS size"
+    ), {"name": name}).first()
+    return row.size if row and row.size else "n/a"
+
+def search(db, store: PgVectorStore, embedding: str, k: int, mode: str, exact: bool = False):
+    params = {"query_embedding": embedding, "threshold": -1.0, "max_results": k,
+              "candidates": k * settings.rescore_factor}
+    if exact:
+        db.execute(text("SET LOCAL enable_indexscan = off"))
+    sql = text(store._ann_sql("CAST(:query_embedding AS vector)", "", index_mode=mode))
+    rows = db.execute(sql, params).fetchall()
+    if exact:
+        db.execute(text("SET LOCAL enable_indexscan = on"))
+    return [(row.url, row.content) for row in rows]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--modes", nargs="+", default=list(INDEXES))
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        store = PgVectorStore(db)
+        samples = db.execute(text(
+            "SELECT embedding::text AS embedding FROM chunks TABLESAMPLE SYSTEM (10) LIMIT :n"
+        ), {"n": args.queries}).fetchall()
+        queries = [row.embedding for row in samples]
+        print(f"{len(queries)} queries, k={args.k}")
+
+        truth = [set(search(db, store, q, args.k, "vector", exact=True)) for q in queries]
+
+        print(f"{'mode':<8} {'index size':>12} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8}")
+        for mode in args.modes:
+            latencies, recalls = [], []
+            for query, expected in zip(queries, truth):
+                start = time.perf_counter()
+                found = search(db, store, query, args.k, mode)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recalls.append(len(expected & set(found)) / max(len(expected), 1))
+
+            print(f"{mode:<8} {index_size(db, INDEXES[mode]):>12} {np.mean(recalls):>9.3f} "
+                  f"{np.percentile(latencies, 50):>8.1f} {np.percentile(latencies, 99):>8.1f}")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
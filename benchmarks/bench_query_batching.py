@@ -0,0 +1,72 @@
+"""
+Đo throughput của QueryEmbeddingBatcher so với gọi embed từng query.
+
+Embedding API được giả lập bằng một hàm sleep cố định cho mỗi request
+(không phụ thuộc số query trong batch), nên kết quả phản ánh số round-trip
+tiết kiệm được chứ không phải tốc độ thật của Gemini.
+
+    python -m benchmarks.bench_query_batching --clients 64 --requests 2000
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import os
+import random
+import threading
+import time
+
+os.environ.setdefault("DATABASE_URL", "postgresql://localhost/bench")
+os.environ.setdefault("GOOGLE_API_KEY", "bench")
+
+from app.services.query_batcher import QueryEmbeddingBatcher
+
+class FakeEmbeddingAPI:
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000.0
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def embed_one(self, query: str):
+        return self.embed_many([query])[0]
+
+    def embed_many(self, queries):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return [[float(len(q))] * 768 for q in queries]
+
+def run(clients: int, requests: int, embed, queries):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(embed, (random.choice(queries) for _ in range(requests))))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--distinct", type=int, default=500, help="Số query khác nhau")
+    parser.add_argument("--window-ms", type=float, nargs="+", default=[0.0, 2.0, 5.0, 10.0])
+    parser.add_argument("--max-batch", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--concurrency", type=int, default=4, help="Số batch chạy song song")
+    args = parser.parse_args()
+
+    queries = [f"câu hỏi số {i}" for i in range(args.distinct)]
+
+    api = FakeEmbeddingAPI(args.latency_ms)
+    elapsed = run(args.clients, args.requests, api.embed_one, queries)
+    print(f"{'direct':<24} {args.requests / elapsed:>10.1f} req/s  {api.calls:>6} API calls")
+
+    for window_ms in args.window_ms:
+        for max_batch in args.max_batch:
+            api = FakeEmbeddingAPI(args.latency_ms)
+            batcher = QueryEmbeddingBatcher(api.embed_many, window_ms=window_ms,
+                                            max_batch_size=max_batch, max_concurrency=args.concurrency)
+            elapsed = run(args.clients, args.requests, batcher.embed, queries)
+            stats = batcher.get_stats()
+            label = f"window={window_ms}ms batch={max_batch}"
+            print(f"{label:<24} {args.requests / elapsed:>10.1f} req/s  {api.calls:>6} API calls  "
+                  f"avg_batch={stats['avg_batch_size']} dedup={stats['deduplicated']}")
+
+if __name__ == "__main__":
+    main()
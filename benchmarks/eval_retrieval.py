@@ -0,0 +1,58 @@
+"""
+Đánh giá chất lượng và latency của retrieval trên tập câu hỏi có nhãn.
+
+Mỗi cấu hình trong --configs được chạy song song trên database thật; báo cáo
+recall@k, MRR, nDCG@k, latency p50/p95 và số prompt token trung bình. Cấu hình
+đầu tiên là baseline; lệnh trả về mã 1 nếu cấu hình nào giảm recall@k nhiều hơn
+--max-recall-drop so với baseline.
+
+    python -m benchmarks.eval_retrieval --cases benchmarks/data/eval_cases.jsonl \
+        --configs benchmarks/data/eval_configs.json --k 10 --output eval_report.json
+"""
+import argparse
+import json
+import logging
+import sys
+
+from app.services.evaluation import RetrievalEvaluator, RetrievalConfig, load_cases, load_configs
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", required=True, help="JSONL: question, relevant_urls, relevant_chunks")
+    parser.add_argument("--configs", help="JSON array các RetrievalConfig; mặc định chỉ cấu hình hiện tại")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--parallel", type=int, default=None, help="Số cấu hình tính metric chất lượng đồng thời (latency luôn đo lần lượt)")
+    parser.add_argument("--max-recall-drop", type=float, default=0.02)
+    parser.add_argument("--output", help="Ghi báo cáo đầy đủ ra file JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    cases = load_cases(args.cases)
+    if not cases:
+        sys.exit("No evaluation cases")
+    configs = load_configs(args.configs) if args.configs else [RetrievalConfig(name="current")]
+
+    reports = RetrievalEvaluator(cases, k=args.k).run(configs, parallel=args.parallel)
+
+    recall_key, ndcg_key = f"recall@{args.k}", f"ndcg@{args.k}"
+    print(f"{len(cases)} queries, k={args.k}")
+    print(f"{'config':<20} {recall_key:>10} {'mrr':>7} {ndcg_key:>9} {'p50 ms':>8} {'p95 ms':>8} {'tokens':>8}")
+    regressions = []
+    for config, report in zip(configs, reports):
+        print(f"{config.name:<20} {report[recall_key]:>10.3f} {report['mrr']:>7.3f} {report[ndcg_key]:>9.3f} "
+              f"{report['p50_ms']:>8.1f} {report['p95_ms']:>8.1f} {report['avg_prompt_tokens']:>8.0f}")
+        if report.get("delta", {}).get(recall_key, 0) < -args.max_recall_drop:
+            regressions.append(config.name)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+
+    if regressions:
+        print(f"recall@{args.k} dropped more than {args.max_recall_drop} vs {configs[0].name}: "
+              f"{', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
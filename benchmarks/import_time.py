@@ -0,0 +1,88 @@
+"""
+Đo thời gian cold start khi import app.main và kiểm tra ngưỡng cho phép.
+
+Mỗi lần đo chạy một process Python mới với `-X importtime`, lấy lần nhanh nhất
+trong --runs lần. In thời gian import (cumulative) của từng module app.* và các
+thư viện bên thứ ba nặng nhất. Thoát với mã 1 nếu:
+  - import app.main vượt quá --budget-ms (mặc định settings.import_time_budget_ms), hoặc
+  - một thư viện nặng (Gemini SDK, langchain, sklearn, nltk) bị import ngay khi khởi động.
+
+    python -m benchmarks.import_time --runs 5
+
+Dùng được trong CI như một bài kiểm tra ngân sách import.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict
+
+from app.config import settings
+
+TARGET = "app.main"
+
+# Chỉ được import lúc cần (LazyModule / import trong hàm / pre-warm ở background)
+FORBIDDEN_AT_IMPORT = ["nltk", "sklearn", "google.generativeai", "langchain"]
+
+def measure() -> Dict[str, int]:
+    """Chạy một process mới, trả về thời gian import cumulative (µs) của từng module"""
+    code = (
+        f"import sys; import {TARGET}; "
+        f"print('LOADED', ','.join(m for m in {FORBIDDEN_AT_IMPORT!r} if m in sys.modules))"
+    )
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, env=os.environ.copy(), check=True
+    )
+
+    timings = {"__loaded__": proc.stdout.strip().split("LOADED", 1)[-1].strip()}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            timings[name.strip()] = int(cumulative.strip())
+
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=settings.import_time_budget_ms)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.runs)]
+    best = min(runs, key=lambda timings: timings[TARGET])
+    total_ms = best[TARGET] / 1000
+
+    print(f"{'module':45s} {'cumulative ms':>14s}")
+    app_modules = sorted(
+        (name for name in best if name.startswith("app.")),
+        key=lambda name: best[name], reverse=True
+    )
+    for name in app_modules:
+        print(f"{name:45s} {best[name] / 1000:14.1f}")
+
+    print()
+    third_party = sorted(
+        (name for name in best if "." not in name and not name.startswith("_") and name not in ("app", "__loaded__")),
+        key=lambda name: best[name], reverse=True
+    )[:args.top]
+    for name in third_party:
+        print(f"{name:45s} {best[name] / 1000:14.1f}")
+
+    print(f"\n{TARGET}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs})")
+
+    failed = False
+    if total_ms > args.budget_ms:
+        print(f"FAIL: import time over budget by {total_ms - args.budget_ms:.1f} ms")
+        failed = True
+    if best["__loaded__"]:
+        print(f"FAIL: heavy modules imported at startup: {best['__loaded__']}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Kích thước bảng và tỉ lệ cache hit của documents/chunks trên database thật.
+
+Báo cáo heap, TOAST và index của từng bảng (bảng partition được cộng qua mọi
+partition), lượng text chunk còn lưu inline so với lưu dạng offset, và tỉ lệ
+buffer cache hit khi chạy --queries truy vấn search (query là embedding của các
+chunk ngẫu nhiên, không tốn quota Gemini).
+
+Chạy trước và sau khi áp dụng 010_partitioned_chunks.sql + compact-text để so sánh:
+
+    python -m benchmarks.storage_report --queries 200 --output before.json
+    python -m benchmarks.storage_report --queries 200 --compare before.json
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+from sqlalchemy import text
+
+from app.models.database import SessionLocal
+from app.services.vector_store import PgVectorStore
+
+TABLES = ["documents", "chunks", "chunk_embeddings"]
+
+def table_sizes(db, table: str) -> dict:
+    # pg_partition_tree trả về chính bảng đó nếu không phải bảng partition
+    row = db.execute(text("""
+        SELECT COALESCE(SUM(pg_relation_size(relid)), 0) AS heap_bytes,
+               COALESCE(SUM(pg_table_size(relid) - pg_relation_size(relid)), 0) AS toast_bytes,
+               COALESCE(SUM(pg_indexes_size(relid)), 0) AS index_bytes,
+               COUNT(*) FILTER (WHERE isleaf) AS partitions
+        FROM pg_partition_tree(to_regclass(:table))
+    """), {"table": table}).first()
+    return dict(row._mapping)
+
+def cache_counters(db, table: str) -> dict:
+    row = db.execute(text("""
+        SELECT COALESCE(SUM(s.heap_blks_hit), 0) AS heap_hit, COALESCE(SUM(s.heap_blks_read), 0) AS heap_read,
+               COALESCE(SUM(s.idx_blks_hit), 0) AS idx_hit, COALESCE(SUM(s.idx_blks_read), 0) AS idx_read,
+               COALESCE(SUM(s.toast_blks_hit), 0) AS toast_hit, COALESCE(SUM(s.toast_blks_read), 0) AS toast_read
+        FROM pg_partition_tree(to_regclass(:table)) t
+        JOIN pg_statio_user_tables s ON s.relid = t.relid
+    """), {"table": table}).first()
+    return {key: int(value) for key, value in row._mapping.items()}
+
+def hit_ratio(hit: int, read: int):
+    return round(hit / (hit + read), 4) if hit + read else None
+
+def has_offsets(db) -> bool:
+    return db.execute(text("""
+        SELECT EXISTS (
+            SELECT 1 FROM information_schema.columns WHERE table_name = 'chunks' AND column_name = 'start_offset'
+        )
+    """)).scalar()
+
+def chunk_text_storage(db) -> dict:
+    if not has_offsets(db):
+        row = db.execute(text("""
+            SELECT COUNT(*) AS inline_chunks, COALESCE(SUM(octet_length(content)), 0) AS inline_bytes,
+                   0 AS offset_chunks, 0 AS offset_chars
+            FROM chunks
+        """)).first()
+        return dict(row._mapping)
+
+    row = db.execute(text("""
+        SELECT COUNT(*) FILTER (WHERE content IS NOT NULL) AS inline_chunks,
+               COALESCE(SUM(octet_length(content)), 0) AS inline_bytes,
+               COUNT(*) FILTER (WHERE content IS NULL AND start_offset IS NOT NULL) AS offset_chunks,
+               COALESCE(SUM(end_offset - start_offset) FILTER (WHERE content IS NULL), 0) AS offset_chars
+        FROM chunks
+    """)).first()
+    return dict(row._mapping)
+
+def run_queries(db, count: int, k: int) -> dict:
+    store = PgVectorStore(db)
+    samples = db.execute(text(
+        "SELECT embedding::text AS embedding FROM chunks TABLESAMPLE SYSTEM (10) "
+        "WHERE embedding IS NOT NULL LIMIT :n"
+    ), {"n": count}).scalars().all()
+    if not samples:
+        return {}
+
+    before = {table: cache_counters(db, table) for table in TABLES}
+    if has_offsets(db):
+        sql = text(store._ann_sql("CAST(:query_embedding AS vector)", ""))
+    else:
+        # Schema trước 010: text inline trong chunks
+        sql = text("""
+            SELECT c.content, c.url, c.title FROM chunks c
+            ORDER BY c.embedding <=> CAST(:query_embedding AS vector)
+            LIMIT :max_results
+        """)
+    latencies = []
+    for embedding in samples:
+        started = time.perf_counter()
+        db.execute(sql, {"query_embedding": embedding, "threshold": -1.0, "max_results": k,
+                         "candidates": k * 10}).fetchall()
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    # pg_statio được stats collector cập nhật không đồng bộ
+    db.commit()
+    time.sleep(1)
+    db.execute(text("SELECT pg_stat_clear_snapshot()"))
+    workload = {}
+    for table in TABLES:
+        after = cache_counters(db, table)
+        delta = {key: after[key] - before[table][key] for key in after}
+        workload[table] = {
+            "heap_hit_ratio": hit_ratio(delta["heap_hit"], delta["heap_read"]),
+            "index_hit_ratio": hit_ratio(delta["idx_hit"], delta["idx_read"]),
+            "toast_hit_ratio": hit_ratio(delta["toast_hit"], delta["toast_read"]),
+            "blocks_read": delta["heap_read"] + delta["idx_read"] + delta["toast_read"]
+        }
+
+    return {
+        "queries": len(samples),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+        "tables": workload
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=0)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="Ghi báo cáo ra file JSON")
+    parser.add_argument("--compare", help="Báo cáo JSON trước đó để so sánh")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        report = {
+            "sizes": {table: table_sizes(db, table) for table in TABLES},
+            "chunk_text": chunk_text_storage(db),
+            "cache": {
+                table: {
+                    "heap_hit_ratio": hit_ratio(counters["heap_hit"], counters["heap_read"]),
+                    "index_hit_ratio": hit_ratio(counters["idx_hit"], counters["idx_read"])
+                }
+                for table, counters in ((table, cache_counters(db, table)) for table in TABLES)
+            }
+        }
+        if args.queries:
+            report["workload"] = run_queries(db, args.queries, args.k)
+    finally:
+        db.close()
+
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+
+    print(f"{'table':<18} {'heap MB':>9} {'toast MB':>9} {'index MB':>9} {'total MB':>9} {'vs before':>10}")
+    for table, sizes in report["sizes"].items():
+        total = sizes["heap_bytes"] + sizes["toast_bytes"] + sizes["index_bytes"]
+        change = ""
+        if previous and table in previous["sizes"]:
+            old = previous["sizes"][table]
+            old_total = old["heap_bytes"] + old["toast_bytes"] + old["index_bytes"]
+            change = f"{(total - old_total) / old_total * 100:+.1f}%" if old_total else ""
+        print(f"{table:<18} {sizes['heap_bytes'] / 2**20:>9.1f} {sizes['toast_bytes'] / 2**20:>9.1f} "
+              f"{sizes['index_bytes'] / 2**20:>9.1f} {total / 2**20:>9.1f} {change:>10}")
+
+    chunk_text = report["chunk_text"]
+    print(f"chunk text: {chunk_text['inline_chunks']} inline ({chunk_text['inline_bytes'] / 2**20:.1f} MB), "
+          f"{chunk_text['offset_chunks']} as offsets")
+
+    workload = report.get("workload")
+    if workload:
+        print(f"{workload['queries']} queries: p50 {workload['p50_ms']} ms, p95 {workload['p95_ms']} ms")
+        for table, stats in workload["tables"].items():
+            print(f"  {table:<18} heap hit {stats['heap_hit_ratio']}  index hit {stats['index_hit_ratio']}  "
+                  f"toast hit {stats['toast_hit_ratio']}  blocks read {stats['blocks_read']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, default=str)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+-- Chuyển meta_data từ Text (repr của dict Python) sang JSONB
+-- và denormalize domain/url/title/scraped_at sang bảng chunks để search không cần join documents.
+--
+-- Chạy thủ công trên database đã có dữ liệu:
+--   psql "$DATABASE_URL" -f migrations/upgrades/001_metadata_jsonb.sql
+
+BEGIN;
+
+-- str(dict) của scraper chỉ chứa giá trị chuỗi đơn giản, nên đổi nháy đơn sang nháy kép là đủ.
+-- Giá trị không parse được sẽ thành '{}' thay vì làm hỏng migration.
+CREATE FUNCTION pg_temp.py_repr_to_jsonb(value text) RETURNS jsonb AS $$
+BEGIN
+    IF value IS NULL OR value = '' THEN
+        RETURN '{}'::jsonb;
+    END IF;
+    RETURN replace(value, '''', '"')::jsonb;
+EXCEPTION WHEN others THEN
+    RETURN '{}'::jsonb;
+END;
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE documents
+    ALTER COLUMN meta_data TYPE jsonb USING pg_temp.py_repr_to_jsonb(meta_data),
+    ALTER COLUMN meta_data SET DEFAULT '{}'::jsonb,
+    ADD COLUMN IF NOT EXISTS domain varchar;
+
+UPDATE documents SET domain = meta_data->>'domain' WHERE domain IS NULL;
+
+ALTER TABLE chunks
+    ALTER COLUMN meta_data TYPE jsonb USING pg_temp.py_repr_to_jsonb(meta_data),
+    ALTER COLUMN meta_data SET DEFAULT '{}'::jsonb,
+    ADD COLUMN IF NOT EXISTS domain varchar,
+    ADD COLUMN IF NOT EXISTS url varchar,
+    ADD COLUMN IF NOT EXISTS title varchar,
+    ADD COLUMN IF NOT EXISTS scraped_at timestamp;
+
+UPDATE chunks c
+SET domain = d.domain,
+    url = d.url,
+    title = d.title,
+    scraped_at = to_timestamp(d.meta_data->>'scraped_at', 'YYYY-MM-DD HH24:MI:SS')::timestamp
+FROM documents d
+WHERE c.document_id = d.id;
+
+CREATE INDEX IF NOT EXISTS ix_documents_domain ON documents(domain);
+CREATE INDEX IF NOT EXISTS ix_chunks_domain ON chunks(domain);
+CREATE INDEX IF NOT EXISTS ix_chunks_scraped_at ON chunks(scraped_at);
+CREATE INDEX IF NOT EXISTS ix_chunks_meta_data ON chunks USING gin (meta_data jsonb_path_ops);
+
+COMMIT;
+
+ANALYZE documents;
+ANALYZE chunks;
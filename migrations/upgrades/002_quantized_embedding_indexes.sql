@@ -0,0 +1,20 @@
+-- Index ANN lượng tử hóa cho chunks.embedding (pgvector >= 0.7).
+--
+-- Vector float32 đầy đủ vẫn nằm trong bảng và chỉ được dùng để tính lại
+-- similarity cho top ứng viên; index chỉ lưu bản halfvec hoặc bit nên nhỏ hơn
+-- 2 lần (halfvec) hoặc 32 lần (binary) và dễ nằm trọn trong shared_buffers.
+--
+-- Index được build trên toàn bộ rows hiện có. CONCURRENTLY nên không chạy trong transaction:
+--   psql "$DATABASE_URL" -f migrations/upgrades/002_quantized_embedding_indexes.sql
+-- Sau đó đặt EMBEDDING_INDEX_MODE=halfvec hoặc EMBEDDING_INDEX_MODE=binary.
+
+SET maintenance_work_mem = '1GB';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_halfvec
+ON chunks USING hnsw ((embedding::halfvec(768)) halfvec_cosine_ops);
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_embedding_binary
+ON chunks USING hnsw ((binary_quantize(embedding)::bit(768)) bit_hamming_ops);
+
+-- Khi đã chuyển hẳn sang chế độ lượng tử hóa, có thể bỏ index float32 để giải phóng bộ nhớ:
+-- DROP INDEX CONCURRENTLY IF EXISTS chunks_embedding_idx;
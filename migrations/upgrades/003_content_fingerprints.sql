@@ -0,0 +1,7 @@
+-- SimHash fingerprint của documents và chunks cho near-duplicate detection khi ingest.
+--
+-- Rows cũ chưa có fingerprint sẽ không được dùng để so trùng cho đến khi backfill:
+--   python -c "from app.models.database import SessionLocal; from app.services.vector_store import PgVectorStore; PgVectorStore(SessionLocal()).backfill_fingerprints()"
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS simhash bigint;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS simhash bigint;
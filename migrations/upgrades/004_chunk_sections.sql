@@ -0,0 +1,4 @@
+-- Quan hệ section (parent) / chunk (child) cho structured chunking.
+
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS section_index integer;
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS heading_path varchar;
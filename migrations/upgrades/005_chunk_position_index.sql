@@ -0,0 +1,3 @@
+-- Range query trên (document_id, chunk_index) cho small-to-big retrieval.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_chunks_document_chunk ON chunks (document_id, chunk_index);
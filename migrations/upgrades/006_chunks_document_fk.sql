@@ -0,0 +1,16 @@
+-- Foreign key chunks.document_id -> documents.id với ON DELETE CASCADE.
+--
+-- Chunk mồ côi (document đã bị xóa trước đây) được dọn trước. Constraint được
+-- thêm NOT VALID (chỉ khóa ngắn) rồi VALIDATE riêng, không chặn ghi trong lúc kiểm tra.
+-- Cascade dùng index idx_chunks_document_id / ix_chunks_document_chunk sẵn có.
+
+DELETE FROM chunks c
+WHERE c.document_id IS NULL
+   OR NOT EXISTS (SELECT 1 FROM documents d WHERE d.id = c.document_id);
+
+ALTER TABLE chunks DROP CONSTRAINT IF EXISTS fk_chunks_document;
+ALTER TABLE chunks
+    ADD CONSTRAINT fk_chunks_document FOREIGN KEY (document_id)
+    REFERENCES documents (id) ON DELETE CASCADE NOT VALID;
+
+ALTER TABLE chunks VALIDATE CONSTRAINT fk_chunks_document;
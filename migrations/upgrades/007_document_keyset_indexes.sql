@@ -0,0 +1,4 @@
+-- Index cho phân trang keyset (created_at, id) của GET /scraping/documents.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_created_id ON documents (created_at, id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_documents_domain_created_id ON documents (domain, created_at, id);
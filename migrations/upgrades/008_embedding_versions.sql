@@ -0,0 +1,28 @@
+-- Embedding theo phiên bản model để re-embed kiểu blue/green không cần crawl lại.
+--
+-- Phiên bản "legacy" là cột chunks.embedding hiện tại (điền đúng model/số chiều đang dùng).
+-- Mỗi phiên bản mới có partial index ANN riêng, được tạo bởi job backfill:
+--   CREATE INDEX CONCURRENTLY ix_chunk_embeddings_<name> ON chunk_embeddings
+--   USING hnsw ((embedding::vector(<dimension>)) vector_cosine_ops) WHERE version = '<name>';
+
+CREATE TABLE IF NOT EXISTS embedding_versions (
+    name varchar PRIMARY KEY,
+    model varchar NOT NULL,
+    dimension integer NOT NULL,
+    status varchar NOT NULL DEFAULT 'building',
+    backfilled integer DEFAULT 0,
+    created_at timestamp DEFAULT now(),
+    activated_at timestamp
+);
+
+CREATE TABLE IF NOT EXISTS chunk_embeddings (
+    chunk_id uuid NOT NULL REFERENCES chunks (id) ON DELETE CASCADE,
+    version varchar NOT NULL REFERENCES embedding_versions (name) ON DELETE CASCADE,
+    embedding vector,
+    created_at timestamp DEFAULT now(),
+    PRIMARY KEY (chunk_id, version)
+);
+
+INSERT INTO embedding_versions (name, model, dimension, status, activated_at)
+VALUES ('legacy', 'models/embedding-001', 768, 'active', now())
+ON CONFLICT (name) DO NOTHING;
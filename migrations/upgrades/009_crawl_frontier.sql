@@ -0,0 +1,27 @@
+-- Frontier của crawl được lưu để checkpoint và tiếp tục (POST /scraping/crawls/{id}/resume).
+
+CREATE TABLE IF NOT EXISTS crawl_jobs (
+    id varchar PRIMARY KEY,
+    start_url varchar NOT NULL,
+    max_depth integer,
+    max_pages integer,
+    status varchar NOT NULL DEFAULT 'processing',
+    pages_scraped integer DEFAULT 0,
+    report jsonb DEFAULT '{}'::jsonb,
+    created_at timestamp DEFAULT now(),
+    updated_at timestamp DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS crawl_frontier (
+    crawl_id varchar NOT NULL REFERENCES crawl_jobs (id) ON DELETE CASCADE,
+    url_hash bigint NOT NULL,
+    url varchar NOT NULL,
+    depth integer NOT NULL,
+    priority double precision NOT NULL,
+    status varchar NOT NULL DEFAULT 'pending',
+    lastmod timestamp,
+    updated_at timestamp DEFAULT now(),
+    PRIMARY KEY (crawl_id, url_hash)
+);
+
+CREATE INDEX IF NOT EXISTS ix_crawl_frontier_pending ON crawl_frontier (crawl_id, status);
@@ -0,0 +1,79 @@
+-- Chia chunks thành partition theo ingest_epoch (YYYYMM) và cho phép lưu text
+-- của chunk dưới dạng offset trong documents.content (start_offset/end_offset).
+--
+-- Bảng chunks hiện tại không bị copy: nó được đổi tên và gắn vào làm partition
+-- chunks_p_legacy (ingest_epoch = 0), index cũ được gắn vào index của bảng cha.
+-- Partition theo tháng cho dữ liệu mới do app tạo (ChunkPartitionManager).
+-- Cần PostgreSQL 12+. Nên chạy khi không có ingest vì migration giữ lock trên chunks.
+--
+-- Sau khi chạy: POST /api/v1/admin/maintenance/compact-text để chuyển text của
+-- các chunk cũ sang offset, rồi VACUUM chunks.
+
+BEGIN;
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS ingest_epoch integer DEFAULT 0;
+ALTER TABLE documents ALTER COLUMN ingest_epoch DROP DEFAULT;
+CREATE INDEX IF NOT EXISTS ix_documents_ingest_epoch ON documents (ingest_epoch);
+
+ALTER TABLE chunks RENAME TO chunks_p_legacy;
+ALTER INDEX chunks_pkey RENAME TO chunks_p_legacy_id_key;
+ALTER TABLE chunks_p_legacy ADD COLUMN ingest_epoch integer NOT NULL DEFAULT 0;
+ALTER TABLE chunks_p_legacy ALTER COLUMN ingest_epoch DROP DEFAULT;
+ALTER TABLE chunks_p_legacy ADD COLUMN IF NOT EXISTS start_offset integer;
+ALTER TABLE chunks_p_legacy ADD COLUMN IF NOT EXISTS end_offset integer;
+-- Cho phép ATTACH không cần quét lại bảng
+ALTER TABLE chunks_p_legacy ADD CONSTRAINT chunks_p_legacy_epoch CHECK (ingest_epoch < 1);
+
+CREATE TABLE chunks (
+    id uuid NOT NULL,
+    ingest_epoch integer NOT NULL,
+    document_id uuid,
+    content text,
+    start_offset integer,
+    end_offset integer,
+    embedding vector(768),
+    chunk_index integer,
+    section_index integer,
+    heading_path varchar,
+    simhash bigint,
+    meta_data jsonb,
+    domain varchar,
+    url varchar,
+    title varchar,
+    scraped_at timestamp,
+    created_at timestamp,
+    CONSTRAINT chunks_pkey PRIMARY KEY (id, ingest_epoch),
+    CONSTRAINT fk_chunks_document FOREIGN KEY (document_id) REFERENCES documents (id) ON DELETE CASCADE
+) PARTITION BY RANGE (ingest_epoch);
+
+-- Tạo lại mọi index của bảng cũ trên bảng cha, cùng tên và định nghĩa; khi ATTACH,
+-- index có sẵn của partition được gắn vào thay vì build lại
+DO $$
+DECLARE
+    idx record;
+BEGIN
+    FOR idx IN
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = 'chunks_p_legacy' AND indexname <> 'chunks_p_legacy_id_key'
+    LOOP
+        EXECUTE format('ALTER INDEX %I RENAME TO %I', idx.indexname, left('legacy_' || idx.indexname, 63));
+        EXECUTE regexp_replace(idx.indexdef, ' ON (\S+\.)?chunks_p_legacy ', ' ON \1chunks ');
+    END LOOP;
+END $$;
+
+ALTER TABLE chunks ATTACH PARTITION chunks_p_legacy FOR VALUES FROM (MINVALUE) TO (1);
+
+ALTER TABLE chunk_embeddings DROP CONSTRAINT IF EXISTS chunk_embeddings_chunk_id_fkey;
+ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS ingest_epoch integer NOT NULL DEFAULT 0;
+ALTER TABLE chunk_embeddings ALTER COLUMN ingest_epoch DROP DEFAULT;
+CREATE INDEX IF NOT EXISTS ix_chunk_embeddings_ingest_epoch ON chunk_embeddings (ingest_epoch);
+ALTER TABLE chunk_embeddings
+    ADD CONSTRAINT fk_chunk_embeddings_chunk FOREIGN KEY (chunk_id, ingest_epoch)
+    REFERENCES chunks (id, ingest_epoch) ON DELETE CASCADE;
+
+COMMIT;
+
+-- Tùy chọn (PostgreSQL 14+ build với lz4): nén documents.content bằng lz4 thay vì
+-- pglz; giải nén nhanh hơn khi search cắt text chunk từ document. Chỉ áp dụng cho
+-- giá trị được ghi sau lệnh này.
+-- ALTER TABLE documents ALTER COLUMN content SET COMPRESSION lz4;
@@ -0,0 +1,8 @@
+-- Token bucket của admission control khi ADMISSION_BUCKET_BACKEND=postgres (dùng chung giữa các worker).
+-- UNLOGGED vì state có thể mất: sau crash mọi bucket đầy lại.
+
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    key varchar PRIMARY KEY,
+    tokens double precision NOT NULL,
+    updated_at timestamptz NOT NULL
+);
@@ -0,0 +1,16 @@
+-- Câu trả lời dựng sẵn cho các cụm câu hỏi thường gặp (python -m app.services.faq build).
+
+CREATE TABLE IF NOT EXISTS faq_entries (
+    id uuid PRIMARY KEY,
+    question text NOT NULL,
+    embedding_version varchar NOT NULL,
+    centroid vector NOT NULL,
+    question_embedding vector NOT NULL,
+    threshold double precision NOT NULL,
+    cluster_size integer NOT NULL,
+    answer text NOT NULL,
+    sources jsonb DEFAULT '[]'::jsonb,
+    status varchar NOT NULL DEFAULT 'approved',
+    checked_at timestamp DEFAULT now(),
+    updated_at timestamp DEFAULT now()
+);
@@ -0,0 +1,38 @@
+-- Collection: một knowledge base có tên, với nguồn crawl, cấu hình chunking, phiên bản
+-- embedding, index ANN và prompt tenant riêng. Dữ liệu hiện có thuộc collection "default".
+--
+-- Cột collection được thêm với DEFAULT hằng số nên không phải ghi lại bảng (PostgreSQL 11+).
+-- Index ANN của từng collection là partial index (WHERE collection = '<name>'), được tạo
+-- khi tạo collection hoặc qua POST /api/v1/admin/collections/<name>/reindex; collection
+-- "default" tiếp tục dùng các index ANN hiện có cho tới khi build index riêng.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS collections (
+    name varchar PRIMARY KEY,
+    description text,
+    prompt_tenant varchar,
+    embedding_version varchar,
+    chunk_size integer NOT NULL,
+    chunk_overlap integer NOT NULL,
+    chunking_mode varchar NOT NULL,
+    sources jsonb DEFAULT '[]'::jsonb,
+    created_at timestamp DEFAULT now()
+);
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS collection varchar NOT NULL DEFAULT 'default';
+ALTER TABLE chunks ADD COLUMN IF NOT EXISTS collection varchar NOT NULL DEFAULT 'default';
+ALTER TABLE chunk_embeddings ADD COLUMN IF NOT EXISTS collection varchar NOT NULL DEFAULT 'default';
+ALTER TABLE crawl_jobs ADD COLUMN IF NOT EXISTS collection varchar NOT NULL DEFAULT 'default';
+
+-- Cùng một URL được phép nằm trong nhiều collection
+DROP INDEX IF EXISTS ix_documents_url;
+ALTER TABLE documents DROP CONSTRAINT IF EXISTS documents_url_key;
+CREATE INDEX IF NOT EXISTS ix_documents_url ON documents (url);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_documents_collection_url ON documents (collection, url);
+
+-- Fingerprint dedup khi ingest được đọc theo (collection, domain)
+CREATE INDEX IF NOT EXISTS ix_documents_collection_domain ON documents (collection, domain);
+CREATE INDEX IF NOT EXISTS ix_chunks_collection_domain ON chunks (collection, domain);
+
+COMMIT;
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+# Settings bắt buộc khi import app.*; không kết nối tới database hay Gemini trong unit test
+os.environ.setdefault("DATABASE_URL", "postgresql+psycopg2://test@localhost/test")
+os.environ.setdefault("GOOGLE_API_KEY", "test")
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="rag-test-logs-"))
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from app.services.admission import AdmissionController, MemoryBucketStore, RouteClass
+
+def _classes(interactive_concurrency: int = 4, batch_concurrency: int = 4):
+    return {
+        "interactive": RouteClass("interactive", 0, interactive_concurrency, 60.0, 2),
+        "admin": RouteClass("admin", 1, 2, 60.0, 2),
+        "batch": RouteClass("batch", 2, batch_concurrency, 60.0, 2),
+        "ingest": RouteClass("ingest", 3, 1, 60.0, 2),
+    }
+
+def _controller(capacity: int = 2, interactive_reserved: int = 1, max_queue: int = 8,
+                queue_timeout: float = 1.0, api_keys=None) -> AdmissionController:
+    return AdmissionController(_classes(), capacity, interactive_reserved, max_queue, queue_timeout,
+                               MemoryBucketStore(), api_keys=api_keys)
+
+def test_memory_bucket_allows_burst_then_waits():
+    store = MemoryBucketStore()
+
+    assert [store.take("chat:ip:1", rate=1.0, burst=2) for _ in range(2)] == [0.0, 0.0]
+    assert store.take("chat:ip:1", rate=1.0, burst=2) == pytest.approx(1.0, abs=0.05)
+    # Bucket khác không bị ảnh hưởng
+    assert store.take("chat:ip:2", rate=1.0, burst=2) == 0.0
+
+def test_memory_bucket_evicts_least_recently_used():
+    store = MemoryBucketStore(max_keys=2)
+    store.take("a", rate=0.0, burst=1)
+    store.take("b", rate=0.0, burst=1)
+    store.take("c", rate=0.0, burst=1)
+
+    # "a" đã bị loại nên được bucket đầy mới
+    assert store.take("a", rate=0.0, burst=1) == 0.0
+    assert store.take("c", rate=0.0, burst=1) > 0
+
+def test_classify():
+    controller = _controller()
+
+    assert controller.classify("POST", "/api/v1/chat/message").name == "interactive"
+    assert controller.classify("POST", "/api/v1/search/batch").name == "batch"
+    assert controller.classify("POST", "/api/v1/scraping/crawls/abc/resume").name == "ingest"
+    assert controller.classify("GET", "/api/v1/admin/stats").name == "admin"
+    assert controller.classify("GET", "/api/v1/chat/message") is None
+    assert controller.classify("GET", "/health") is None
+
+def test_client_key_only_trusts_configured_api_keys():
+    controller = _controller(api_keys=["secret"])
+
+    key = controller.client_key({"x-api-key": "secret"}, "10.0.0.1")
+    assert key.startswith("key:") and "secret" not in key
+    assert controller.client_key({"x-api-key": "random"}, "10.0.0.1") == "ip:10.0.0.1"
+    assert controller.client_key({}, None) == "ip:unknown"
+
+def test_acquire_dispatches_waiters_by_priority():
+    async def scenario():
+        controller = _controller(capacity=2, interactive_reserved=0)
+        interactive, batch = controller.classes["interactive"], controller.classes["batch"]
+
+        assert await controller.acquire(batch) is None
+        assert await controller.acquire(batch) is None
+
+        order = []
+
+        async def wait(route_class):
+            assert await controller.acquire(route_class) is None
+            order.append(route_class.name)
+
+        waiters = [asyncio.create_task(wait(batch)), asyncio.create_task(wait(interactive))]
+        await asyncio.sleep(0)
+        assert controller.get_stats()["classes"]["batch"]["waiting"] == 1
+
+        controller.release(batch)
+        await asyncio.sleep(0)
+        controller.release(batch)
+        await asyncio.gather(*waiters)
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "batch"]
+
+def test_reserved_slots_only_for_interactive():
+    async def scenario():
+        controller = _controller(capacity=2, interactive_reserved=1, queue_timeout=0.01)
+        interactive, batch = controller.classes["interactive"], controller.classes["batch"]
+
+        assert await controller.acquire(batch) is None
+        assert await controller.acquire(batch) == "queue_timeout"
+        assert await controller.acquire(interactive) is None
+        return controller.get_stats()
+
+    stats = asyncio.run(scenario())
+    assert stats["in_flight"] == 2
+    assert stats["classes"]["batch"]["queue_timeouts"] == 1
+    assert stats["classes"]["batch"]["waiting"] == 0
+
+def test_queue_full_rejects_immediately():
+    async def scenario():
+        controller = _controller(capacity=1, interactive_reserved=0, max_queue=1)
+        batch = controller.classes["batch"]
+
+        assert await controller.acquire(batch) is None
+        waiter = asyncio.create_task(controller.acquire(batch))
+        await asyncio.sleep(0)
+        rejected = await controller.acquire(batch)
+
+        controller.release(batch)
+        return rejected, await waiter
+
+    assert asyncio.run(scenario()) == ("queue_full", None)
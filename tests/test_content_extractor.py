@@ -0,0 +1,44 @@
+from bs4 import BeautifulSoup
+
+from app.services.content_extractor import ContentExtractor
+
+def _extract(html: str):
+    return ContentExtractor().extract(BeautifulSoup(html, "html.parser"))
+
+def test_article_header_keeps_title():
+    blocks = _extract("""
+        <html><body>
+          <header><a href="/">VPBank</a> <h1>Trang chủ</h1></header>
+          <main><article>
+            <header><h1>Biểu phí thẻ tín dụng VPBank</h1></header>
+            <h2>Phí thường niên</h2>
+            <p>Miễn phí năm đầu cho chủ thẻ mới.</p>
+          </article></main>
+        </body></html>
+    """)
+
+    assert [(block.kind, block.text) for block in blocks] == [
+        ("heading", "Biểu phí thẻ tín dụng VPBank"),
+        ("heading", "Phí thường niên"),
+        ("paragraph", "Miễn phí năm đầu cho chủ thẻ mới."),
+    ]
+
+def test_page_header_is_removed_without_main():
+    blocks = _extract("""
+        <html><body>
+          <header><div>Đăng nhập</div></header>
+          <section><header><h2>Lãi suất</h2></header><p>Kỳ hạn 12 tháng: 5%.</p></section>
+        </body></html>
+    """)
+
+    assert [block.text for block in blocks] == ["Lãi suất", "Kỳ hạn 12 tháng: 5%."]
+
+def test_boilerplate_markers_match_whole_tokens():
+    blocks = _extract("""
+        <html><body><main>
+          <div class="cookie-banner">Chúng tôi dùng cookie.</div>
+          <div class="shareholder-info"><p>Thông tin cổ đông.</p></div>
+        </main></body></html>
+    """)
+
+    assert [block.text for block in blocks] == ["Thông tin cổ đông."]
@@ -0,0 +1,33 @@
+import time
+
+from app.services.conversation import ConversationState, ConversationStore, QueryCondenser
+
+def test_store_evicts_least_recently_used():
+    store = ConversationStore(max_conversations=2, ttl_seconds=3600)
+    store.get("a")
+    store.get("b")
+    store.get("a")
+    store.get("c")
+
+    assert store.peek("b") is None
+    assert store.peek("a") is not None
+    assert len(store) == 2
+
+def test_store_expires_idle_conversations():
+    store = ConversationStore(max_conversations=10, ttl_seconds=60)
+    state = store.get("a")
+    state.turns.append({"user": "xin chào", "assistant": "chào bạn"})
+    state.last_used = time.monotonic() - 120
+
+    assert store.peek("a") is None
+    assert store.get("a").turns == []
+
+def test_condensed_keeps_only_latest_key():
+    condenser = QueryCondenser()
+    state = ConversationState(turns=[{"user": "Thẻ tín dụng VPBank", "assistant": "..."}])
+
+    for i in range(5):
+        state.last_query = f"Thẻ tín dụng số {i}"
+        assert condenser.condense("phí của nó?", state) == f"Thẻ tín dụng số {i} phí của nó?"
+
+    assert list(state.condensed) == [("Thẻ tín dụng số 4", "phí của nó?")]
@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.config import settings
+from app.services.crawl_frontier import DEFAULT_SITEMAP_PRIORITY, BloomFilter, CrawlFrontier, url_hash
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [url_hash(f"https://example.com/page/{i}") for i in range(1000)]
+    for key in keys:
+        bloom.add(key)
+
+    assert all(key in bloom for key in keys)
+    assert bloom.count == 1000
+
+def test_bloom_filter_false_positive_rate_near_target():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(url_hash(f"https://example.com/page/{i}"))
+
+    false_positives = sum(url_hash(f"https://example.com/other/{i}") in bloom for i in range(10000))
+    assert false_positives / 10000 < 0.03
+
+def test_score_prefers_shallow_pages():
+    assert CrawlFrontier.score(0) == pytest.approx(DEFAULT_SITEMAP_PRIORITY)
+    assert CrawlFrontier.score(2) == pytest.approx(DEFAULT_SITEMAP_PRIORITY - 2 * settings.crawl_depth_penalty)
+    assert CrawlFrontier.score(1, sitemap_priority=0.9) > CrawlFrontier.score(1)
+
+def test_score_freshness_halves_per_half_life():
+    now = datetime.utcnow()
+    half_life = timedelta(days=settings.crawl_freshness_half_life_days)
+
+    assert CrawlFrontier.score(0, 0.5, now) == pytest.approx(1.5, abs=1e-3)
+    assert CrawlFrontier.score(0, 0.5, now - half_life) == pytest.approx(1.0, abs=1e-3)
+    # lastmod trong tương lai không được cộng quá 1
+    assert CrawlFrontier.score(0, 0.5, now + half_life) == pytest.approx(1.5, abs=1e-3)
+
+def test_frontier_pops_by_priority_and_skips_seen():
+    frontier = CrawlFrontier(capacity=100, error_rate=0.01)
+
+    assert frontier.push("https://example.com/deep", depth=3)
+    assert frontier.push("https://example.com/important", depth=1, sitemap_priority=1.0)
+    assert frontier.push("https://example.com/shallow", depth=1)
+    assert not frontier.push("https://example.com/shallow", depth=0)
+    assert not frontier.mark_seen("https://example.com/deep")
+
+    assert [frontier.pop() for _ in range(4)] == [
+        ("https://example.com/important", 1),
+        ("https://example.com/shallow", 1),
+        ("https://example.com/deep", 3),
+        None,
+    ]
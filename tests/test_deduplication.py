@@ -0,0 +1,77 @@
+from app.services.deduplication import (
+    NearDuplicateDetector,
+    SimHashIndex,
+    canonicalize_url,
+    hamming_distance,
+    simhash,
+    to_signed,
+    to_unsigned,
+)
+
+TEXT = (
+    "Thẻ tín dụng VPBank cho phép khách hàng chi tiêu trước trả tiền sau, "
+    "miễn lãi tới 55 ngày và hoàn tiền khi thanh toán trực tuyến."
+)
+
+def test_canonicalize_url_drops_fragment_tracking_and_default_port():
+    assert canonicalize_url("HTTPS://Example.com:443/the-tin-dung/?utm_source=fb&b=2&a=1#top") == \
+        "https://example.com/the-tin-dung?a=1&b=2"
+
+def test_canonicalize_url_normalizes_path():
+    assert canonicalize_url("http://example.com//a/./b/../index.html") == "http://example.com/a"
+    assert canonicalize_url("http://example.com") == "http://example.com/"
+    assert canonicalize_url("http://example.com:8080/") == "http://example.com:8080/"
+
+def test_simhash_is_stable_and_close_for_small_edits():
+    assert simhash(TEXT) == simhash(TEXT.upper())
+    assert hamming_distance(simhash(TEXT), simhash(TEXT + " Áp dụng từ 2024.")) <= 16
+    assert hamming_distance(simhash(TEXT), simhash("Lãi suất tiết kiệm kỳ hạn 12 tháng")) > 3
+
+def test_signed_round_trip():
+    for fingerprint in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed(fingerprint)
+        assert -(1 << 63) <= signed < 1 << 63
+        assert to_unsigned(signed) == fingerprint
+
+def test_simhash_index_finds_within_distance():
+    index = SimHashIndex(max_distance=3)
+    fingerprint = simhash(TEXT)
+    index.add(fingerprint)
+
+    assert index.find(fingerprint ^ 0b111) == fingerprint
+    # Các bit lệch nằm ở nhiều band khác nhau
+    assert index.find(fingerprint ^ (1 | 1 << 20 | 1 << 40)) == fingerprint
+    assert index.find(fingerprint ^ 0b1111) is None
+    assert index.size == 1
+
+def test_check_page_does_not_register_until_saved():
+    detector = NearDuplicateDetector()
+
+    duplicate, fingerprint = detector.check_page(TEXT)
+    assert not duplicate
+    # Trang chưa được lưu (ví dụ lỗi khi commit) không chặn lần thử lại
+    assert detector.check_page(TEXT) == (False, fingerprint)
+
+    detector.register(fingerprint)
+    assert detector.check_page(TEXT) == (True, fingerprint)
+    assert detector.report.pages_duplicate == 1
+
+def test_filter_chunks_skips_duplicates_within_page_and_registered():
+    other = "Lãi suất tiết kiệm kỳ hạn 12 tháng được niêm yết tại quầy giao dịch."
+    detector = NearDuplicateDetector()
+
+    kept, fingerprints = detector.filter_chunks([TEXT, TEXT, other])
+    assert kept == [0, 2]
+    assert fingerprints == [simhash(TEXT), simhash(other)]
+
+    # Chưa register thì lần sau vẫn giữ lại
+    assert detector.filter_chunks([TEXT])[0] == [0]
+
+    detector.register(None, fingerprints)
+    assert detector.filter_chunks([TEXT, other]) == ([], [])
+    assert detector.report.chunks_duplicate == 3
+
+def test_detector_loads_signed_fingerprints_from_database():
+    fingerprint = simhash(TEXT) | 1 << 63
+    detector = NearDuplicateDetector(page_fingerprints=[to_signed(fingerprint)])
+    assert detector.pages.find(fingerprint) == fingerprint
@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from app.models.schemas import SearchResult
+from app.services.evaluation import (
+    EvalCase,
+    RetrievalConfig,
+    RetrievalEvaluator,
+    _matched_labels,
+    ndcg_at_k,
+    recall_at_k,
+    reciprocal_rank,
+)
+
+def _hit(url: str, chunk_index: int) -> SearchResult:
+    return SearchResult(content="", similarity=0.9, document_url=url, document_title="", chunk_index=chunk_index)
+
+def test_matched_labels_counts_each_label_once():
+    case = EvalCase(
+        question="Phí thường niên thẻ tín dụng?",
+        relevant_urls=["https://example.com/bieu-phi/?utm_source=mail"],
+        relevant_chunks=[{"url": "https://example.com/the-tin-dung", "chunk_index": 2}],
+    )
+    hits = [
+        _hit("https://example.com/khac", 0),
+        _hit("https://example.com/bieu-phi", 0),
+        _hit("https://example.com/bieu-phi", 1),
+        _hit("https://example.com/the-tin-dung", 1),
+        _hit("https://example.com/the-tin-dung#phi", 2),
+    ]
+
+    assert _matched_labels(hits, case.labels()) == [
+        None,
+        ("url", "https://example.com/bieu-phi"),
+        None,
+        None,
+        ("chunk", "https://example.com/the-tin-dung", 2),
+    ]
+
+def test_metrics():
+    matched = [None, ("url", "a"), None, ("url", "b")]
+
+    assert recall_at_k(matched, total=2, k=2) == 0.5
+    assert recall_at_k(matched, total=2, k=4) == 1.0
+    assert recall_at_k([], total=0, k=10) == 0.0
+    assert reciprocal_rank(matched) == 0.5
+    assert reciprocal_rank([None, None]) == 0.0
+    assert ndcg_at_k([("url", "a"), ("url", "b")], total=2, k=10) == pytest.approx(1.0)
+    assert ndcg_at_k(matched, total=2, k=4) == pytest.approx((1 / 1.585 + 1 / 2.3219) / (1 + 1 / 1.585), abs=1e-3)
+    assert ndcg_at_k(matched, total=0, k=4) == 0.0
+
+class _FakeEvaluator(RetrievalEvaluator):
+    """Không chạm database: chỉ ghi lại việc đo latency có chồng lên nhau không"""
+
+    def __init__(self, cases):
+        super().__init__(cases, k=2)
+        self._running = 0
+        self._lock = threading.Lock()
+        self.max_concurrent_latency = 0
+
+    def _embed_questions(self, configs):
+        return {}
+
+    def _evaluate(self, config, embeddings):
+        return {"recall@2": 1.0, "mrr": 1.0, "ndcg@2": 1.0, "avg_prompt_tokens": float(config.max_results)}
+
+    def _measure_latency(self, config, embeddings):
+        with self._lock:
+            self._running += 1
+            self.max_concurrent_latency = max(self.max_concurrent_latency, self._running)
+        time.sleep(0.01)
+        with self._lock:
+            self._running -= 1
+        return [float(config.max_results)] * 3
+
+def test_run_measures_latency_one_config_at_a_time():
+    evaluator = _FakeEvaluator([EvalCase(question="q")])
+    configs = [RetrievalConfig(name=f"c{i}", max_results=i + 1) for i in range(4)]
+
+    reports = evaluator.run(configs, parallel=4)
+
+    assert evaluator.max_concurrent_latency == 1
+    assert [report["p95_ms"] for report in reports] == [1.0, 2.0, 3.0, 4.0]
+    assert "delta" not in reports[0]
+    assert reports[3]["delta"]["p95_ms"] == 3.0
@@ -0,0 +1,92 @@
+import numpy as np
+
+from app.config import settings
+from app.services.faq import FaqIndex, _unit
+
+def _index(centroids, thresholds, version: str = "v1") -> FaqIndex:
+    index = FaqIndex()
+    index._version = version
+    index._centroids = _unit(np.asarray(centroids, dtype=np.float32))
+    index._thresholds = np.asarray(thresholds, dtype=np.float32)
+    index._entries = [
+        {"id": str(i), "question": f"Câu hỏi {i}", "answer": f"Trả lời {i}", "sources": []}
+        for i in range(len(centroids))
+    ]
+    return index
+
+def test_lookup_returns_nearest_centroid_above_threshold():
+    index = _index([[1, 0, 0], [0, 1, 0]], [0.9, 0.9])
+
+    match = index.lookup([0.1, 2.0, 0.0], "v1")
+
+    assert match.id == "1"
+    assert match.answer == "Trả lời 1"
+    assert match.similarity > 0.99
+
+def test_lookup_uses_threshold_of_nearest_cluster():
+    index = _index([[1, 0, 0], [0, 1, 0]], [0.99, 0.5])
+
+    assert index.lookup([1.0, 0.3, 0.0], "v1") is None
+    assert index.lookup([0.3, 1.0, 0.0], "v1").id == "1"
+
+def test_lookup_ignores_other_version_dimension_and_empty_index():
+    index = _index([[1, 0, 0]], [0.5])
+
+    assert index.lookup([1.0, 0.0, 0.0], "v2") is None
+    assert index.lookup([1.0, 0.0], "v1") is None
+    assert FaqIndex().lookup([1.0, 0.0, 0.0], "v1") is None
+
+class _Result:
+    def __init__(self, value):
+        self.value = value
+
+    def first(self):
+        return self.value
+
+    def scalar(self):
+        return self.value
+
+class _Session:
+    """Trả lời hai câu truy vấn của FaqIndex.check: chữ ký faq_entries và bộ đếm documents"""
+
+    def __init__(self, state):
+        self.state = state
+
+    def execute(self, statement):
+        if "faq_entries" in str(statement):
+            return _Result((1, None, None, None))
+        return _Result(self.state["corpus"])
+
+    def close(self):
+        pass
+
+class _CheckedIndex(FaqIndex):
+    def __init__(self):
+        super().__init__()
+        self.refreshes = 0
+
+    def load(self, db):
+        pass
+
+    def refresh(self, session_factory, progress=None):
+        self.refreshes += 1
+
+def test_check_waits_for_corpus_to_settle(monkeypatch):
+    state = {"corpus": 10}
+    index = _CheckedIndex()
+    session_factory = lambda: _Session(state)
+    monkeypatch.setattr(settings, "faq_corpus_quiet_seconds", 3600.0)
+
+    index.check(session_factory)
+    state["corpus"] = 20
+    index.check(session_factory)
+    # documents vừa đổi: chưa làm mới cho tới khi đứng yên đủ lâu
+    assert index.refreshes == 0
+
+    monkeypatch.setattr(settings, "faq_corpus_quiet_seconds", 0.0)
+    index.check(session_factory)
+    assert index.refreshes == 1
+
+    # Không có thay đổi mới thì không làm mới lại
+    index.check(session_factory)
+    assert index.refreshes == 1
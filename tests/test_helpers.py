@@ -0,0 +1,27 @@
+from datetime import datetime
+from uuid import uuid4
+
+import pytest
+
+from app.utils.helpers import decode_cursor, encode_cursor, ingest_epoch, next_epoch
+
+def test_cursor_round_trip():
+    created_at = datetime(2024, 5, 17, 8, 30, 15, 123456)
+    document_id = uuid4()
+
+    cursor = encode_cursor(created_at, document_id)
+
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, document_id)
+
+@pytest.mark.parametrize("cursor", ["", "not-base64!", encode_cursor(datetime(2024, 1, 1), uuid4())[:-4]])
+def test_decode_cursor_rejects_invalid(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+def test_ingest_epoch_is_year_month():
+    assert ingest_epoch(datetime(2024, 3, 31, 23, 59)) == 202403
+
+@pytest.mark.parametrize("epoch, expected", [(202401, 202402), (202411, 202412), (202412, 202501)])
+def test_next_epoch(epoch, expected):
+    assert next_epoch(epoch) == expected
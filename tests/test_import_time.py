@@ -0,0 +1,13 @@
+from app.config import settings
+from benchmarks.import_time import TARGET, measure
+
+def test_import_time_under_budget():
+    # Lần nhanh nhất trong 3 lần để bớt nhiễu của máy CI
+    best = min((measure() for _ in range(3)), key=lambda timings: timings[TARGET])
+    total_ms = best[TARGET] / 1000
+
+    assert total_ms <= settings.import_time_budget_ms, \
+        f"import {TARGET} took {total_ms:.1f} ms, budget {settings.import_time_budget_ms:.0f} ms"
+
+def test_heavy_modules_not_imported_at_startup():
+    assert measure()["__loaded__"] == ""
@@ -0,0 +1,33 @@
+from app.config import settings
+from app.models.schemas import SearchResult
+from app.services import prompts
+from app.services.llm_gateway import LLMGateway
+
+SOURCE = SearchResult(
+    content="Thẻ có hạn mức 50 triệu. Miễn phí năm đầu. Hoàn tiền 5%.",
+    similarity=0.9, document_url="https://example.com/the", document_title="Thẻ tín dụng"
+)
+
+def _tenant(tmp_path, name, files):
+    tenant_dir = tmp_path / name
+    tenant_dir.mkdir()
+    (tenant_dir / "system.txt").write_text("system", encoding="utf-8")
+    (tenant_dir / "turn.txt").write_text("$history $context $question", encoding="utf-8")
+    for filename, content in files.items():
+        (tenant_dir / filename).write_text(content, encoding="utf-8")
+
+def test_extractive_answer_uses_tenant_fallback(tmp_path, monkeypatch):
+    _tenant(tmp_path, "cards", {"fallback.txt": "Cards:\n$sources\n", "unavailable.txt": "Cards busy\n"})
+    _tenant(tmp_path, "plain", {})
+    monkeypatch.setattr(settings, "prompt_template_dir", str(tmp_path))
+    monkeypatch.setattr(prompts, "_templates", {})
+    gateway = LLMGateway([])
+
+    assert gateway.generate("prompt", [SOURCE], tenant="cards").text == \
+        "Cards:\n- Thẻ tín dụng: Thẻ có hạn mức 50 triệu. Miễn phí năm đầu. (https://example.com/the)"
+    assert gateway.generate("prompt", [], tenant="cards").text == "Cards busy"
+
+    # Tenant không có file riêng dùng text mặc định, không mang thương hiệu của tenant khác
+    unavailable = gateway.generate("prompt", [], tenant="plain").text
+    assert unavailable == prompts.DEFAULT_UNAVAILABLE
+    assert "vpbank" not in unavailable.lower()
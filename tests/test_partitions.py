@@ -0,0 +1,24 @@
+from app.services import partitions
+from app.services.partitions import ChunkPartitionManager, partition_name
+
+def test_partition_name():
+    assert partition_name(0) == "chunks_p_legacy"
+    assert partition_name(202405) == "chunks_p202405"
+
+def test_ensure_is_noop_on_unpartitioned_chunks(monkeypatch):
+    manager = ChunkPartitionManager()
+    checks = []
+
+    def is_partitioned():
+        checks.append(True)
+        return False
+
+    def connect():
+        raise AssertionError("ensure() must not run DDL on an unpartitioned chunks table")
+
+    monkeypatch.setattr(manager, "is_partitioned", is_partitioned)
+    monkeypatch.setattr(partitions.engine, "connect", connect)
+
+    manager.ensure(202405)
+    manager.ensure(202406)
+    assert checks == [True]
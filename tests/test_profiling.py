@@ -0,0 +1,67 @@
+import threading
+
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.services.profiling import ProfiledRoute, SamplingProfiler, profile_session_var
+
+def _profiled_app(seen: list) -> FastAPI:
+    router = APIRouter(prefix="/items", route_class=ProfiledRoute)
+
+    @router.get("/sync")
+    def sync_endpoint():
+        session = profile_session_var.get()
+        seen.append(threading.get_ident() in session.attached_threads())
+        return {"ok": True}
+
+    @router.get("/async")
+    async def async_endpoint():
+        session = profile_session_var.get()
+        seen.append(threading.get_ident() in session.attached_threads())
+        return {"ok": True}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    return app
+
+def test_included_router_endpoints_attach_their_thread(tmp_path):
+    from app.api.middleware import ProfilingMiddleware
+
+    profiler = SamplingProfiler()
+    profiler.enabled = True
+    profiler.capture_dir = str(tmp_path)
+    seen = []
+    app = _profiled_app(seen)
+    app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
+    client = TestClient(app)
+    assert client.get("/api/items/sync").status_code == 200
+    assert client.get("/api/items/async").status_code == 200
+    assert seen == [True, True]
+
+def test_endpoint_is_wrapped_once():
+    router = APIRouter(route_class=ProfiledRoute)
+
+    @router.get("/")
+    def endpoint():
+        return {}
+
+    route = router.routes[0]
+    ProfiledRoute(route.path, route.endpoint, methods=["GET"])
+    assert route.endpoint.__wrapped__ is endpoint
+
+def test_capture_written_after_sampler_restart(tmp_path):
+    profiler = SamplingProfiler()
+    profiler.enabled = True
+    profiler.sample_rate = 1.0
+    profiler.capture_dir = str(tmp_path)
+
+    profiler.start_sampler()
+    profiler.stop_sampler()
+    profiler.start_sampler()
+
+    session = profiler.start("GET", "/api/v1/search/semantic")
+    profiler.finish(session, 200)
+    profiler.stop_sampler()
+
+    assert [capture["id"] for capture in profiler.list_captures()] == [session.id]
@@ -0,0 +1,61 @@
+import gzip
+import json
+
+import pytest
+
+from app.services import snapshot
+from app.services.snapshot import SnapshotImporter, _CsvStream
+
+def test_csv_stream_renders_rows_lazily():
+    stream = _CsvStream(iter([["a", "b,c"], ["\\N", "d"]]))
+
+    first = stream.read(3)
+    assert stream.rows == 1
+    assert first + stream.read() == 'a,"b,c"\r\n\\N,d\r\n'
+    assert stream.rows == 2
+    assert stream.read(10) == ""
+
+class _Connection:
+    def __init__(self, names):
+        self.names = names
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, statement):
+        names = self.names
+
+        class _Result:
+            def scalars(self):
+                return self
+
+            def all(self):
+                return names
+
+        return _Result()
+
+def _snapshot(tmp_path, manifest_extra, collections_used):
+    name = "documents-00000.jsonl.gz"
+    with gzip.open(tmp_path / name, "wt", encoding="utf-8") as f:
+        for collection in collections_used:
+            f.write(json.dumps({"id": collection, "collection": collection}) + "\n")
+    manifest = {"embedding_dimension": 768, "files": [{"name": name, "kind": "documents", "shard": 0}]}
+    manifest.update(manifest_extra)
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    return SnapshotImporter(tmp_path)
+
+def test_format_3_import_refuses_missing_collections(tmp_path, monkeypatch):
+    importer = _snapshot(tmp_path, {"format": 3}, ["default", "cards", "loans"])
+    monkeypatch.setattr(snapshot.engine, "connect", lambda: _Connection(["cards"]))
+
+    with pytest.raises(ValueError, match="loans"):
+        importer._restore_collections()
+
+def test_format_3_import_allows_known_collections(tmp_path, monkeypatch):
+    importer = _snapshot(tmp_path, {"format": 3}, ["default", "cards"])
+    monkeypatch.setattr(snapshot.engine, "connect", lambda: _Connection(["cards"]))
+
+    importer._restore_collections()
@@ -0,0 +1,73 @@
+from app.services.content_extractor import ContentBlock
+from app.services.text_processor import SemanticTextProcessor
+
+def _heading(text: str, level: int) -> ContentBlock:
+    return ContentBlock("heading", text, level)
+
+def test_split_sections_follows_heading_tree():
+    processor = SemanticTextProcessor()
+    blocks = [
+        ContentBlock("paragraph", "Giới thiệu"),
+        _heading("Thẻ tín dụng", 1),
+        _heading("Biểu phí", 2),
+        ContentBlock("paragraph", "Phí thường niên"),
+        _heading("Ưu đãi", 2),
+        ContentBlock("list_item", "Hoàn tiền 6%"),
+        _heading("Trống", 3),
+        _heading("Tiết kiệm", 1),
+        ContentBlock("paragraph", "Lãi suất"),
+    ]
+
+    sections = processor._split_sections(blocks)
+
+    assert [path for path, _ in sections] == [
+        [],
+        ["Thẻ tín dụng", "Biểu phí"],
+        ["Thẻ tín dụng", "Ưu đãi"],
+        ["Tiết kiệm"],
+    ]
+    assert [[block.text for block in section] for _, section in sections] == [
+        ["Giới thiệu"], ["Phí thường niên"], ["Hoàn tiền 6%"], ["Lãi suất"]
+    ]
+
+def test_pack_section_keeps_blocks_whole_within_budget():
+    processor = SemanticTextProcessor()
+    blocks = [ContentBlock("list_item", f"Mục số {i}") for i in range(10)]
+
+    chunks = processor._pack_section(blocks, budget=40)
+
+    assert all(len(chunk) <= 40 for chunk in chunks)
+    assert "\n".join(chunks).split("\n") == [f"- Mục số {i}" for i in range(10)]
+
+def test_pack_section_repeats_table_header():
+    processor = SemanticTextProcessor()
+    header = "Kỳ hạn | Lãi suất"
+    blocks = [ContentBlock("table_row", header)] + [
+        ContentBlock("table_row", f"{months} tháng | {months / 10:.1f}%") for months in range(1, 13)
+    ]
+
+    chunks = processor._pack_section(blocks, budget=60)
+
+    assert len(chunks) > 1
+    assert all(chunk.split("\n")[0] == header for chunk in chunks)
+    rows = [line for chunk in chunks for line in chunk.split("\n") if line != header]
+    assert rows == [block.text for block in blocks[1:]]
+
+def test_pack_section_splits_oversized_block():
+    processor = SemanticTextProcessor(chunk_size=50, chunk_overlap=0)
+    text = " ".join(["ưu đãi"] * 40)
+
+    chunks = processor._pack_section([ContentBlock("paragraph", text)], budget=50)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 50 for chunk in chunks)
+
+def test_structured_chunking_prefixes_heading_path():
+    processor = SemanticTextProcessor(chunk_size=200, chunk_overlap=0)
+    blocks = [_heading("Thẻ", 1), _heading("Phí", 2), ContentBlock("paragraph", "Miễn phí năm đầu")]
+
+    [document] = processor.structured_chunking(blocks, {"url": "https://example.com"})
+
+    assert document.page_content == "Thẻ > Phí\nMiễn phí năm đầu"
+    assert document.metadata["heading_path"] == "Thẻ > Phí"
+    assert document.metadata["url"] == "https://example.com"
@@ -0,0 +1,25 @@
+from app.services.vector_store import PgVectorStore
+
+CONTENT = "Thẻ tín dụng. Phí thường niên 499.000đ. Miễn phí năm đầu. Phí thường niên 499.000đ."
+
+def test_locate_chunks_finds_spans_in_order():
+    chunks = ["Thẻ tín dụng.", "Phí thường niên 499.000đ.", "Miễn phí năm đầu.", "Phí thường niên 499.000đ."]
+
+    spans = PgVectorStore._locate_chunks(CONTENT, chunks)
+
+    assert [CONTENT[start:end] for start, end in spans] == chunks
+    # Chunk lặp lại lấy lần xuất hiện sau chunk trước, không quay về lần đầu
+    assert spans[3][0] > spans[2][0]
+
+def test_locate_chunks_handles_overlap():
+    chunks = [CONTENT[:40], CONTENT[30:70]]
+
+    assert PgVectorStore._locate_chunks(CONTENT, chunks) == [(0, 40), (30, 70)]
+
+def test_locate_chunks_marks_rewritten_chunks_inline():
+    chunks = ["Thẻ > Phí\nPhí thường niên 499.000đ.", "", "Miễn phí năm đầu."]
+
+    spans = PgVectorStore._locate_chunks(CONTENT, chunks)
+
+    assert spans[:2] == [None, None]
+    assert CONTENT[spans[2][0]:spans[2][1]] == "Miễn phí năm đầu."